@@ -48,4 +48,19 @@ export const getShifts = async (): Promise<Shift[]> => {
 
   const data = await response.json();
   return data.results || data;
-};
\ No newline at end of file
+};
+// EventSource cannot send the Authorization header, so the stream is opened
+// with a short-lived ticket. When the ticket has expired the browser's own
+// reconnect is refused; call this again for a new ticket and stream.
+export const openEventStream = async (locations: string[] = []): Promise<EventSource> => {
+  const response = await fetchWithAuth(`${API_URL}/api/events/ticket/`, { method: 'POST' });
+
+  if (!response.ok) {
+    throw new Error('Failed to get an event stream ticket');
+  }
+
+  const { ticket } = await response.json();
+  const params = new URLSearchParams({ ticket });
+  locations.forEach((location) => params.append('location', location));
+  return new EventSource(`${API_URL}/api/events/?${params}`);
+};
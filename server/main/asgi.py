@@ -2,15 +2,25 @@
 ASGI config for server project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with ``uvicorn main.asgi:application``; the async views, including the
+``/api/events/`` change stream, only stream under ASGI. It refuses to start
+several worker processes (``WEB_CONCURRENCY``) while caches or the event
+broker are process-local; see ``schedulingDB/checks.py``.
 
 For more information on this file, see
-https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
+https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 
 import os
 
+from django.core import checks
 from django.core.asgi import get_asgi_application
+from django.core.management.base import SystemCheckError
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "main.settings")
 
 application = get_asgi_application()
+
+errors = [error for error in checks.run_checks(tags=["workers"]) if error.is_serious()]
+if errors:
+    raise SystemCheckError("\n".join(str(error) for error in errors))
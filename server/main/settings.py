@@ -52,6 +52,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "corsheaders",
     "rest_framework",
     "django_filters",
@@ -60,12 +61,20 @@ INSTALLED_APPS = [
 
 AUTH_USER_MODEL = 'schedulingDB.User'
 
+# Trust the id and role claims of access tokens instead of loading the
+# user on every request; see schedulingDB/authentication.py.
+AUTH_TRUST_JWT_CLAIMS = config("AUTH_TRUST_JWT_CLAIMS", default=True, cast=bool)
+# Seconds a User row loaded for a claims-authenticated request stays cached.
+AUTH_USER_CACHE_TIMEOUT = config("AUTH_USER_CACHE_TIMEOUT", default=60, cast=int)
+# Basic auth hashes the password on every request; turn it off in production.
+AUTH_ALLOW_BASIC = config("AUTH_ALLOW_BASIC", default=True, cast=bool)
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'schedulingDB.authentication.ClaimsJWTAuthentication' if AUTH_TRUST_JWT_CLAIMS
+        else 'rest_framework_simplejwt.authentication.JWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
-    ],
+    ] + (['rest_framework.authentication.BasicAuthentication'] if AUTH_ALLOW_BASIC else []),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
@@ -100,9 +109,42 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 
     'JTI_CLAIM': 'jti',
+
+    # Add the role claim that ClaimsJWTAuthentication trusts to access tokens.
+    'TOKEN_OBTAIN_SERIALIZER': 'schedulingDB.authentication.ScheduleTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'schedulingDB.authentication.ScheduleTokenRefreshSerializer',
 }
 
+# Incremental sync (schedulingDB/sync.py): how far each token reaches back to allow
+# for clock skew between app servers and the database, and how long deletes are remembered.
+SYNC_OVERLAP_SECONDS = config("SYNC_OVERLAP_SECONDS", default=5, cast=int)
+SYNC_TOMBSTONE_DAYS = config("SYNC_TOMBSTONE_DAYS", default=30, cast=int)
+# Changed rows per sync response; the client asks again while "more" is true.
+SYNC_PAGE_SIZE = config("SYNC_PAGE_SIZE", default=1000, cast=int)
+
+# Days finished background jobs (schedulingDB/jobs.py) are kept; their payloads
+# can hold password reset links.
+JOBS_RETENTION_DAYS = config("JOBS_RETENTION_DAYS", default=7, cast=int)
+
+# Change events pushed over /api/events/ (schedulingDB/events.py). Replace the
+# in-process broker with a shared one to run more than one server process.
+EVENTS_BROKER = config("EVENTS_BROKER", default="schedulingDB.events.InProcessBroker")
+EVENTS_QUEUE_SIZE = config("EVENTS_QUEUE_SIZE", default=1000, cast=int)
+EVENTS_KEEPALIVE_SECONDS = config("EVENTS_KEEPALIVE_SECONDS", default=15, cast=float)
+EVENTS_STREAM_SECONDS = config("EVENTS_STREAM_SECONDS", default=300, cast=float)
+EVENTS_RETRY_MS = config("EVENTS_RETRY_MS", default=3000, cast=int)
+# Lifetime of the ?ticket= tokens that let a browser EventSource open a stream.
+EVENTS_TICKET_SECONDS = config("EVENTS_TICKET_SECONDS", default=30, cast=int)
+
+# Request timing and SQL instrumentation (schedulingDB/metrics.py), reported at /api/_metrics/.
+METRICS_ENABLED = config("METRICS_ENABLED", default=False, cast=bool)
+METRICS_WINDOW = config("METRICS_WINDOW", default=1000, cast=int)
+METRICS_SLOW_MS = config("METRICS_SLOW_MS", default=500, cast=float)
+METRICS_SLOW_SAMPLE_RATE = config("METRICS_SLOW_SAMPLE_RATE", default=1.0, cast=float)
+
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware.
+    "schedulingDB.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -149,6 +191,30 @@ DATABASES = {
 }
 
 
+# Cache
+# Roster grids, response cache versions and cached users are invalidated by
+# signals, so with more than one server process (WEB_CONCURRENCY) both caches
+# must be shared, e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# and CACHE_LOCATION=redis://redis:6379/0. schedulingDB/checks.py enforces it.
+
+CACHES = {
+    "default": {
+        "BACKEND": config("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config("CACHE_LOCATION", default=""),
+    },
+    # Cached API responses for UserViewSet, ShiftViewSet and AvailabilityViewSet.
+    "responses": {
+        "BACKEND": config("RESPONSE_CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config("RESPONSE_CACHE_LOCATION", default="responses"),
+        "TIMEOUT": config("RESPONSE_CACHE_TIMEOUT", default=300, cast=int),
+        "OPTIONS": {"MAX_ENTRIES": config("RESPONSE_CACHE_MAX_ENTRIES", default=5000, cast=int)},
+    },
+}
+
+RESPONSE_CACHE_ALIAS = "responses"
+RESPONSE_CACHE_ENABLED = config("RESPONSE_CACHE_ENABLED", default=True, cast=bool)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -0,0 +1,119 @@
+"""Labor-hours analytics backed by the ShiftHours rollup.
+
+``ShiftHours`` holds the number of shifts and their total duration per
+local day, location, role and employee. The Shift signal handlers call
+``refresh_shift_hours`` with the (location, day) buckets a write touched.
+That recomputes those buckets from Shift with one ``INSERT ... SELECT``,
+so reports over a year read a few thousand rollup rows instead of every
+shift. ``labor_hours`` adds the not yet materialized template
+occurrences, which only exist on read.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+
+from .models import Shift, ShiftHours
+from .roster import day_start, week_of
+from .templates import expand, filtered_templates
+
+GROUP_FIELDS = ('user', 'location', 'role')
+PERIODS = ('day', 'week')
+# First key of the two-key advisory locks that serialize refreshes per location.
+LOCK_NAMESPACE = 18
+
+
+def shift_day(value):
+    return timezone.localtime(value).date()
+
+
+def hours_buckets(shift):
+    """The rollup buckets a shift is counted in before and after the write."""
+    return {
+        (shift.location, shift_day(shift.start_time)),
+        (shift.loaded_value('location'), shift_day(shift.loaded_value('start_time'))),
+    }
+
+
+def refresh_shift_hours(buckets):
+    """Recompute the ShiftHours rows of the given ``(location, day)`` buckets in three queries."""
+    buckets = sorted(set(buckets))
+    if not buckets:
+        return
+    locations, days = [location for location, day in buckets], [day for location, day in buckets]
+    hours = connection.ops.quote_name(ShiftHours._meta.db_table)
+    shifts = connection.ops.quote_name(Shift._meta.db_table)
+    with transaction.atomic(savepoint=False), connection.cursor() as cursor:
+        # Two concurrent refreshes of a bucket could otherwise both insert it.
+        # Locks are taken in sorted order, so refreshes cannot deadlock.
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(%s, hashtext(location)) FROM unnest(%s::text[]) AS location',
+            [LOCK_NAMESPACE, sorted(set(locations))],
+        )
+        cursor.execute(
+            f'DELETE FROM {hours} AS hours USING unnest(%s::text[], %s::date[]) AS bucket(location, day) '
+            f'WHERE hours.location = bucket.location AND hours.day = bucket.day',
+            [locations, days],
+        )
+        cursor.execute(
+            f'INSERT INTO {hours} (day, location, role, user_id, shifts, duration) '
+            f'SELECT bucket.day, shift.location, shift.role, shift.user_id, count(*), sum(shift.end_time - shift.start_time) '
+            f'FROM {shifts} AS shift JOIN unnest(%s::text[], %s::date[]) AS bucket(location, day) '
+            f'ON shift.location = bucket.location AND (shift.start_time AT TIME ZONE %s)::date = bucket.day '
+            f'WHERE shift.start_time >= %s AND shift.start_time < %s '
+            f'GROUP BY 1, 2, 3, 4',
+            [locations, days, settings.TIME_ZONE, day_start(min(days)), day_start(max(days) + timedelta(days=1))],
+        )
+
+
+def period_of(day, period):
+    return week_of(day) if period == 'week' else day
+
+
+def labor_hours(first, last, group_by=('location',), period='day', location=None, role=None, user_id=None):
+    """Shifts and hours from ``first`` to ``last`` (inclusive), by period and ``group_by`` fields."""
+    filters = {'day__gte': first, 'day__lte': last}
+    params = {}
+    if location:
+        filters['location'] = params['location'] = location
+    if role:
+        filters['role'] = params['role'] = role
+    if user_id:
+        filters['user'] = params['user'] = user_id
+
+    totals = defaultdict(lambda: [0, timedelta()])
+    rows = (
+        ShiftHours.objects.filter(**filters)
+        .annotate(period=F('day') if period == 'day' else TruncWeek('day'))
+        .values('period', *group_by)
+        .annotate(total_shifts=Sum('shifts'), total_duration=Sum('duration'))
+        .order_by()
+    )
+    for row in rows:
+        total = totals[(row['period'], *(row[field] for field in group_by))]
+        total[0] += row['total_shifts']
+        total[1] += row['total_duration']
+
+    occurrences = expand(filtered_templates(params), day_start(first), day_start(last + timedelta(days=1)))
+    for shift in occurrences:
+        day = shift_day(shift.start_time)
+        if not first <= day <= last:
+            continue
+        values = {'user': shift.user_id, 'location': shift.location, 'role': shift.role}
+        total = totals[(period_of(day, period), *(values[field] for field in group_by))]
+        total[0] += 1
+        total[1] += shift.end_time - shift.start_time
+
+    results = []
+    for key, (count, duration) in totals.items():
+        result = {'period': key[0], **dict(zip(group_by, key[1:]))}
+        result.update(shifts=count, hours=round(duration.total_seconds() / 3600, 2))
+        results.append(result)
+    # None (open shifts) sorts first.
+    return sorted(results, key=lambda result: tuple(
+        (result[field] is not None, result[field]) for field in ('period', *group_by)
+    ))
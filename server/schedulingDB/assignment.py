@@ -0,0 +1,207 @@
+"""Automatic assignment of open shifts.
+
+Everything the solver needs is loaded up front in a handful of queries and
+indexed in memory:
+
+* per-user blocked-day bitsets (bit ``i`` is day ``first_day + i``) built
+  from the availability bitmaps and approved ``PTORequest`` ranges;
+* per-user sorted interval lists of shifts already worked, for overlap
+  checks by bisection;
+* per-role min-heaps of employees keyed by hours scheduled, so each shift
+  goes to the least-loaded eligible employee.
+
+Open occurrences of shift templates are candidates too; the ones that get
+an employee are materialized as Shift rows. The result is written back with
+one ``bulk_update`` and one ``bulk_create``.
+"""
+import heapq
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .availability_bitmap import AvailabilityIndex
+from .models import User, Shift, ShiftTemplate, PTORequest
+from .roster import day_start
+from .signals import shifts_bulk_changed
+from .sync import touch
+from .templates import expand
+
+
+def local_date(value):
+    return timezone.localtime(value).date()
+
+
+class AssignmentSolver:
+    """Greedy, hour-balancing assignment over in-memory indexes.
+
+    Days outside ``first_day``..``last_day`` are ignored.
+    ``employees`` is an iterable of ``(user_id, position)``; a blank
+    position can work any shift role. ``busy`` is an iterable of
+    ``(user_id, start_time, end_time)`` for shifts already assigned around
+    the window and ``pto`` of ``(user_id, start_date, end_date)``.
+    ``unavailable`` maps user ids to day bitsets on the same base, as
+    produced by ``AvailabilityIndex.unavailable``.
+    """
+
+    def __init__(self, first_day, last_day, employees, busy=(), unavailable=None, pto=()):
+        self.first_day = first_day
+        self.last_day = last_day
+        self.hours = {}
+        self.positions = defaultdict(list)
+        self.generalists = []
+        for user_id, position in employees:
+            self.hours[user_id] = 0.0
+            if position:
+                self.positions[position].append(user_id)
+            else:
+                self.generalists.append(user_id)
+
+        self.starts = defaultdict(list)
+        self.ends = defaultdict(list)
+        for user_id, start_time, end_time in busy:
+            if user_id in self.hours:
+                self.book(user_id, start_time, end_time)
+
+        self.blocked = defaultdict(int, unavailable or {})
+        for user_id, start_date, end_date in pto:
+            self.blocked[user_id] |= self.day_mask(start_date, end_date)
+
+        self.heaps = {}
+
+    def day_mask(self, first, last):
+        lo = max((first - self.first_day).days, 0)
+        hi = (min(last, self.last_day) - self.first_day).days
+        if hi < lo:
+            return 0
+        return ((1 << (hi - lo + 1)) - 1) << lo
+
+    def shift_mask(self, start_time, end_time):
+        return self.day_mask(local_date(start_time), local_date(end_time - timedelta(microseconds=1)))
+
+    def book(self, user_id, start_time, end_time):
+        index = bisect_left(self.starts[user_id], start_time)
+        self.starts[user_id].insert(index, start_time)
+        self.ends[user_id].insert(index, end_time)
+        self.hours[user_id] += (end_time - start_time).total_seconds() / 3600
+
+    def overlaps(self, user_id, start_time, end_time):
+        starts, ends = self.starts[user_id], self.ends[user_id]
+        index = bisect_left(starts, start_time)
+        if index < len(starts) and starts[index] < end_time:
+            return True
+        # Booked intervals never overlap each other, so only the nearest
+        # earlier one can reach past start_time.
+        return index > 0 and ends[index - 1] > start_time
+
+    def heap_for(self, role):
+        heap = self.heaps.get(role)
+        if heap is None:
+            heap = [(self.hours[user_id], user_id) for user_id in self.positions.get(role, []) + self.generalists]
+            heapq.heapify(heap)
+            self.heaps[role] = heap
+        return heap
+
+    def pick(self, start_time, end_time, role):
+        heap = self.heap_for(role)
+        mask = self.shift_mask(start_time, end_time)
+        skipped = []
+        chosen = None
+        while heap:
+            hours, user_id = heapq.heappop(heap)
+            if hours != self.hours[user_id]:
+                # Stale entry: the user picked up hours through another heap.
+                heapq.heappush(heap, (self.hours[user_id], user_id))
+                continue
+            if self.blocked[user_id] & mask or self.overlaps(user_id, start_time, end_time):
+                skipped.append((hours, user_id))
+                continue
+            chosen = user_id
+            break
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        if chosen is not None:
+            self.book(chosen, start_time, end_time)
+            heapq.heappush(heap, (self.hours[chosen], chosen))
+        return chosen
+
+    def solve(self, shifts):
+        """Return ``{shift_id: user_id}`` for the ``(id, start_time, end_time, role)`` rows it could fill."""
+        assignments = {}
+        for shift_id, start_time, end_time, role in sorted(shifts, key=lambda row: (row[1], row[0])):
+            user_id = self.pick(start_time, end_time, role)
+            if user_id is not None:
+                assignments[shift_id] = user_id
+        return assignments
+
+
+def auto_assign(start_date, end_date, location=None, commit=True):
+    """Assign every open shift starting between ``start_date`` and ``end_date`` (inclusive).
+
+    Returns ``(assignments, unfilled)`` where ``assignments`` maps shift id
+    to user id and ``unfilled`` lists the shift ids nobody could take.
+    Template occurrences that are not materialized (all of them on a dry
+    run, the unfilled ones otherwise) are keyed ``template:<id>:<date>``.
+    """
+    start, end = day_start(start_date), day_start(end_date + timedelta(days=1))
+    with transaction.atomic():
+        open_shifts = Shift.objects.select_for_update(skip_locked=True).filter(
+            user__isnull=True, start_time__gte=start, start_time__lt=end,
+        )
+        open_templates = ShiftTemplate.objects.select_for_update(skip_locked=True).filter(user__isnull=True)
+        if location:
+            open_shifts = open_shifts.filter(location=location)
+            open_templates = open_templates.filter(location=location)
+        shifts = list(open_shifts.only('id', 'start_time', 'end_time', 'role', 'location'))
+        # Negative keys keep occurrences apart from shift ids inside the solver.
+        occurrences = {-index: shift for index, shift in enumerate(expand(open_templates, start, end), start=1)}
+        candidates = [(shift.id, shift) for shift in shifts] + list(occurrences.items())
+        if not candidates:
+            return {}, []
+
+        window_start = min(shift.start_time for _, shift in candidates)
+        window_end = max(shift.end_time for _, shift in candidates)
+        first_day, last_day = local_date(window_start), local_date(window_end)
+
+        employees = User.objects.filter(role='employee', is_active=True).values_list('id', 'position')
+        busy = list(Shift.objects.filter(
+            user__isnull=False, start_time__lt=window_end, end_time__gt=window_start
+        ).values_list('user_id', 'start_time', 'end_time'))
+        busy += [
+            (shift.user_id, shift.start_time, shift.end_time)
+            for shift in expand(ShiftTemplate.objects.filter(user__isnull=False), window_start - timedelta(days=1), window_end)
+            if shift.end_time > window_start
+        ]
+        availability = AvailabilityIndex.load(first_day, last_day)
+        unavailable = {user_id: availability.unavailable(user_id) for user_id in availability.user_ids()}
+        pto = PTORequest.objects.filter(
+            status='approved', start_date__lte=last_day, end_date__gte=first_day
+        ).values_list('user_id', 'start_date', 'end_date')
+
+        solver = AssignmentSolver(first_day, last_day, employees, busy, unavailable, pto)
+        assignments = solver.solve((key, shift.start_time, shift.end_time, shift.role) for key, shift in candidates)
+
+        if commit and assignments:
+            assigned = [shift for shift in shifts if shift.id in assignments]
+            for shift in assigned:
+                shift.user_id = assignments[shift.id]
+            touch(assigned)
+            Shift.objects.bulk_update(assigned, ['user', 'updated_at'], batch_size=1000)
+            created = []
+            for key, shift in occurrences.items():
+                if key in assignments:
+                    shift.user_id = assignments[key]
+                    created.append(shift)
+            Shift.objects.bulk_create(created, batch_size=1000)
+            shifts_bulk_changed.send(sender=Shift, shifts=assigned + created)
+
+    def label(shift):
+        if shift.id is not None:
+            return shift.id
+        return f'template:{shift.template_id}:{shift.occurrence_date.isoformat()}'
+
+    unfilled = [label(shift) for key, shift in candidates if key not in assignments]
+    assignments = {label(shift): assignments[key] for key, shift in candidates if key in assignments}
+    return assignments, unfilled
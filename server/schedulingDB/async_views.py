@@ -0,0 +1,246 @@
+"""Async read endpoints for shifts, availability and the roster.
+
+DRF views are synchronous, so under ASGI every request holds a worker
+thread for as long as its queries take. These views return the same data
+(same serializers, filters and per-role scoping) from the async ORM, so
+a slow query parks a coroutine instead and one uvicorn worker can keep
+thousands of requests open::
+
+    uvicorn main.asgi:application
+
+More worker processes (``WEB_CONCURRENCY``) need shared caches and a
+shared event broker; see checks.py.
+
+They only accept JWT bearer tokens, and ``events`` also a stream ticket
+in ``?ticket=`` (see authentication.py). The token is verified in the event
+loop; with ``AUTH_TRUST_JWT_CLAIMS`` its claims stand in for the user, and
+otherwise the user is loaded with one async query. Full-text ``search`` and
+keyset pagination are left to the DRF endpoints.
+
+``events`` streams change events instead of data; see events.py.
+"""
+import functools
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed, PermissionDenied, ValidationError
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import events as change_events
+from .authentication import ClaimsUser, StreamTicket
+from .filters import AsyncShiftFilter, AsyncAvailabilityFilter
+from .models import User, Shift, Availability
+from .roster import aget_roster, week_of
+from .serializers import ShiftSerializer, AvailabilitySerializer, RosterQuerySerializer
+from .templates import MAX_EXPANDED_DAYS, aexpand, filter_occurrences, filtered_templates, merge_occurrences
+
+MAX_PAGE_SIZE = 500
+jwt_authentication = JWTAuthentication()
+
+
+async def authenticate(request):
+    """The active user named by the request's bearer token, or None."""
+    try:
+        header = jwt_authentication.get_header(request)
+        raw_token = header and jwt_authentication.get_raw_token(header)
+        if raw_token is None:
+            return None
+        token = jwt_authentication.get_validated_token(raw_token)
+    except AuthenticationFailed:
+        return None
+    return await token_user(token)
+
+
+async def authenticate_ticket(request):
+    """The active user named by the request's ``?ticket=`` stream ticket, or None."""
+    raw_ticket = request.GET.get('ticket')
+    if not raw_ticket:
+        return None
+    try:
+        ticket = StreamTicket(raw_ticket)
+    except TokenError:
+        return None
+    return await token_user(ticket)
+
+
+async def token_user(token):
+    try:
+        user_id = token[jwt_settings.USER_ID_CLAIM]
+    except KeyError:
+        return None
+    if settings.AUTH_TRUST_JWT_CLAIMS and 'role' in token:
+        return ClaimsUser(token)
+    try:
+        user = await User.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+    except User.DoesNotExist:
+        return None
+    return user if user.is_active else None
+
+
+def json_response(data, status=200, **kwargs):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder, safe=False, **kwargs)
+
+
+def async_api_view(view=None, tickets=False):
+    """Authenticate, allow GET only and turn DRF-style exceptions into JSON errors.
+
+    With ``tickets`` a stream ticket is accepted in place of the bearer token.
+    """
+    if view is None:
+        return functools.partial(async_api_view, tickets=tickets)
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+        request.user = await authenticate(request)
+        if request.user is None and tickets:
+            request.user = await authenticate_ticket(request)
+        if request.user is None:
+            return json_response(
+                {'detail': 'Authentication credentials were not provided.'}, status=401,
+                headers={'WWW-Authenticate': 'Bearer realm="api"'},
+            )
+        try:
+            return await view(request, *args, **kwargs)
+        except Http404:
+            return json_response({'detail': 'Not found.'}, status=404)
+        except (PermissionDenied, ValidationError) as exc:
+            return json_response(exc.detail, status=exc.status_code)
+    return wrapper
+
+
+def filter_params(filterset):
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    return filterset.form.cleaned_data
+
+
+async def paginated(request, queryset, serializer_class, extra=()):
+    """A DRF-style page of ``queryset``, merged with the unsaved shifts in ``extra``."""
+    try:
+        page = int(request.GET.get('page', 1))
+        page_size = min(int(request.GET.get('page_size', settings.REST_FRAMEWORK['PAGE_SIZE'])), MAX_PAGE_SIZE)
+    except ValueError:
+        raise Http404
+    if page < 1 or page_size < 1:
+        raise Http404
+    offset = (page - 1) * page_size
+    if extra:
+        # Rows past the end of the page cannot land on it; see MergedShifts.
+        count = await queryset.acount() + len(extra)
+        rows = [row async for row in queryset[:offset + page_size]]
+        results = merge_occurrences(rows, extra[:offset + page_size])[offset:offset + page_size]
+    else:
+        count = await queryset.acount()
+        results = [row async for row in queryset[offset:offset + page_size]]
+    if page > 1 and not results:
+        raise Http404
+
+    url = request.build_absolute_uri()
+    next_url = replace_query_param(url, 'page', page + 1) if offset + page_size < count else None
+    previous_url = None
+    if page > 1:
+        previous_url = remove_query_param(url, 'page') if page == 2 else replace_query_param(url, 'page', page - 1)
+    return {
+        'count': count,
+        'next': next_url,
+        'previous': previous_url,
+        'results': serializer_class(results, many=True).data,
+    }
+
+
+def shift_queryset(user):
+    queryset = Shift.objects.select_related('user').order_by('start_time', 'id')
+    if user.role == 'employee':
+        return queryset.filter(user_id=user.id)
+    return queryset
+
+
+def availability_queryset(user):
+    queryset = Availability.objects.select_related('user').order_by('date', 'id')
+    if user.role == 'employee':
+        return queryset.filter(user_id=user.id)
+    return queryset
+
+
+@async_api_view
+async def shift_list(request):
+    """Same as ``GET /api/shifts/``, including template occurrences inside a start_time window."""
+    filterset = AsyncShiftFilter(request.GET, queryset=shift_queryset(request.user))
+    params = filter_params(filterset)
+    occurrences = []
+    start, end = params.get('start_time__gte'), params.get('start_time__lt')
+    if start is not None and end is not None:
+        if end - start > timedelta(days=MAX_EXPANDED_DAYS):
+            raise ValidationError({'start_time__lt': [f'At most {MAX_EXPANDED_DAYS} days after start_time__gte']})
+        templates = filtered_templates(params, request.user.id if request.user.role == 'employee' else None)
+        occurrences = filter_occurrences(await aexpand(templates, start, end), params)
+    return json_response(await paginated(request, filterset.qs, ShiftSerializer, occurrences))
+
+
+@async_api_view
+async def shift_detail(request, pk):
+    try:
+        shift = await shift_queryset(request.user).aget(pk=pk)
+    except Shift.DoesNotExist:
+        raise Http404
+    return json_response(ShiftSerializer(shift).data)
+
+
+@async_api_view
+async def availability_list(request):
+    filterset = AsyncAvailabilityFilter(request.GET, queryset=availability_queryset(request.user))
+    filter_params(filterset)
+    return json_response(await paginated(request, filterset.qs, AvailabilitySerializer))
+
+
+@async_api_view
+async def availability_detail(request, pk):
+    try:
+        availability = await availability_queryset(request.user).aget(pk=pk)
+    except Availability.DoesNotExist:
+        raise Http404
+    # IsOwnerOrAdmin, as on the DRF endpoint.
+    if request.user.role != 'admin' and availability.user_id != request.user.id:
+        raise PermissionDenied('You do not have permission to perform this action.')
+    return json_response(AvailabilitySerializer(availability).data)
+
+
+@async_api_view
+async def roster(request):
+    serializer = RosterQuerySerializer(data=request.GET)
+    serializer.is_valid(raise_exception=True)
+    params = serializer.validated_data
+    grid = await aget_roster(params['location'], week_of(params.get('week') or timezone.localdate()))
+    if request.user.role == 'employee':
+        grid = dict(grid, employees=[row for row in grid['employees'] if row['id'] == request.user.id])
+    return json_response(grid)
+
+
+@async_api_view(tickets=True)
+async def events(request):
+    """Server-Sent Events for the caller, plus ``?location=`` (repeatable) for admins and managers.
+
+    Browsers authenticate with ``?ticket=`` from ``POST /api/events/ticket/``.
+    Once the ticket has expired a reconnect is refused, and the client gets
+    a new ticket and opens a new EventSource.
+    """
+    if not isinstance(request, ASGIRequest):
+        return json_response({'error': 'Event streams are only served by the ASGI application'}, status=501)
+    locations = request.GET.getlist('location')
+    if locations and request.user.role not in ['admin', 'manager']:
+        raise PermissionDenied('Only admins and managers can subscribe to locations')
+    channels = change_events.subscription_channels(request.user, locations)
+    response = StreamingHttpResponse(change_events.stream(channels), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies such as nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,139 @@
+"""JWT authentication that trusts the token's claims.
+
+Access tokens carry the user's ``role`` next to their id; refresh tokens
+do not. Each access token gets the role the user has when it is issued,
+at login or on refresh (see ``ScheduleTokenObtainPairSerializer`` and
+``ScheduleTokenRefreshSerializer``). ``ClaimsJWTAuthentication`` turns a
+verified token into a ``ClaimsUser`` without touching the database, which
+is all permission checks and queryset scoping need. Any other attribute
+loads the full ``User`` through a short-lived cache.
+
+A role change or deactivation therefore takes effect when the user's
+current access token expires (``SIMPLE_JWT['ACCESS_TOKEN_LIFETIME']``):
+refreshing re-reads the user, and is refused for inactive users.
+
+A browser ``EventSource`` cannot send an Authorization header, so event
+streams also take a ``StreamTicket`` in the URL. Tickets are issued by
+``POST /api/events/ticket/``, expire after ``EVENTS_TICKET_SECONDS`` and
+are not accepted anywhere else.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenObtainSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import Token
+
+from .models import User
+
+CLAIM_ATTRIBUTES = {'token', 'id', 'pk', 'role', 'full'}
+
+
+def user_cache_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def cached_user(user_id):
+    """The User row for ``user_id``, cached for ``AUTH_USER_CACHE_TIMEOUT`` seconds."""
+    key = user_cache_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = User.objects.filter(pk=user_id).first()
+        if user is not None:
+            cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+    return user
+
+
+class ClaimsUser:
+    """The user described by a verified access token.
+
+    ``id`` and ``role`` come from the claims; other attributes are read
+    from the cached ``User`` row on first use.
+    """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, token):
+        self.token = token
+        self.id = self.pk = token[jwt_settings.USER_ID_CLAIM]
+        self.role = token['role']
+
+    @cached_property
+    def full(self):
+        user = cached_user(self.id)
+        if user is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        return user
+
+    def __getattr__(self, name):
+        if name in CLAIM_ATTRIBUTES or name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.full, name)
+
+    def __eq__(self, other):
+        return self.pk == getattr(other, 'pk', None)
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return f'user {self.id} ({self.role})'
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if 'role' in validated_token:
+            return ClaimsUser(validated_token)
+        # Tokens issued before the role claim existed.
+        user = cached_user(validated_token.get(jwt_settings.USER_ID_CLAIM))
+        if user is None or not user.is_active:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        return user
+
+
+def access_token_for(refresh, user):
+    """An access token from ``refresh`` carrying ``user``'s current role."""
+    access = refresh.access_token
+    access['role'] = user.role
+    return str(access)
+
+
+class StreamTicket(Token):
+    token_type = 'stream'
+    lifetime = timedelta(seconds=settings.EVENTS_TICKET_SECONDS)
+
+
+def stream_ticket_for(user):
+    """A StreamTicket carrying ``user``'s id and role, like an access token."""
+    ticket = StreamTicket.for_user(user)
+    ticket['role'] = user.role
+    return str(ticket)
+
+
+class ScheduleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    # TokenObtainPairSerializer.validate without putting the role on the
+    # refresh token, which every refreshed access token would copy.
+    def validate(self, attrs):
+        data = TokenObtainSerializer.validate(self, attrs)
+        refresh = self.get_token(self.user)
+        data['refresh'] = str(refresh)
+        data['access'] = access_token_for(refresh, self.user)
+        if jwt_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, self.user)
+        return data
+
+
+class ScheduleTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = cached_user(refresh.get(jwt_settings.USER_ID_CLAIM))
+        if user is None or not user.is_active:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        data = super().validate(attrs)
+        data['access'] = access_token_for(refresh, user)
+        return data
@@ -0,0 +1,117 @@
+"""Compact, bitmap-based reads of availability.
+
+``Availability`` keeps one row per user per day and remains what the API
+writes. ``AvailabilityMonth`` mirrors it as one row per user per month
+with two day bitmaps, and scheduling code reads those instead: a year
+for 1,000 employees is 12,000 small rows rather than 365,000.
+``AvailabilityIndex`` decodes them into one integer per user covering a
+date range, so "who is free on these 14 days" becomes a bitwise AND.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+
+from .models import Availability, AvailabilityMonth
+
+# First key of the two-key advisory locks that serialize refreshes per user.
+LOCK_NAMESPACE = 11
+
+
+def month_of(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def refresh_months(user_ids, first_date, last_date):
+    """Rebuild the month bitmaps of ``user_ids`` covering ``first_date``..``last_date``."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    start, end = month_of(first_date), next_month(last_date)
+    months = connection.ops.quote_name(AvailabilityMonth._meta.db_table)
+    rows = connection.ops.quote_name(Availability._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Two concurrent refreshes of a user's month could otherwise both insert it.
+        # Locks are taken in sorted order, so refreshes cannot deadlock.
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(%s, hashint8(user_id)) FROM unnest(%s::bigint[]) AS user_id',
+            [LOCK_NAMESPACE, sorted(set(user_ids))],
+        )
+        cursor.execute(
+            f'DELETE FROM {months} WHERE user_id = ANY(%s) AND month >= %s AND month < %s',
+            [user_ids, start, end],
+        )
+        cursor.execute(
+            f'INSERT INTO {months} (user_id, month, known, available) '
+            f'SELECT user_id, date_trunc(\'month\', date)::date, '
+            f'  bit_or(1 << (extract(day FROM date)::int - 1)), '
+            f'  coalesce(bit_or(1 << (extract(day FROM date)::int - 1)) FILTER (WHERE is_available), 0) '
+            f'FROM {rows} WHERE user_id = ANY(%s) AND date >= %s AND date < %s '
+            f'GROUP BY 1, 2',
+            [user_ids, start, end],
+        )
+
+
+class AvailabilityIndex:
+    """Per-user availability over ``first``..``last`` as integers.
+
+    Bit ``i`` stands for day ``first + i``. ``known[user_id]`` marks days
+    with an availability entry and ``available[user_id]`` the days marked
+    available; days known but not available are unavailable.
+    """
+
+    def __init__(self, first, last, known=None, available=None):
+        self.first = first
+        self.last = last
+        self.length = (last - first).days + 1
+        self.full = (1 << self.length) - 1
+        self.known = known or {}
+        self.available = available or {}
+
+    @classmethod
+    def load(cls, first, last, user_ids=None):
+        index = cls(first, last)
+        months = AvailabilityMonth.objects.filter(month__gte=month_of(first), month__lte=last)
+        if user_ids is not None:
+            months = months.filter(user_id__in=user_ids)
+        for user_id, month, known, available in months.values_list('user_id', 'month', 'known', 'available'):
+            index.add_month(user_id, month, known, available)
+        return index
+
+    def rebase(self, bits, month):
+        offset = (month - self.first).days
+        bits = bits << offset if offset >= 0 else bits >> -offset
+        return bits & self.full
+
+    def add_month(self, user_id, month, known, available):
+        self.known[user_id] = self.known.get(user_id, 0) | self.rebase(known, month)
+        self.available[user_id] = self.available.get(user_id, 0) | self.rebase(available, month)
+
+    def day_mask(self, days):
+        mask = 0
+        for day in days:
+            if self.first <= day <= self.last:
+                mask |= 1 << (day - self.first).days
+        return mask
+
+    def unavailable(self, user_id):
+        return self.known.get(user_id, 0) & ~self.available.get(user_id, 0)
+
+    def free_on(self, user_ids, days):
+        """The users in ``user_ids`` not marked unavailable on any of ``days``."""
+        mask = self.day_mask(days)
+        return [user_id for user_id in user_ids if not self.unavailable(user_id) & mask]
+
+    def encode(self, user_id):
+        """One character per day: 'Y' available, 'N' unavailable, '-' no entry."""
+        known, available = self.known.get(user_id, 0), self.available.get(user_id, 0)
+        return ''.join(
+            ('Y' if available >> i & 1 else 'N') if known >> i & 1 else '-'
+            for i in range(self.length)
+        )
+
+    def user_ids(self):
+        return sorted(self.known)
@@ -0,0 +1,158 @@
+"""Bulk availability import through a COPY-loaded staging table.
+
+The CSV needs a ``date`` column (YYYY-MM-DD), an ``is_available`` column
+(true/false, yes/no, 1/0) and either ``user_id`` or ``username``. Rows are
+parsed and checked in Python and streamed into a temporary table with
+``COPY``. Unknown users are then rejected with one query, and everything
+else is upserted into ``Availability`` on (user, date) with a single
+``INSERT ... ON CONFLICT``. When the file names the same user and day
+twice, the later line wins. A file that is not valid UTF-8 is rejected
+as a whole at the line where decoding failed, before anything is written.
+"""
+import csv
+import tempfile
+from datetime import date
+
+from django.db import connection, transaction
+
+from .models import User, Availability
+from .signals import availability_bulk_changed
+
+MAX_REPORTED_REJECTS = 1000
+BIGINT_MAX = 2 ** 63 - 1
+TRUE_VALUES = {'true', 't', 'yes', 'y', '1'}
+FALSE_VALUES = {'false', 'f', 'no', 'n', '0'}
+NOT_UTF8 = 'the file is not valid UTF-8; nothing was imported'
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.rejected_count = 0
+        self.rejected = []
+
+    def reject(self, line, error):
+        self.rejected_count += 1
+        if len(self.rejected) < MAX_REPORTED_REJECTS:
+            self.rejected.append({'line': line, 'error': error})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'rejected_count': self.rejected_count,
+            'rejected': sorted(self.rejected, key=lambda reject: reject['line']),
+        }
+
+
+def parse_row(row):
+    user_id = (row.get('user_id') or '').strip()
+    username = (row.get('username') or '').strip()
+    if not user_id and not username:
+        raise ValueError('user_id or username is required')
+    if user_id:
+        # isdigit() alone passes other scripts' digits, and int() takes '+1'
+        # or '1_0'; anything outside bigint would only fail later, in COPY.
+        parsed = int(user_id) if user_id.isascii() and user_id.isdigit() else 0
+        if not 0 < parsed <= BIGINT_MAX:
+            raise ValueError(f'invalid user_id {user_id!r}')
+        user_id = parsed
+    elif '\x00' in username:
+        raise ValueError(f'invalid username {username!r}')
+    try:
+        day = date.fromisoformat((row.get('date') or '').strip())
+    except ValueError:
+        raise ValueError(f"invalid date {row.get('date')!r}")
+    flag = (row.get('is_available') or '').strip().lower()
+    if flag not in TRUE_VALUES | FALSE_VALUES:
+        raise ValueError(f"invalid is_available {row.get('is_available')!r}")
+    return user_id or None, username if not user_id else None, day, flag in TRUE_VALUES
+
+
+def import_availability(lines, only_user_id=None, dry_run=False):
+    """Validate and upsert availability rows from an iterable of CSV text lines.
+
+    ``only_user_id`` rejects rows for anybody else (employee uploads).
+    """
+    result = ImportResult()
+    reader = csv.DictReader(lines)
+    try:
+        header = set(reader.fieldnames or ())
+    except UnicodeDecodeError:
+        result.reject(1, NOT_UTF8)
+        return result
+    missing = {'date', 'is_available'} - header
+    if missing or not {'user_id', 'username'} & header:
+        result.reject(1, 'header must contain date, is_available and user_id or username')
+        return result
+
+    first_date = last_date = None
+    with tempfile.SpooledTemporaryFile(mode='w+', max_size=8 * 1024 * 1024, newline='') as staged:
+        writer = csv.writer(staged)
+        try:
+            for row in reader:
+                try:
+                    user_id, username, day, is_available = parse_row(row)
+                except ValueError as exc:
+                    result.reject(reader.line_num, str(exc))
+                    continue
+                writer.writerow([reader.line_num, user_id or '', username or '', day.isoformat(), is_available])
+                first_date = day if first_date is None else min(first_date, day)
+                last_date = day if last_date is None else max(last_date, day)
+        except UnicodeDecodeError:
+            result.reject(reader.line_num + 1, NOT_UTF8)
+            return result
+        if first_date is None:
+            return result
+        staged.seek(0)
+
+        users = connection.ops.quote_name(User._meta.db_table)
+        availability = connection.ops.quote_name(Availability._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE availability_staging '
+                '(line integer, user_id bigint, username text, date date, is_available boolean) '
+                'ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY availability_staging (line, user_id, username, date, is_available) FROM STDIN WITH (FORMAT csv)',
+                staged,
+            )
+            cursor.execute(
+                f'UPDATE availability_staging s SET user_id = u.id FROM {users} u '
+                f'WHERE s.user_id IS NULL AND u.username = s.username'
+            )
+            cursor.execute(
+                f'DELETE FROM availability_staging s '
+                f'WHERE NOT EXISTS (SELECT 1 FROM {users} u WHERE u.id = s.user_id) '
+                f'OR (%s IS NOT NULL AND s.user_id <> %s) '
+                f'RETURNING s.line, s.user_id, s.username',
+                [only_user_id, only_user_id],
+            )
+            for line, user_id, username in cursor.fetchall():
+                if only_user_id is not None and user_id is not None and user_id != only_user_id:
+                    result.reject(line, 'you can only import your own availability')
+                else:
+                    result.reject(line, f'unknown user {username or user_id}')
+            cursor.execute(
+                f'WITH upserted AS ('
+                f'  INSERT INTO {availability} (user_id, date, is_available, updated_at)'
+                f'  SELECT DISTINCT ON (user_id, date) user_id, date, is_available, now()'
+                f'  FROM availability_staging ORDER BY user_id, date, line DESC'
+                f'  ON CONFLICT (user_id, date) DO UPDATE'
+                f'  SET is_available = EXCLUDED.is_available, updated_at = EXCLUDED.updated_at'
+                f'  RETURNING (xmax = 0) AS inserted'
+                f') SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted'
+            )
+            result.created, result.updated = cursor.fetchone()
+            cursor.execute('SELECT DISTINCT user_id FROM availability_staging')
+            user_ids = [user_id for user_id, in cursor.fetchall()]
+            cursor.execute('DROP TABLE availability_staging')
+            if dry_run:
+                transaction.set_rollback(True)
+            else:
+                availability_bulk_changed.send(
+                    sender=Availability, user_ids=user_ids, first_date=first_date, last_date=last_date
+                )
+    return result
@@ -0,0 +1,160 @@
+"""Endpoint benchmarks for ``manage.py bench``.
+
+Every GET endpoint of the API is requested in-process through the test
+client. That covers each router viewset's list and detail views and its
+GET actions, found through ``router.registry``, so new viewsets are
+benchmarked automatically. It also covers the explicit paths in
+``EXTRA_ENDPOINTS``. Endpoints that need a window or a location get one
+week of one location, which matches how the clients call them.
+
+For each endpoint this records latency percentiles, sequential
+throughput and the number of SQL queries. ``compare`` reports the
+regressions against a saved baseline.
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .authentication import ScheduleTokenObtainPairSerializer, access_token_for
+from .metrics import EndpointStats
+from .models import Shift
+from .roster import day_start
+from .urls import router
+
+# Non-router GET endpoints, as (url name, router basename whose first row is the pk).
+EXTRA_ENDPOINTS = (
+    ('roster', None),
+    ('labor_hours', None),
+    ('async_shift_list', None),
+    ('async_shift_detail', 'shift'),
+    ('async_availability_list', None),
+    ('async_availability_detail', 'availability'),
+    ('async_roster', None),
+)
+
+
+def busiest_location():
+    row = Shift.objects.values('location').annotate(shifts=Count('id')).order_by('-shifts').first()
+    return row['location'] if row else 'main'
+
+
+def endpoint_params(location, week):
+    """Query parameters for the endpoints that need them, by url name."""
+    shifts = {
+        'location': location,
+        'start_time__gte': day_start(week).isoformat(),
+        'start_time__lt': day_start(week + timedelta(days=7)).isoformat(),
+    }
+    roster = {'location': location, 'week': week.isoformat()}
+    # The first shift of the week at the location, or else its last one.
+    shift_ids = Shift.objects.filter(location=location).order_by('start_time').values_list('pk', flat=True)
+    shift_id = shift_ids.filter(start_time__gte=day_start(week)).first() or shift_ids.last()
+    return {
+        'shift-export': shifts,
+        'shift-conflicts': shifts,
+        'availability-date-range': {'from': week.isoformat(), 'to': (week + timedelta(days=6)).isoformat()},
+        'shiftswap-candidates': {'shift_id': shift_id} if shift_id else {},
+        'ptorequest-export': {'start_date__lte': (week + timedelta(days=6)).isoformat(), 'end_date__gte': week.isoformat()},
+        'roster': roster,
+        'async_roster': roster,
+        # A year up to the end of the week, as on a dashboard.
+        'labor_hours': {
+            'from': (week - timedelta(days=358)).isoformat(), 'to': (week + timedelta(days=6)).isoformat(),
+            'group_by': 'location,role', 'period': 'week',
+        },
+    }
+
+
+def endpoints(location, week):
+    """``(name, url, params)`` for every GET endpoint of the API."""
+    params = endpoint_params(location, week)
+    viewsets = {basename: viewset for prefix, viewset, basename in router.registry}
+    first_pks = {
+        basename: viewset.queryset.order_by('pk').values_list('pk', flat=True).first()
+        for basename, viewset in viewsets.items()
+    }
+
+    names = []
+    for basename, viewset in viewsets.items():
+        pk = first_pks[basename]
+        names.append((f'{basename}-list', None))
+        if pk is not None:
+            names.append((f'{basename}-detail', pk))
+        for action in viewset.get_extra_actions():
+            if 'get' not in action.mapping or (action.detail and pk is None):
+                continue
+            names.append((f'{basename}-{action.url_name}', pk if action.detail else None))
+    for name, basename in EXTRA_ENDPOINTS:
+        pk = first_pks[basename] if basename else None
+        if basename is None or pk is not None:
+            names.append((name, pk))
+
+    return [
+        (name, reverse(name, args=[] if pk is None else [pk]), params.get(name, {}))
+        for name, pk in names
+    ]
+
+
+def clear_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+def run(endpoints, user, requests=20, warmup=2, cold=False):
+    """Request each endpoint ``warmup + requests`` times as ``user``; returns the stats by name.
+
+    With ``cold`` every cache is cleared before each request, so the
+    numbers show the database path rather than cache hits.
+    """
+    token = access_token_for(ScheduleTokenObtainPairSerializer.get_token(user), user)
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+    results = {}
+    for name, url, params in endpoints:
+        timings, queries, statuses = [], [], Counter()
+        for attempt in range(warmup + requests):
+            if cold:
+                clear_caches()
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = client.get(url, params)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+                elapsed = time.perf_counter() - started
+            if attempt >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(len(ctx))
+                statuses[str(response.status_code)] += 1
+        results[name] = {
+            'url': url,
+            'params': params,
+            'requests': requests,
+            'latency_ms': EndpointStats.percentiles(timings),
+            'throughput_rps': round(requests / (sum(timings) / 1000), 1),
+            'queries': max(queries),
+            'statuses': dict(statuses),
+        }
+    return results
+
+
+def compare(results, baseline, tolerance=1.25):
+    """Regressions against ``baseline``: any extra query, or a p95 over ``tolerance`` times the old one."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['queries'] > before['queries']:
+            regressions.append(f"{name}: {before['queries']} -> {result['queries']} queries")
+        old_p95, new_p95 = before['latency_ms']['p95'], result['latency_ms']['p95']
+        if new_p95 > old_p95 * tolerance:
+            regressions.append(f"{name}: p95 {old_p95:.1f} -> {new_p95:.1f} ms")
+    return regressions
@@ -0,0 +1,91 @@
+"""Who could take a shift over: ``GET /api/shift-swaps/candidates/?shift_id=``.
+
+An active employee is eligible when their position matches the shift's
+role (a blank position works any role, as in auto-assignment), they are
+not marked unavailable on a day the shift touches, have no approved PTO
+on those days and hold no overlapping shift, assigned template
+occurrences included.
+
+Candidates are ranked: a matching position before a blank one, marked
+available on every day before having no entry, then the fewest hours
+already scheduled that week, then username.
+
+Overlapping shifts, PTO and availability are anti-joins in one candidate
+query and only assigned templates are expanded in Python, so nothing is
+looked up per employee.
+"""
+from datetime import timedelta
+
+from django.db.models import Case, Count, DurationField, Exists, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import User, Shift, ShiftTemplate, Availability, PTORequest
+from .roster import day_start, week_of_datetime
+from .templates import expand
+
+MAX_SHIFT = timedelta(days=1)
+
+
+def shift_days(shift):
+    first = timezone.localdate(shift.start_time)
+    last = timezone.localdate(shift.end_time - timedelta(microseconds=1))
+    return first, last
+
+
+def overlapping_shifts(start, end):
+    """Assigned shifts overlapping ``[start, end)``.
+
+    Only shifts starting up to ``MAX_SHIFT`` before ``start`` are looked at,
+    so the scan is a short range of the start_time index. A longer shift is
+    still caught by the overlap constraint when the swap is accepted.
+    """
+    return Shift.objects.filter(
+        user__isnull=False, start_time__gt=start - MAX_SHIFT, start_time__lt=end, end_time__gt=start,
+    )
+
+
+def occurrence_user_ids(start, end):
+    """Employees with an assigned template occurrence overlapping ``[start, end)``."""
+    occurrences = expand(ShiftTemplate.objects.filter(user__isnull=False), start - timedelta(days=1), end)
+    return {shift.user_id for shift in occurrences if shift.start_time < end and shift.end_time > start}
+
+
+def swap_candidates(shift, limit=20):
+    """The ``limit`` best-ranked employees who could work ``shift``, as dicts."""
+    first, last = shift_days(shift)
+    week = week_of_datetime(shift.start_time)
+    days = Availability.objects.filter(user_id=OuterRef('pk'), date__gte=first, date__lte=last)
+    available_days = days.filter(is_available=True).values('user_id').annotate(days=Count('pk')).values('days')
+    week_hours = Shift.objects.filter(
+        user_id=OuterRef('pk'), start_time__gte=day_start(week), start_time__lt=day_start(week + timedelta(days=7)),
+    ).values('user_id').annotate(hours=Sum(F('end_time') - F('start_time'))).values('hours')
+
+    candidates = (
+        User.objects.filter(role='employee', is_active=True)
+        .filter(Q(position=shift.role) | Q(position=''))
+        .exclude(pk__in=occurrence_user_ids(shift.start_time, shift.end_time) | {shift.user_id})
+        .exclude(pk__in=overlapping_shifts(shift.start_time, shift.end_time).values('user_id'))
+        .exclude(Exists(days.filter(is_available=False)))
+        .exclude(Exists(PTORequest.objects.filter(
+            user_id=OuterRef('pk'), status='approved', start_date__lte=last, end_date__gte=first,
+        )))
+        .annotate(
+            generalist=Case(When(position=shift.role, then=Value(0)), default=Value(1), output_field=IntegerField()),
+            available_days=Coalesce(Subquery(available_days), 0),
+            week_hours=Coalesce(Subquery(week_hours), Value(timedelta(0)), output_field=DurationField()),
+        )
+        .order_by('generalist', '-available_days', 'week_hours', 'username')
+        .values('id', 'username', 'position', 'available_days', 'week_hours')[:limit]
+    )
+    needed = (last - first).days + 1
+    return [
+        {
+            'id': row['id'],
+            'username': row['username'],
+            'position': row['position'],
+            'available': row['available_days'] == needed,
+            'week_hours': row['week_hours'].total_seconds() / 3600,
+        }
+        for row in candidates
+    ]
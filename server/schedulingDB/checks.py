@@ -0,0 +1,46 @@
+"""System checks for state that only holds up inside one server process.
+
+Roster grids, response cache versions and cached users live in
+``settings.CACHES``, and change events go through ``EVENTS_BROKER``. Signals
+invalidate and publish them in the process that made the write, so with
+several server processes every cache and the broker must be shared (e.g.
+Redis). ``WEB_CONCURRENCY``, which uvicorn and gunicorn both read as their
+worker count, above 1 with a process-local cache or broker is an error.
+``main/asgi.py`` runs these checks before serving.
+"""
+import os
+
+from django.conf import settings
+from django.core import checks
+
+PROCESS_LOCAL_CACHES = {'django.core.cache.backends.locmem.LocMemCache'}
+PROCESS_LOCAL_BROKERS = {'schedulingDB.events.InProcessBroker'}
+
+
+def server_processes():
+    try:
+        return int(os.environ.get('WEB_CONCURRENCY', 1))
+    except ValueError:
+        return 1
+
+
+@checks.register('workers')
+def check_shared_state(app_configs, **kwargs):
+    processes = server_processes()
+    if processes <= 1:
+        return []
+    errors = []
+    for alias, cache in settings.CACHES.items():
+        if cache['BACKEND'] in PROCESS_LOCAL_CACHES:
+            errors.append(checks.Error(
+                f'The {alias!r} cache is local to each process, but WEB_CONCURRENCY is {processes}.',
+                hint='Point it at a shared cache such as Redis, or run one server process.',
+                id='schedulingDB.E001',
+            ))
+    if settings.EVENTS_BROKER in PROCESS_LOCAL_BROKERS:
+        errors.append(checks.Error(
+            f'EVENTS_BROKER only reaches streams in its own process, but WEB_CONCURRENCY is {processes}.',
+            hint='Use a shared broker, or run one server process.',
+            id='schedulingDB.E002',
+        ))
+    return errors
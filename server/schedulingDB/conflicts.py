@@ -0,0 +1,165 @@
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import IntegrityError, OperationalError, connection
+from django.db.models import DateTimeField, ExpressionWrapper, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .models import Shift, PTORequest
+from .roster import day_start
+from .templates import MAX_EXPANDED_DAYS, assigned_occurrences, expansion_dates, occurrence, occurrence_dates
+
+OVERLAP_CONSTRAINT = 'shift_no_user_overlap'
+# serialization_failure and deadlock_detected: the transaction can simply be run again.
+RETRYABLE_ERRORS = {'40001', '40P01'}
+RETRY_ATTEMPTS = 3
+RETRY_DELAY = 0.05
+
+
+class ScheduleConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This change would double-book an employee.'
+    default_code = 'schedule_conflict'
+
+
+@contextmanager
+def overlap_as_conflict():
+    """Turn a violation of the shift overlap exclusion constraint into a 409."""
+    try:
+        yield
+    except IntegrityError as exc:
+        diag = getattr(exc.__cause__, 'diag', None)
+        if getattr(diag, 'constraint_name', None) == OVERLAP_CONSTRAINT:
+            raise ScheduleConflict('The employee already has a shift overlapping this time.')
+        raise
+
+
+def retry_on_conflict(func, attempts=RETRY_ATTEMPTS):
+    """Call ``func``, which runs its own transaction, again if Postgres aborts it as a deadlock.
+
+    Inside an outer transaction there is nothing left to retry, so the
+    error is raised at once.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return func()
+        except OperationalError as exc:
+            retryable = getattr(exc.__cause__, 'pgcode', None) in RETRYABLE_ERRORS
+            if not retryable or attempt == attempts or connection.in_atomic_block:
+                raise
+        time.sleep(RETRY_DELAY * attempt)
+
+
+def check_pto(user_id, start_time, end_time):
+    """Raise ScheduleConflict if the user has approved PTO during the given times."""
+    if user_id is None:
+        return
+    conflict = PTORequest.objects.filter(
+        user_id=user_id,
+        status='approved',
+        start_date__lte=timezone.localdate(end_time - timedelta(microseconds=1)),
+        end_date__gte=timezone.localdate(start_time),
+    ).first()
+    if conflict:
+        raise ScheduleConflict(
+            f'The employee has approved PTO from {conflict.start_date} to {conflict.end_date}.'
+        )
+
+
+def check_occurrences(user_id, start_time, end_time, exclude=None):
+    """Raise ScheduleConflict if a template occurrence assigned to the user overlaps the given times.
+
+    ``exclude`` is a ``(template_id, date)`` occurrence to leave out, e.g.
+    the one being materialized.
+    """
+    if user_id is None:
+        return
+    for shift in assigned_occurrences({user_id}, start_time, end_time)[user_id]:
+        if (shift.template_id, shift.occurrence_date) != exclude:
+            raise ScheduleConflict(
+                f'The employee already has a recurring shift overlapping this time on {shift.occurrence_date}.'
+            )
+
+
+def check_template(template):
+    """Raise ScheduleConflict if an occurrence of ``template`` clashes with its employee's shifts or approved PTO.
+
+    Only the employee's shifts and PTO on or after ``starts_on`` (and up to
+    ``ends_on``) are compared, so open-ended templates are checked too.
+    """
+    if template.user_id is None:
+        return
+    shifts = Shift.objects.filter(user_id=template.user_id, end_time__gt=day_start(template.starts_on))
+    pto = PTORequest.objects.filter(user_id=template.user_id, status='approved', end_date__gte=template.starts_on)
+    if template.ends_on is not None:
+        shifts = shifts.filter(start_time__lt=day_start(template.ends_on + timedelta(days=2)))
+        pto = pto.filter(start_date__lte=template.ends_on + timedelta(days=1))
+    materialized = set(Shift.objects.filter(template=template).values_list('occurrence_date', flat=True))
+
+    def occurrences(first, last):
+        for day in occurrence_dates(template, first, last):
+            if day not in materialized:
+                yield occurrence(template, day)
+
+    for start_time, end_time in shifts.values_list('start_time', 'end_time'):
+        for shift in occurrences(*expansion_dates(start_time, end_time)):
+            if shift.start_time < end_time and shift.end_time > start_time:
+                raise ScheduleConflict(
+                    f'The employee already has a shift overlapping the occurrence on {shift.occurrence_date}.'
+                )
+    for start_date, end_date in pto.values_list('start_date', 'end_date'):
+        for shift in occurrences(start_date - timedelta(days=1), end_date):
+            if timezone.localdate(shift.end_time - timedelta(microseconds=1)) >= start_date:
+                raise ScheduleConflict(
+                    f'The employee has approved PTO from {start_date} to {end_date}, '
+                    f'during the occurrence on {shift.occurrence_date}.'
+                )
+
+
+def find_conflicts(shifts):
+    """Report double-bookings among ``shifts``.
+
+    Returns ``(overlaps, pto)``: shifts overlapping an unmaterialized
+    occurrence of a template assigned to the same employee, and shifts that
+    fall inside one of their employee's approved PTO ranges. Two shifts of
+    one employee cannot overlap; the exclusion constraint rejects that.
+    Occurrences are expanded for at most ``MAX_EXPANDED_DAYS`` around the
+    shifts.
+    """
+    assigned = list(shifts.filter(user__isnull=False).values_list('id', 'user_id', 'start_time', 'end_time'))
+    overlaps = []
+    if assigned:
+        start = min(start_time for _, _, start_time, _ in assigned)
+        end = max(end_time for _, _, _, end_time in assigned)
+        if end - start > timedelta(days=MAX_EXPANDED_DAYS):
+            raise ValidationError({'start_time__lt': [
+                f'Narrow the shifts to at most {MAX_EXPANDED_DAYS} days with start_time__gte and start_time__lt'
+            ]})
+        busy = assigned_occurrences({user_id for _, user_id, _, _ in assigned}, start, end)
+        for shift_id, user_id, start_time, end_time in assigned:
+            for occurrence in busy[user_id]:
+                if occurrence.start_time < end_time and occurrence.end_time > start_time:
+                    overlaps.append((shift_id, occurrence.template_id, occurrence.occurrence_date, user_id))
+
+    pto = shifts.annotate(
+        first_day=TruncDate('start_time'),
+        last_day=TruncDate(ExpressionWrapper(
+            F('end_time') - timedelta(microseconds=1), output_field=DateTimeField()
+        )),
+    ).filter(
+        user__ptorequest__status='approved',
+        user__ptorequest__start_date__lte=F('last_day'),
+        user__ptorequest__end_date__gte=F('first_day'),
+    ).values_list('id', 'user__ptorequest__id', 'user_id')
+
+    return (
+        [
+            {'shift_id': shift_id, 'template_id': template_id, 'occurrence_date': day, 'user_id': user_id}
+            for shift_id, template_id, day, user_id in sorted(overlaps)
+        ],
+        [{'shift_id': shift_id, 'pto_request_id': pto_id, 'user_id': user_id} for shift_id, pto_id, user_id in pto],
+    )
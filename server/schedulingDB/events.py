@@ -0,0 +1,214 @@
+"""Change events pushed to clients: ``GET /api/events/`` (Server-Sent Events).
+
+Saves and deletes of shifts, swaps and PTO requests, including bulk shift
+writes, publish a compact event once their transaction commits::
+
+    {"type": "shift", "action": "changed", "ids": [12, 13]}
+
+Events carry no row data. A client refetches the rows, or calls the sync
+endpoint, on receipt. Each event goes to the channels of the users and
+locations it affects, before and after the write, and to ``all``:
+
+- ``user:<id>``: the assignee of a shift, both sides of a swap, the
+  requester of a PTO request.
+- ``location:<name>``: the location of a shift, or of a swapped shift.
+- ``all``: every event.
+
+Everyone is subscribed to their own user channel. Admins and managers
+also get the locations in ``?location=`` (repeatable), or ``all`` without
+one.
+
+The broker is ``settings.EVENTS_BROKER``. ``InProcessBroker`` only reaches
+the streams of this process. A shared broker (Redis pub/sub, Postgres
+LISTEN/NOTIFY) drops in with the same ``subscribe(channels)`` and
+``publish(channels, event)`` methods. A subscription whose queue fills
+up gets a ``resync`` event instead of the events it missed.
+
+Streams need the ASGI server (``uvicorn main.asgi:application``). Each
+one ends after ``EVENTS_STREAM_SECONDS`` and the browser's EventSource
+reconnects, so streams of vanished clients do not pile up.
+"""
+import asyncio
+import functools
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import Shift, PTORequest, ShiftSwap
+
+ALL = 'all'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def location_channel(location):
+    return f'location:{location}'
+
+
+class Subscription:
+    """Events for one stream, queued on the event loop that subscribed."""
+
+    def __init__(self, broker, channels, max_queued):
+        self.broker = broker
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(max_queued)
+        self.overflowed = False
+
+    def deliver(self, event):
+        """Queue ``event``; safe to call from any thread."""
+        try:
+            self.loop.call_soon_threadsafe(self.put, event)
+        except RuntimeError:
+            # The loop is closed; its stream is gone.
+            self.close()
+
+    def put(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Replace the backlog with one event telling the client to reload.
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({'type': 'resync'})
+
+    async def get(self):
+        event = await self.queue.get()
+        if event.get('type') == 'resync':
+            self.overflowed = False
+        return event
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Fans events out to the subscriptions of this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, set(channels), settings.EVENTS_QUEUE_SIZE)
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscriptions[channel].discard(subscription)
+                if not self.subscriptions[channel]:
+                    del self.subscriptions[channel]
+
+    def publish(self, channels, event):
+        """Deliver ``event`` once to every subscription on any of ``channels``."""
+        with self.lock:
+            targets = set().union(*(self.subscriptions.get(channel, ()) for channel in channels))
+        for subscription in targets:
+            subscription.deliver(event)
+
+
+@functools.lru_cache(maxsize=None)
+def broker():
+    return import_string(settings.EVENTS_BROKER)()
+
+
+def shift_channels(shift):
+    users = {shift.user_id, shift.loaded_value('user_id')}
+    locations = {shift.location, shift.loaded_value('location')}
+    return (
+        {user_channel(user_id) for user_id in users if user_id is not None}
+        | {location_channel(location) for location in locations if location}
+    )
+
+
+def swap_channels(swap):
+    users = {swap.from_user_id, swap.to_user_id, swap.loaded_value('to_user_id')}
+    if ShiftSwap.shift.is_cached(swap):
+        locations = [swap.shift.location]
+    else:
+        locations = Shift.objects.filter(pk=swap.shift_id).values_list('location', flat=True)
+    return (
+        {user_channel(user_id) for user_id in users if user_id is not None}
+        | {location_channel(location) for location in locations}
+    )
+
+
+def pto_channels(pto_request):
+    users = {pto_request.user_id, pto_request.loaded_value('user_id')}
+    return {user_channel(user_id) for user_id in users if user_id is not None}
+
+
+# Model -> (event type, channels of an instance).
+PUBLISHED = {
+    Shift: ('shift', shift_channels),
+    ShiftSwap: ('shift_swap', swap_channels),
+    PTORequest: ('pto_request', pto_channels),
+}
+
+
+def publish_changes(model, instances, action='changed'):
+    """Publish ``action`` on ``instances`` once the current transaction commits.
+
+    Instances routed to the same channels share one event. Channels are
+    worked out now, while the values loaded before the write are known.
+    """
+    kind, channels_of = PUBLISHED[model]
+    ids = defaultdict(list)
+    for instance in instances:
+        ids[frozenset(channels_of(instance) | {ALL})].append(instance.pk)
+    if not ids:
+        return
+
+    def publish():
+        for channels, pks in ids.items():
+            broker().publish(channels, {'type': kind, 'action': action, 'ids': sorted(pks)})
+
+    transaction.on_commit(publish)
+
+
+def subscription_channels(user, locations):
+    channels = {user_channel(user.id)}
+    if user.role in ['admin', 'manager']:
+        channels |= {location_channel(location) for location in locations} if locations else {ALL}
+    return channels
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def stream(channels):
+    """Server-Sent Events from ``channels``, with keepalive comments, for ``EVENTS_STREAM_SECONDS``.
+
+    The subscription starts with the first chunk, so a response that is
+    never sent leaves nothing subscribed.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.EVENTS_STREAM_SECONDS
+    subscription = broker().subscribe(channels)
+    try:
+        yield f'retry: {settings.EVENTS_RETRY_MS}\n\n'
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                event = await asyncio.wait_for(
+                    subscription.get(), min(settings.EVENTS_KEEPALIVE_SECONDS, remaining)
+                )
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(event)
+    finally:
+        subscription.close()
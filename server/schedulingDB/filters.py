@@ -0,0 +1,49 @@
+import django_filters
+from .models import Shift, Availability, PTORequest
+
+
+class ShiftFilter(django_filters.FilterSet):
+    # ?location=X&start_time__gte=<monday>&start_time__lt=<next monday> is
+    # served by the (location, start_time) index.
+    class Meta:
+        model = Shift
+        fields = {
+            'user': ['exact'],
+            'role': ['exact'],
+            'location': ['exact'],
+            'start_time': ['gte', 'lt'],
+            'end_time': ['gt', 'lte'],
+        }
+
+
+class AvailabilityFilter(django_filters.FilterSet):
+    class Meta:
+        model = Availability
+        fields = {
+            'user': ['exact'],
+            'date': ['exact', 'gte', 'lte'],
+            'is_available': ['exact'],
+        }
+
+
+class PTORequestFilter(django_filters.FilterSet):
+    # PTO overlapping [A, B]: ?start_date__lte=B&end_date__gte=A
+    class Meta:
+        model = PTORequest
+        fields = {
+            'user': ['exact'],
+            'status': ['exact'],
+            'type': ['exact'],
+            'start_date': ['gte', 'lte'],
+            'end_date': ['gte', 'lte'],
+        }
+
+
+# The async views validate filters inside the event loop, where the
+# ModelChoiceFilter that backs ``user`` would run a synchronous query.
+class AsyncShiftFilter(ShiftFilter):
+    user = django_filters.NumberFilter(field_name='user_id')
+
+
+class AsyncAvailabilityFilter(AvailabilityFilter):
+    user = django_filters.NumberFilter(field_name='user_id')
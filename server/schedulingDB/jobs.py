@@ -0,0 +1,144 @@
+"""A small database-backed job queue.
+
+Request handlers ``enqueue`` a ``Job`` row in their own transaction and
+return at once. ``manage.py run_jobs`` claims due jobs in batches with
+``SELECT ... FOR UPDATE SKIP LOCKED``, so several workers can run side
+by side. It hands each kind's batch to its handler in one call; emails are
+all sent over a single SMTP connection.
+
+A claimed job is leased until ``run_at`` (now + ``LEASE``). Handlers
+renew the lease of their batch as they go, so a slow batch is not claimed
+again mid-run. If a worker dies mid-batch, the job becomes claimable
+again once the lease runs out. Failed jobs are retried with exponential
+backoff, and after ``max_attempts`` tries they are marked failed.
+
+Finished jobs are deleted after ``JOBS_RETENTION_DAYS``, since payloads
+can hold secrets such as password reset links.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Job
+
+LEASE = timedelta(minutes=5)
+RETENTION = timedelta(days=settings.JOBS_RETENTION_DAYS)
+RETRY_BASE = timedelta(seconds=30)
+RETRY_MAX = timedelta(hours=1)
+MAX_ERROR_LENGTH = 2000
+
+
+def enqueue(kind, payload, run_at=None, max_attempts=5):
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind {kind!r}')
+    return Job.objects.create(kind=kind, payload=payload, run_at=run_at or timezone.now(), max_attempts=max_attempts)
+
+
+def enqueue_email(subject, body, to, from_email=None):
+    return enqueue('email', {
+        'subject': subject,
+        'body': body,
+        'from_email': from_email or settings.DEFAULT_FROM_EMAIL,
+        'to': list(to),
+    })
+
+
+def renew_lease(jobs):
+    """Extend the lease of ``jobs`` once half of it is spent."""
+    now = timezone.now()
+    if not jobs or min(job.run_at for job in jobs) - now > LEASE / 2:
+        return
+    run_at = now + LEASE
+    Job.objects.filter(pk__in=[job.id for job in jobs], status='running').update(run_at=run_at)
+    for job in jobs:
+        job.run_at = run_at
+
+
+def send_emails(jobs):
+    """Send every email job over one SMTP connection.
+
+    Returns ``{job_id: error}`` for the messages that failed; if the
+    connection itself cannot be opened, that error is raised instead.
+    """
+    errors = {}
+    with get_connection() as connection:
+        for job in jobs:
+            try:
+                EmailMessage(connection=connection, **job.payload).send()
+            except Exception as exc:
+                errors[job.id] = exc
+            # The whole batch stays unfinished until ``finish``.
+            renew_lease(jobs)
+    return errors
+
+
+# kind -> handler taking a list of jobs and returning {job_id: error}.
+HANDLERS = {
+    'email': send_emails,
+}
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+
+
+def claim(batch_size):
+    """Lease up to ``batch_size`` due jobs to the calling worker."""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status__in=['pending', 'running'], run_at__lte=now)
+            .order_by('run_at')[:batch_size]
+        )
+        for job in jobs:
+            job.status = 'running'
+            job.attempts += 1
+            job.run_at = now + LEASE
+        Job.objects.bulk_update(jobs, ['status', 'attempts', 'run_at'])
+    return jobs
+
+
+def finish(jobs, errors):
+    now = timezone.now()
+    for job in jobs:
+        error = errors.get(job.id)
+        if error is None:
+            job.status, job.finished_at = 'done', now
+            continue
+        job.last_error = f'{type(error).__name__}: {error}'[:MAX_ERROR_LENGTH]
+        if job.attempts >= job.max_attempts:
+            job.status, job.finished_at = 'failed', now
+        else:
+            job.status, job.run_at = 'pending', now + retry_delay(job.attempts)
+    Job.objects.bulk_update(jobs, ['status', 'run_at', 'last_error', 'finished_at'])
+
+
+def run_batch(batch_size=100):
+    """Claim and run one batch of due jobs; returns how many were claimed."""
+    jobs = claim(batch_size)
+    by_kind = defaultdict(list)
+    for job in jobs:
+        by_kind[job.kind].append(job)
+    for kind, batch in by_kind.items():
+        handler = HANDLERS.get(kind)
+        try:
+            if handler is None:
+                raise LookupError(f'No handler for job kind {kind!r}')
+            errors = handler(batch)
+        except Exception as exc:
+            errors = {job.id: exc for job in batch}
+        finish(batch, errors)
+    return len(jobs)
+
+
+def purge_finished():
+    """Delete done and failed jobs older than ``RETENTION``; returns how many."""
+    deleted, _ = Job.objects.filter(
+        status__in=['done', 'failed'], finished_at__lt=timezone.now() - RETENTION
+    ).delete()
+    return deleted
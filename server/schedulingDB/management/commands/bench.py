@@ -0,0 +1,69 @@
+import json
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from schedulingDB import benchmark
+from schedulingDB.models import User
+from schedulingDB.roster import week_of
+
+
+class Command(BaseCommand):
+    help = "Benchmark every GET endpoint: latency percentiles, throughput and query counts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Username to request as (default: the first admin).")
+        parser.add_argument('--requests', type=int, default=20, help="Measured requests per endpoint.")
+        parser.add_argument('--warmup', type=int, default=2, help="Unmeasured requests per endpoint.")
+        parser.add_argument('--cold', action='store_true', help="Clear the caches before every request.")
+        parser.add_argument('--location', help="Location for windowed endpoints (default: the busiest).")
+        parser.add_argument('--week', type=date.fromisoformat, help="Any day of the week to query (default: this week).")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--baseline', help="Fail on regressions against this earlier --output file.")
+        parser.add_argument('--tolerance', type=float, default=1.25, help="Allowed p95 growth over the baseline.")
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError("--requests must be positive.")
+        users = User.objects.order_by('id')
+        user = users.filter(username=options['user']).first() if options['user'] else users.filter(role='admin').first()
+        if user is None:
+            raise CommandError("No such user; create one or run manage.py seed first.")
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as exc:
+                raise CommandError(exc)
+
+        location = options['location'] or benchmark.busiest_location()
+        week = week_of(options['week'] or timezone.localdate())
+        # The test client calls itself "testserver".
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            results = benchmark.run(
+                benchmark.endpoints(location, week), user,
+                requests=options['requests'], warmup=options['warmup'], cold=options['cold'],
+            )
+
+        self.stdout.write(f"{'endpoint':<36} {'p50 ms':>9} {'p95 ms':>9} {'req/s':>8} {'queries':>8}  statuses")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<36} {result['latency_ms']['p50']:>9.1f} {result['latency_ms']['p95']:>9.1f} "
+                f"{result['throughput_rps']:>8.1f} {result['queries']:>8}  {result['statuses']}"
+            )
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+
+        failed = [name for name, result in results.items() if set(result['statuses']) != {'200'}]
+        if failed:
+            raise CommandError(f"Non-200 responses from {', '.join(failed)}")
+        if baseline is not None:
+            regressions = benchmark.compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n" + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from schedulingDB.availability_import import import_availability
+
+
+class Command(BaseCommand):
+    help = "Bulk upsert availability from a CSV file (user_id or username, date, is_available)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--dry-run', action='store_true', help="Validate and report without saving.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+                result = import_availability(lines, dry_run=options['dry_run'])
+        except OSError as exc:
+            raise CommandError(exc)
+
+        for reject in result.rejected:
+            self.stderr.write(f"line {reject['line']}: {reject['error']}")
+        if result.rejected_count > len(result.rejected):
+            self.stderr.write(f"... and {result.rejected_count - len(result.rejected)} more rejected rows")
+        verb = 'Would import' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result.created} new and {result.updated} updated rows; {result.rejected_count} rejected."
+        ))
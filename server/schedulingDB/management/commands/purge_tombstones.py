@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from schedulingDB.sync import purge_tombstones
+
+
+class Command(BaseCommand):
+    help = "Delete sync tombstones older than SYNC_TOMBSTONE_DAYS; run it daily."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Deleted {purge_tombstones()} tombstones")
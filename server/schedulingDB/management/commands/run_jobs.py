@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from schedulingDB.jobs import purge_finished, run_batch
+
+# Seconds between purges of finished jobs.
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (emails and notifications) until stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when no job is due.")
+        parser.add_argument('--once', action='store_true', help="Run the due jobs once and exit.")
+
+    def handle(self, *args, **options):
+        last_purge = None
+        while True:
+            # Drop connections the database closed or that outlived CONN_MAX_AGE,
+            # as Django does around each request.
+            close_old_connections()
+            if last_purge is None or time.monotonic() - last_purge >= PURGE_INTERVAL:
+                purged = purge_finished()
+                if purged:
+                    self.stdout.write(f"Deleted {purged} finished jobs")
+                last_purge = time.monotonic()
+            claimed = run_batch(options['batch_size'])
+            if claimed:
+                self.stdout.write(f"Ran {claimed} jobs")
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['sleep'])
@@ -0,0 +1,43 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from schedulingDB.models import User
+from schedulingDB.seed import seed
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic users, shifts, availability, PTO and swaps for load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--days', type=int, default=365, help="Days of availability and shifts.")
+        parser.add_argument('--start', type=date.fromisoformat, help="First day (default: half the range before today).")
+        parser.add_argument('--locations', type=int, default=8)
+        parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed gives the same data.")
+        parser.add_argument('--prefix', default='seed', help="Username prefix of the generated users.")
+        parser.add_argument('--password', default='password', help="Password of every generated user.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['days'] < 1 or options['locations'] < 1:
+            raise CommandError("--users, --days and --locations must be positive.")
+        if User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f"Users named {options['prefix']}* already exist; pick another --prefix.")
+
+        def progress(done, total):
+            self.stdout.write(f"{done}/{total} employees")
+
+        result = seed(
+            users=options['users'],
+            days=options['days'],
+            first=options['start'],
+            locations=options['locations'],
+            seed=options['seed'],
+            prefix=options['prefix'],
+            password=options['password'],
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+        counts = ', '.join(f"{count} {name.replace('_', ' ')}" for name, count in result.as_dict().items())
+        self.stdout.write(self.style.SUCCESS(f"Created {counts}. Admin login: {options['prefix']}00000"))
@@ -0,0 +1,204 @@
+"""Per-request latency and SQL instrumentation.
+
+``MetricsMiddleware`` times every request and, through a database
+execute wrapper, counts its SQL queries and the time they take. It also
+times serializer ``.data`` evaluation. Every response gets a
+``Server-Timing`` header. Each endpoint (method plus URL name, e.g.
+``GET shift-list``) keeps a rolling window of samples that
+``GET /api/_metrics/`` reports as percentiles. Requests slower than
+``METRICS_SLOW_MS`` are logged, sampled at ``METRICS_SLOW_SAMPLE_RATE``,
+to the ``schedulingDB.metrics`` logger along with their slowest
+statements.
+
+Per-request state lives in a context variable, so the same code covers
+sync views and async views whose queries run in ``sync_to_async``
+threads. With ``METRICS_ENABLED`` off the middleware removes itself at
+startup and nothing is installed.
+
+Numbers are per process. Each worker reports its own.
+"""
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+MAX_RECORDED_STATEMENTS = 100
+SLOW_LOG_STATEMENTS = 5
+PERCENTILES = (50, 90, 95, 99)
+
+current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'queries', 'sql_time', 'serializer_time', 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.statements = []
+
+
+def record_sql(execute, sql, params, many, context):
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        metrics.queries += 1
+        metrics.sql_time += duration
+        if len(metrics.statements) < MAX_RECORDED_STATEMENTS:
+            metrics.statements.append((duration, sql))
+
+
+def add_wrapper(connection, **kwargs):
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+def timed_data(data):
+    def wrapper(self):
+        metrics = current.get()
+        if metrics is None:
+            return data.fget(self)
+        started = time.perf_counter()
+        try:
+            return data.fget(self)
+        finally:
+            metrics.serializer_time += time.perf_counter() - started
+    wrapper.instrumented = True
+    return property(wrapper)
+
+
+def install():
+    """Hook SQL execution and serializer output; idempotent."""
+    connection_created.connect(add_wrapper, dispatch_uid='schedulingDB.metrics')
+    for connection in connections.all(initialized_only=True):
+        add_wrapper(connection)
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(cls.data.fget, 'instrumented', False):
+            cls.data = timed_data(cls.data)
+
+
+class EndpointStats:
+    """Rolling samples of (total, sql, serializer) milliseconds and query counts per endpoint."""
+
+    def __init__(self, window):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+        self.counts = defaultdict(int)
+
+    def record(self, endpoint, total_ms, sql_ms, serializer_ms, queries):
+        with self.lock:
+            self.samples[endpoint].append((total_ms, sql_ms, serializer_ms, queries))
+            self.counts[endpoint] += 1
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.counts.clear()
+
+    @staticmethod
+    def percentiles(values):
+        values = sorted(values)
+        return {
+            f'p{p}': round(values[min(len(values) - 1, len(values) * p // 100)], 2)
+            for p in PERCENTILES
+        }
+
+    def snapshot(self):
+        with self.lock:
+            samples = {endpoint: list(rows) for endpoint, rows in self.samples.items()}
+            counts = dict(self.counts)
+        report = {}
+        for endpoint, rows in sorted(samples.items()):
+            total, sql, serializer, queries = zip(*rows)
+            report[endpoint] = {
+                'requests': counts[endpoint],
+                'window': len(rows),
+                'latency_ms': self.percentiles(total),
+                'sql_ms': self.percentiles(sql),
+                'serializer_ms': self.percentiles(serializer),
+                'queries': self.percentiles(queries),
+            }
+        return report
+
+
+stats = EndpointStats(settings.METRICS_WINDOW)
+
+
+def endpoint_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    return f'{request.method} {match.view_name}'
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        install()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        total_ms = (time.perf_counter() - metrics.started) * 1000
+        sql_ms, serializer_ms = metrics.sql_time * 1000, metrics.serializer_time * 1000
+        response['Server-Timing'] = (
+            f'app;dur={total_ms:.1f}, db;dur={sql_ms:.1f};desc="{metrics.queries} queries", '
+            f'ser;dur={serializer_ms:.1f}'
+        )
+        endpoint = endpoint_name(request)
+        if endpoint is None:
+            return response
+        stats.record(endpoint, total_ms, sql_ms, serializer_ms, metrics.queries)
+        if total_ms >= settings.METRICS_SLOW_MS and random.random() < settings.METRICS_SLOW_SAMPLE_RATE:
+            slowest = sorted(metrics.statements, reverse=True)[:SLOW_LOG_STATEMENTS]
+            logger.warning(
+                'Slow request %s %s: %.1f ms, %d queries in %.1f ms, serializers %.1f ms\n%s',
+                endpoint, request.get_full_path(), total_ms, metrics.queries, sql_ms, serializer_ms,
+                '\n'.join(f'  {duration * 1000:.1f} ms: {sql}' for duration, sql in slowest),
+            )
+        return response
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.4 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedulingDB', '0002_passwordresettoken'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='availability',
+            index=models.Index(fields=['user', 'date'], name='availability_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ptorequest',
+            index=models.Index(fields=['user', 'status', 'start_date'], name='pto_user_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(fields=['user', 'start_time'], name='shift_user_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(fields=['location', 'start_time'], name='shift_location_start_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.4 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedulingDB', '0003_shift_availability_pto_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='availability',
+            index=models.Index(fields=['date', 'id'], name='availability_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ptorequest',
+            index=models.Index(fields=['start_date', 'id'], name='pto_start_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(fields=['start_time', 'id'], name='shift_start_id_idx'),
+        ),
+    ]
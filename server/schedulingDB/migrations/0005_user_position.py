@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedulingDB', '0004_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='position',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
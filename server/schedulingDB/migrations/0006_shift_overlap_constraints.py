@@ -0,0 +1,64 @@
+# Generated by Django 4.0.4 on 2026-10-18 11:31
+
+import django.contrib.postgres.constraints
+import django.contrib.postgres.fields.ranges
+from django.db import migrations, models
+import django.db.models.expressions
+import schedulingDB.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedulingDB', '0005_user_position'),
+    ]
+
+    operations = [
+        # Make existing rows satisfy both constraints before they are added:
+        # a shift ending less than a day before it starts was entered without
+        # rolling its end over midnight and gets a day added; any other shift
+        # ending at or before its start is deleted, with its swap requests.
+        # Foreign keys are checked per statement, so no deferred trigger
+        # events are left pending when the table is altered below.
+        migrations.RunSQL('SET CONSTRAINTS ALL IMMEDIATE', migrations.RunSQL.noop),
+        migrations.RunSQL(
+            """
+            UPDATE "schedulingDB_shift" SET end_time = end_time + interval '1 day'
+            WHERE end_time < start_time AND end_time + interval '1 day' > start_time
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            """
+            DELETE FROM "schedulingDB_shiftswap"
+            WHERE shift_id IN (SELECT id FROM "schedulingDB_shift" WHERE end_time <= start_time)
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            'DELETE FROM "schedulingDB_shift" WHERE end_time <= start_time',
+            migrations.RunSQL.noop,
+        ),
+        # Where an employee holds overlapping shifts, keep the one starting
+        # first (lowest id on a tie) and leave every later one open.
+        migrations.RunSQL(
+            """
+            UPDATE "schedulingDB_shift" s SET user_id = NULL
+            WHERE s.user_id IS NOT NULL AND EXISTS (
+                SELECT 1 FROM "schedulingDB_shift" o
+                WHERE o.user_id = s.user_id
+                AND o.start_time < s.end_time AND o.end_time > s.start_time
+                AND (o.start_time, o.id) < (s.start_time, s.id)
+            )
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='shift',
+            constraint=models.CheckConstraint(check=models.Q(('end_time__gt', django.db.models.expressions.F('start_time'))), name='shift_ends_after_start'),
+        ),
+        migrations.AddConstraint(
+            model_name='shift',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(condition=models.Q(('user__isnull', False)), expressions=[(schedulingDB.models.Int8Range('user', 'user', django.contrib.postgres.fields.ranges.RangeBoundary(inclusive_upper=True)), '&&'), (schedulingDB.models.TsTzRange('start_time', 'end_time', django.contrib.postgres.fields.ranges.RangeBoundary()), '&&')], name='shift_no_user_overlap'),
+        ),
+    ]
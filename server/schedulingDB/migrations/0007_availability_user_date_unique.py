@@ -0,0 +1,30 @@
+# Generated by Django 4.0.4 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedulingDB', '0006_shift_overlap_constraints'),
+    ]
+
+    operations = [
+        # Keep the newest row where a user has several for the same day.
+        migrations.RunSQL(
+            """
+            DELETE FROM "schedulingDB_availability" a
+            USING "schedulingDB_availability" b
+            WHERE a.user_id = b.user_id AND a.date = b.date AND a.id < b.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='availability',
+            constraint=models.UniqueConstraint(fields=('user', 'date'), name='availability_user_date_unique'),
+        ),
+        migrations.RemoveIndex(
+            model_name='availability',
+            name='availability_user_date_idx',
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.0.4 on 2026-10-18 11:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedulingDB', '0007_availability_user_date_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilityMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('known', models.IntegerField(default=0)),
+                ('available', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='availabilitymonth',
+            index=models.Index(fields=['month', 'user'], name='availability_month_month_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='availabilitymonth',
+            constraint=models.UniqueConstraint(fields=('user', 'month'), name='availability_month_user_month_unique'),
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO "schedulingDB_availabilitymonth" (user_id, month, known, available)
+            SELECT user_id, date_trunc('month', date)::date,
+                   bit_or(1 << (extract(day FROM date)::int - 1)),
+                   coalesce(bit_or(1 << (extract(day FROM date)::int - 1)) FILTER (WHERE is_available), 0)
+            FROM "schedulingDB_availability"
+            GROUP BY 1, 2
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
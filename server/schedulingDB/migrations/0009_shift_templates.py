@@ -0,0 +1,54 @@
+# Generated by Django 4.0.4 on 2026-10-18 11:42
+
+from django.conf import settings
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedulingDB', '0008_availabilitymonth'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShiftTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(max_length=100)),
+                ('location', models.CharField(max_length=100)),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('weekdays', django.contrib.postgres.fields.ArrayField(base_field=models.PositiveSmallIntegerField(), size=None)),
+                ('interval_weeks', models.PositiveSmallIntegerField(choices=[(1, 'Weekly'), (2, 'Biweekly')], default=1)),
+                ('starts_on', models.DateField()),
+                ('ends_on', models.DateField(blank=True, null=True)),
+                ('exceptions', django.contrib.postgres.fields.ArrayField(base_field=models.DateField(), blank=True, default=list, size=None)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='shift',
+            name='occurrence_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='shifttemplate',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='shift',
+            name='template',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='shifts', to='schedulingDB.shifttemplate'),
+        ),
+        migrations.AddConstraint(
+            model_name='shift',
+            constraint=models.UniqueConstraint(fields=('template', 'occurrence_date'), name='shift_template_occurrence_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='shifttemplate',
+            index=models.Index(fields=['location', 'starts_on'], name='template_location_start_idx'),
+        ),
+    ]
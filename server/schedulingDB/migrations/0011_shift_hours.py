@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_shift_hours(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO "schedulingDB_shifthours" (day, location, role, user_id, shifts, duration) '
+            'SELECT (start_time AT TIME ZONE %s)::date, location, role, user_id, count(*), sum(end_time - start_time) '
+            'FROM "schedulingDB_shift" GROUP BY 1, 2, 3, 4',
+            [settings.TIME_ZONE],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedulingDB', '0010_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShiftHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('location', models.CharField(max_length=100)),
+                ('role', models.CharField(max_length=100)),
+                ('shifts', models.PositiveIntegerField()),
+                ('duration', models.DurationField()),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['location', 'day'], name='shift_hours_location_day_idx'), models.Index(fields=['day'], name='shift_hours_day_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_shift_hours, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models import F, Q
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import ArrayField, BigIntegerRangeField, DateTimeRangeField, RangeBoundary, RangeOperators
 from django.utils import timezone
 
 class User(AbstractUser):
@@ -9,30 +12,184 @@ class User(AbstractUser):
         ('manager', 'Manager'),
     )
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='employee')
+    # The shift role this employee works (matched against Shift.role); blank means any.
+    position = models.CharField(max_length=100, blank=True)
 
     def __str__(self):
         return self.username
 
 
-class Shift(models.Model):
+class TsTzRange(models.Func):
+    function = 'TSTZRANGE'
+    output_field = DateTimeRangeField()
+
+
+class Int8Range(models.Func):
+    function = 'INT8RANGE'
+    output_field = BigIntegerRangeField()
+
+
+class TracksLoadedValues:
+    """Remember the column values an instance was loaded with.
+
+    Signal handlers use this to also invalidate whatever the row looked
+    like before it was changed (e.g. the week a shift was moved out of).
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def loaded_value(self, attname):
+        return getattr(self, '_loaded_values', {}).get(attname, getattr(self, attname))
+
+
+class ShiftTemplate(TracksLoadedValues, models.Model):
+    """A shift that repeats on ``weekdays`` every ``interval_weeks`` weeks.
+
+    Occurrences are expanded on read (see ``templates.py``). One only gets
+    a Shift row, linked back through ``template`` and ``occurrence_date``,
+    once it is edited or assigned.
+    """
+    INTERVAL_CHOICES = (
+        (1, 'Weekly'),
+        (2, 'Biweekly'),
+    )
+
+    # Assignee of every occurrence; empty for open shifts.
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    role = models.CharField(max_length=100)
+    location = models.CharField(max_length=100)
+    start_time = models.TimeField()
+    # An end at or before the start means the shift ends the next day.
+    end_time = models.TimeField()
+    # 0 is Monday.
+    weekdays = ArrayField(models.PositiveSmallIntegerField())
+    interval_weeks = models.PositiveSmallIntegerField(choices=INTERVAL_CHOICES, default=1)
+    # Biweekly templates repeat in the week of starts_on and every other week after it.
+    starts_on = models.DateField()
+    ends_on = models.DateField(null=True, blank=True)
+    # Dates with no occurrence, e.g. holidays or a deleted occurrence.
+    exceptions = ArrayField(models.DateField(), default=list, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['location', 'starts_on'], name='template_location_start_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.role} at {self.location} {self.start_time}-{self.end_time}"
+
+class Shift(TracksLoadedValues, models.Model):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
     role = models.CharField(max_length=100)
     location = models.CharField(max_length=100)
+    # Set on shifts materialized from a template occurrence.
+    template = models.ForeignKey(ShiftTemplate, on_delete=models.SET_NULL, null=True, blank=True, related_name='shifts')
+    occurrence_date = models.DateField(null=True, blank=True)
+    # Bulk writes must set it themselves; see sync.py.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'start_time'], name='shift_user_start_idx'),
+            models.Index(fields=['updated_at'], name='shift_updated_idx'),
+            models.Index(fields=['location', 'start_time'], name='shift_location_start_idx'),
+            models.Index(fields=['start_time', 'id'], name='shift_start_id_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(check=Q(end_time__gt=F('start_time')), name='shift_ends_after_start'),
+            models.UniqueConstraint(fields=['template', 'occurrence_date'], name='shift_template_occurrence_unique'),
+            # GiST-backed: no employee can hold two overlapping shifts, even
+            # when two transactions assign them concurrently. user_id is
+            # compared as the range [user_id, user_id] so the constraint
+            # needs no btree_gist extension.
+            ExclusionConstraint(
+                name='shift_no_user_overlap',
+                expressions=[
+                    (Int8Range('user', 'user', RangeBoundary(inclusive_upper=True)), RangeOperators.OVERLAPS),
+                    (TsTzRange('start_time', 'end_time', RangeBoundary()), RangeOperators.OVERLAPS),
+                ],
+                condition=Q(user__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user} - {self.start_time} to {self.end_time}"
 
-class Availability(models.Model):
+class ShiftHours(models.Model):
+    """Scheduled shifts and hours per local day, location, role and employee.
+
+    A rollup of Shift kept current by ``analytics.refresh_shift_hours``. A
+    shift counts in full towards the day it starts on. There may be more
+    than one row per key (e.g. after an employee is deleted), so always
+    read it through ``Sum``.
+    """
+    day = models.DateField()
+    location = models.CharField(max_length=100)
+    role = models.CharField(max_length=100)
+    # Empty for open shifts.
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    shifts = models.PositiveIntegerField()
+    duration = models.DurationField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['location', 'day'], name='shift_hours_location_day_idx'),
+            models.Index(fields=['day'], name='shift_hours_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.location} {self.day} {self.role}: {self.duration}"
+
+class Availability(TracksLoadedValues, models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     date = models.DateField()
     is_available = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'id'], name='availability_date_id_idx'),
+            models.Index(fields=['updated_at'], name='availability_updated_idx'),
+        ]
+        constraints = [
+            # One row per user per day; also the conflict target of the bulk import upsert.
+            models.UniqueConstraint(fields=['user', 'date'], name='availability_user_date_unique'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.date} - {'Available' if self.is_available else 'Unavailable'}"
 
-class PTORequest(models.Model):
+class AvailabilityMonth(models.Model):
+    """One user's availability for one calendar month, packed into bitmaps.
+
+    Bit ``d - 1`` stands for day ``d`` of the month: ``known`` has it set
+    when an Availability row exists for that day, ``available`` when that
+    row says the user is available. Kept in sync with Availability by
+    ``availability_bitmap.refresh_months``.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    month = models.DateField()
+    known = models.IntegerField(default=0)
+    available = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='availability_month_user_month_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['month', 'user'], name='availability_month_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.month:%Y-%m}"
+
+class PTORequest(TracksLoadedValues, models.Model):
     PTO_TYPE = (
         ('vacation', 'Vacation'),
         ('sick', 'Sick'),
@@ -50,19 +207,52 @@ class PTORequest(models.Model):
     type = models.CharField(max_length=20, choices=PTO_TYPE)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     reason = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status', 'start_date'], name='pto_user_status_start_idx'),
+            models.Index(fields=['updated_at'], name='pto_updated_idx'),
+            models.Index(fields=['start_date', 'id'], name='pto_start_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} PTO: {self.start_date} to {self.end_date} ({self.status})"
 
-class ShiftSwap(models.Model):
+class ShiftSwap(TracksLoadedValues, models.Model):
     shift = models.ForeignKey(Shift, on_delete=models.CASCADE)
     from_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='shift_swap_from')
     to_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='shift_swap_to', null=True, blank=True)
     status = models.CharField(max_length=20, choices=PTORequest.STATUS_CHOICES, default='pending')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='shift_swap_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.from_user.username} swap request for shift {self.shift.id} ({self.status})"
 
+class Tombstone(models.Model):
+    """A synced row that was deleted, or that left some employees' view; see sync.py."""
+    # Sync name of the model, e.g. "shifts".
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    # Employees who could see the row; the only ones told about it unless ``deleted``.
+    user_ids = ArrayField(models.BigIntegerField(), default=list, blank=True)
+    # False when the row still exists but no longer belongs to ``user_ids``.
+    deleted = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='tombstone_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} ({'deleted' if self.deleted else 'moved'})"
+
 class PasswordResetToken(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     token = models.CharField(max_length=100, unique=True)
@@ -75,3 +265,34 @@ class PasswordResetToken(models.Model):
 
     def is_valid(self):
         return not self.is_used and timezone.now() < self.expires_at
+
+class Job(models.Model):
+    """A unit of background work, run by ``manage.py run_jobs``; see jobs.py."""
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # When a pending job may next run, or when a running job's lease expires.
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['run_at'], name='job_runnable_idx',
+                condition=Q(status__in=['pending', 'running']),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} ({self.status})"
@@ -0,0 +1,105 @@
+"""Opt-in normalized responses: ``?format=normalized``, ``?include=`` and ``?fields=``.
+
+By default every shift in a list nests its whole user and every swap a
+shift and two users, so one employee is serialized again for each of
+their rows. With ``?format=normalized`` (or ``Accept:
+application/vnd.schedule.normalized+json``) ``list`` and ``retrieve``
+return related objects as ids instead::
+
+    {"count": 2, "next": null, "previous": null,
+     "results": [{"id": 12, "user": 5, ...}, {"id": 13, "user": 5, ...}],
+     "included": {"users": {"5": {"id": 5, "username": "ann", ...}}}}
+
+``?include=user`` (and ``shift``, for swaps; comma-separated) adds each
+related object once under ``included``, keyed by id; included shifts
+refer to their users by id too. A detail response gets ``included`` as
+an extra key. Without ``include`` no related rows are loaded at all.
+
+``?fields=id,start_time,user`` returns only the named fields of the rows,
+in either format; ``id`` is always kept.
+"""
+from rest_framework import renderers
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+
+from .serializers import ResponseOptionsQuerySerializer, ShiftSerializer, UserSerializer
+
+# kind -> (key under "included", serializer). Shifts come first so the users
+# of included shifts are collected before users are serialized.
+INCLUDED = {
+    'shift': ('shifts', ShiftSerializer),
+    'user': ('users', UserSerializer),
+}
+
+
+class NormalizedJSONRenderer(renderers.JSONRenderer):
+    media_type = 'application/vnd.schedule.normalized+json'
+    format = 'normalized'
+
+
+class NormalizedResponseMixin:
+    """Response options for ``list`` and ``retrieve``; see the module docstring.
+
+    List it after ``ConditionalGetMixin`` or ``CachedResponseMixin`` in the
+    bases, so the responses they tag and cache are the normalized ones.
+    """
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NormalizedJSONRenderer]
+    _response_options = None
+
+    def response_options(self):
+        """The serializer context entries for this request, or None when it has no options."""
+        if self.action not in ['list', 'retrieve']:
+            return None
+        if self._response_options is None:
+            query = ResponseOptionsQuerySerializer(data=self.request.query_params)
+            query.is_valid(raise_exception=True)
+            params = query.validated_data
+            unknown = set(params['fields']) - set(self.get_serializer_class()().fields)
+            if unknown:
+                raise ValidationError({'fields': [f"Unknown field(s) {', '.join(sorted(unknown))}"]})
+            normalized = self.request.accepted_renderer.format == NormalizedJSONRenderer.format
+            self._response_options = {
+                'normalized': normalized,
+                'fields': params['fields'],
+                # kind -> {id: instance}, filled in while the rows are serialized.
+                'included': {kind: {} for kind in INCLUDED if kind in params['include']} if normalized else {},
+            }
+        return self._response_options
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        options = self.response_options()
+        if options and options['normalized'] and not options['included']:
+            # Related objects are only written as ids.
+            return queryset.select_related(None)
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context.update(self.response_options() or {})
+        return context
+
+    def included_data(self):
+        included = self.response_options()['included']
+        context = dict(self.get_serializer_context(), fields=[])
+        data = {}
+        for kind, (key, serializer_class) in INCLUDED.items():
+            if kind in included:
+                objects = list(included[kind].values())
+                rows = serializer_class(objects, many=True, context=context).data
+                data[key] = {instance.pk: row for instance, row in zip(objects, rows)}
+        return data
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        options = self.response_options()
+        if options and options['included']:
+            response.data['included'] = self.included_data()
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        options = self.response_options()
+        if options and options['included']:
+            response.data = dict(response.data, included=self.included_data())
+        return response
@@ -0,0 +1,48 @@
+"""Emails sent to users, queued through jobs.py so requests never wait on SMTP."""
+from django.utils import timezone
+
+from .jobs import enqueue_email
+
+
+def password_reset(user, reset_url):
+    return enqueue_email(
+        'Password Reset Request',
+        f'Click the following link to reset your password: {reset_url}\n\n'
+        f'This link will expire in 24 hours.\n\n'
+        f'If you did not request this password reset, please ignore this email.',
+        [user.email],
+        from_email='noreply@yourdomain.com',
+    )
+
+
+def shift_line(shift):
+    start, end = timezone.localtime(shift.start_time), timezone.localtime(shift.end_time)
+    return f'- {shift.role} at {shift.location} from {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}'
+
+
+def pto_decided(pto_request, released=(), release=None):
+    """``released`` are the shifts taken off the employee (``release='unassign'``) or offered up for swaps."""
+    user = pto_request.user
+    if not user.email:
+        return None
+    body = (
+        f'Your {pto_request.get_type_display().lower()} request for '
+        f'{pto_request.start_date:%Y-%m-%d} to {pto_request.end_date:%Y-%m-%d} was {pto_request.status}.'
+    )
+    if released:
+        action = 'offered for swaps' if release == 'swap' else 'unassigned from you'
+        body += f'\n\nThese shifts were {action}:\n' + '\n'.join(shift_line(shift) for shift in released)
+    return enqueue_email(f'PTO request {pto_request.status}', body, [user.email])
+
+
+def swap_requested(swap):
+    if swap.to_user is None or not swap.to_user.email:
+        return None
+    shift = swap.shift
+    start, end = timezone.localtime(shift.start_time), timezone.localtime(shift.end_time)
+    return enqueue_email(
+        'Shift swap request',
+        f'{swap.from_user.username} asked you to take their {shift.role} shift at {shift.location} '
+        f'from {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}.',
+        [swap.to_user.email],
+    )
@@ -0,0 +1,75 @@
+from functools import partial
+
+from django.core.paginator import Paginator
+from django.db.models import QuerySet
+from rest_framework import pagination
+
+
+class KeysetPagination(pagination.CursorPagination):
+    """Cursor pagination over the view's ``cursor_ordering``.
+
+    No COUNT(*) and no OFFSET scan: every page is an index range scan
+    starting after the last key of the previous one.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        return view.cursor_ordering
+
+
+class KnownCountPaginator(Paginator):
+    """A Paginator told the row count up front, so it does not run a COUNT."""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.__dict__['count'] = count
+
+
+class SchedulePageNumberPagination(pagination.PageNumberPagination):
+    """Page-number pagination reusing the view's ``known_count``, when it has one, for the filtered queryset."""
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if isinstance(queryset, QuerySet):
+            if not queryset.ordered:
+                queryset = queryset.order_by(*view.cursor_ordering)
+            count = getattr(view, 'known_count', None)
+            if count is not None:
+                self.django_paginator_class = partial(KnownCountPaginator, count=count)
+        return super().paginate_queryset(queryset, request, view)
+
+
+class SchedulePagination(pagination.BasePagination):
+    """Page-number pagination by default, keyset pagination with ``?pagination=cursor``.
+
+    Views using it declare ``cursor_ordering``, a tuple of indexed fields
+    ending in a unique one, e.g. ``('start_time', 'id')``.
+    """
+    mode_query_param = 'pagination'
+
+    def __init__(self):
+        self.paginator = SchedulePageNumberPagination()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.mode_query_param) == 'cursor':
+            self.paginator = KeysetPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.paginator.get_paginated_response_schema(schema)
+
+    @property
+    def display_page_controls(self):
+        return self.paginator.display_page_controls
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_schema_operation_parameters(self, view):
+        return self.paginator.get_schema_operation_parameters(view)
@@ -0,0 +1,171 @@
+"""Approving and rejecting PTO requests, one or many at a time.
+
+``decide`` locks the requests, sets their status with one ``bulk_update``
+and, on approval, releases the employees' shifts inside the approved
+days. Those shifts are found with one range query on the GiST index of
+the shift overlap constraint. They are either unassigned with one more
+``bulk_update`` (``release='unassign'``) or left assigned with an open
+swap request each (``release='swap'``), created with one ``bulk_create``.
+Template occurrences assigned to the employees inside those days are
+materialized first (with one ``bulk_create``), so they are released the
+same way instead of staying on the employee through their template. The
+employee's decision email lists what was released.
+Everything runs in one transaction and then sends the bulk signals, so
+rosters, the hours rollup, sync and change events stay correct.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.contrib.postgres.fields import RangeBoundary
+from django.db import transaction
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange, NumericRange
+from django.db.models import Q
+
+from .models import Shift, ShiftTemplate, PTORequest, ShiftSwap, Int8Range, TsTzRange
+from .roster import day_start
+from .signals import pto_bulk_decided, shifts_bulk_changed, swaps_bulk_changed
+from .sync import touch
+from .templates import expand
+from . import notifications
+
+UNASSIGN = 'unassign'
+SWAP = 'swap'
+RELEASE_CHOICES = (UNASSIGN, SWAP)
+
+
+class DecisionResult:
+    def __init__(self, status, release):
+        self.status = status
+        self.release = release
+        self.pto_requests = []
+        # (shift, previous user id, PTO request, swap or None)
+        self.released = []
+
+    def released_shifts(self):
+        return [
+            {
+                'shift_id': shift.id,
+                'template_id': shift.template_id,
+                'user_id': user_id,
+                'pto_request_id': pto_request.id,
+                'swap_id': swap.id if swap else None,
+            }
+            for shift, user_id, pto_request, swap in self.released
+        ]
+
+    def as_dict(self):
+        return {
+            'status': self.status,
+            'release': self.release,
+            'pto_requests': [pto_request.id for pto_request in self.pto_requests],
+            'released_shifts': self.released_shifts(),
+        }
+
+
+def pto_window(pto_request):
+    return day_start(pto_request.start_date), day_start(pto_request.end_date + timedelta(days=1))
+
+
+def overlapping_shifts(pto_requests):
+    """One query for the shifts of the requesting employees that overlap their requests."""
+    windows = Q()
+    for pto_request in pto_requests:
+        windows |= Q(
+            assignee__overlap=NumericRange(pto_request.user_id, pto_request.user_id, '[]'),
+            span__overlap=DateTimeTZRange(*pto_window(pto_request)),
+        )
+    # The same expressions as the overlap constraint, so its GiST index answers the query.
+    return Shift.objects.annotate(
+        assignee=Int8Range('user', 'user', RangeBoundary(inclusive_upper=True)),
+        span=TsTzRange('start_time', 'end_time', RangeBoundary()),
+    ).filter(windows, user__isnull=False)
+
+
+def materialize_occurrences(pto_requests):
+    """Create the Shift rows of the employees' template occurrences that overlap their requests.
+
+    The rows keep the employee, so ``release_shifts`` finds and releases
+    them with the other shifts.
+    """
+    windows = {pto_request: pto_window(pto_request) for pto_request in pto_requests}
+    start = min(window[0] for window in windows.values())
+    end = max(window[1] for window in windows.values())
+    # Locked like templates.materialize does, so a concurrent materialization waits.
+    templates = ShiftTemplate.objects.select_for_update().filter(
+        user_id__in={pto_request.user_id for pto_request in pto_requests}
+    ).order_by('id')
+    occurrences = [
+        shift for shift in expand(templates, start - timedelta(days=1), end)
+        if any(
+            pto_request.user_id == shift.user_id and shift.start_time < window[1] and shift.end_time > window[0]
+            for pto_request, window in windows.items()
+        )
+    ]
+    return Shift.objects.bulk_create(occurrences)
+
+
+def release_shifts(pto_requests, release, result):
+    by_user = defaultdict(list)
+    for pto_request in pto_requests:
+        by_user[pto_request.user_id].append(pto_request)
+    materialized = materialize_occurrences(pto_requests)
+    shifts = list(overlapping_shifts(pto_requests).select_for_update().order_by('start_time', 'id'))
+    if not shifts:
+        return
+
+    released, swaps = [], []
+    for shift in shifts:
+        pto_request = next(
+            pto_request for pto_request in by_user[shift.user_id]
+            if shift.start_time < pto_window(pto_request)[1] and shift.end_time > pto_window(pto_request)[0]
+        )
+        swap = None
+        if release == SWAP:
+            swap = ShiftSwap(shift=shift, from_user_id=shift.user_id, status='pending')
+            swaps.append(swap)
+        released.append((shift, shift.user_id, pto_request, swap))
+
+    if release == SWAP:
+        # Shifts that already have a pending swap keep that one.
+        pending = set(ShiftSwap.objects.filter(
+            shift__in=shifts, status='pending'
+        ).values_list('shift_id', flat=True))
+        released = [row for row in released if row[0].id not in pending]
+        swaps = ShiftSwap.objects.bulk_create([swap for swap in swaps if swap.shift_id not in pending])
+        swaps_bulk_changed.send(sender=ShiftSwap, swaps=swaps)
+        if materialized:
+            shifts_bulk_changed.send(sender=Shift, shifts=materialized)
+    else:
+        for shift in shifts:
+            shift.user = None
+        touch(shifts)
+        Shift.objects.bulk_update(shifts, ['user', 'updated_at'])
+        shifts_bulk_changed.send(sender=Shift, shifts=shifts)
+    result.released = released
+
+
+def decide(pto_requests, status, release=UNASSIGN):
+    """Give the PTO requests in the queryset ``pto_requests`` ``status``; returns a ``DecisionResult``.
+
+    Approving releases the overlapping shifts as described above;
+    rejecting leaves shifts alone.
+    """
+    result = DecisionResult(status, release if status == 'approved' else None)
+    with transaction.atomic():
+        decided = list(pto_requests.select_for_update(of=('self',)).select_related('user').order_by('id'))
+        if not decided:
+            return result
+        for pto_request in decided:
+            pto_request.status = status
+        touch(decided)
+        PTORequest.objects.bulk_update(decided, ['status', 'updated_at'])
+        if status == 'approved':
+            release_shifts(decided, release, result)
+        pto_bulk_decided.send(sender=PTORequest, pto_requests=decided)
+        released = defaultdict(list)
+        for shift, user_id, pto_request, swap in result.released:
+            released[pto_request.id].append(shift)
+        for pto_request in decided:
+            notifications.pto_decided(pto_request, released[pto_request.id], result.release)
+    result.pto_requests = decided
+    return result
@@ -0,0 +1,236 @@
+"""Versioned response cache for read-heavy viewsets.
+
+Every cached model has a version token, stored in the response cache and
+replaced by signal handlers whenever a row of that model changes. A
+viewset's cache key combines the action, URL arguments and query string,
+the caller's role and scope, and the current versions of every model its
+serializer reads. A write therefore makes all stale keys unreachable at
+once. Eviction of those keys is left to the backend's MAX_ENTRIES and
+TIMEOUT.
+
+The same viewsets answer conditional GETs (``ConditionalGetMixin``). Their
+``list`` and ``retrieve`` responses carry a strong ``ETag``, plus a
+``Last-Modified`` when the model has an ``updated_at``, and a matching
+``If-None-Match`` gets a bodyless 304 before anything is serialized. The
+tag is not a hash of the body. A list is tagged with ``max(updated_at)``
+and the row count of the filtered queryset, from one aggregate query: an
+insert or update moves the first, a delete the second. A detail view is
+tagged with its object's ``updated_at``. Models whose rows only appear
+nested, or that have no ``updated_at``, are covered by their versions
+above. Only ``If-None-Match`` is honoured, since a delete does not move
+``Last-Modified``. Keyset pages get no validators: they exist to avoid
+counting the filtered set.
+"""
+import hashlib
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils.http import http_date, parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .pagination import SchedulePagination
+
+
+def response_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def version_key(model):
+    return f'version:{model._meta.label_lower}'
+
+
+def model_versions(models):
+    cache = response_cache()
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(model):
+    """Replace ``model``'s version now and again once the surrounding transaction commits.
+
+    A read racing the write can take the first new version while it still
+    sees the old rows; the second bump makes what it cached unreachable.
+    """
+    key = version_key(model)
+    response_cache().set(key, uuid.uuid4().hex, None)
+    transaction.on_commit(lambda: response_cache().set(key, uuid.uuid4().hex, None))
+
+
+class CacheStats:
+    """Per-process hit/miss counters, keyed by viewset basename."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def record(self, name, hit):
+        with self.lock:
+            (self.hits if hit else self.misses)[name] += 1
+
+    def snapshot(self):
+        with self.lock:
+            names = sorted(set(self.hits) | set(self.misses))
+            hits, misses = sum(self.hits.values()), sum(self.misses.values())
+            return {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else None,
+                'views': {name: {'hits': self.hits[name], 'misses': self.misses[name]} for name in names},
+            }
+
+
+stats = CacheStats()
+
+
+def etag_matches(request, etag):
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return '*' in etags or any((tag[2:] if tag.startswith('W/') else tag) == etag for tag in etags)
+
+
+def with_validators(response, etag, last_modified):
+    if etag is not None:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = last_modified
+    return response
+
+
+def not_modified(etag, last_modified):
+    return with_validators(Response(status=status.HTTP_304_NOT_MODIFIED), etag, last_modified)
+
+
+class ConditionalGetMixin:
+    """Tag ``list`` and ``retrieve`` responses and answer ``If-None-Match`` with 304.
+
+    ``etag_models`` names the models whose rows appear in the response but
+    do not move the listed model's ``updated_at``: nested models, and the
+    listed model itself when it has no ``updated_at``. Tags are scoped like
+    response-cache entries (see ``CachedResponseMixin``).
+    """
+    etag_models = ()
+    cache_per_user_roles = ('employee',)
+    conditional_object = None
+
+    def cache_scope(self, request):
+        if request.user.role in self.cache_per_user_roles:
+            return f'{request.user.role}:{request.user.id}'
+        return request.user.role
+
+    def conditional_validators(self, request):
+        """``(etag, last_modified)`` for this request, or None when it is not tagged."""
+        if request.query_params.get(SchedulePagination.mode_query_param) == 'cursor':
+            return None
+        model = self.queryset.model
+        if self.action == 'retrieve':
+            self.conditional_object = self.get_object()
+            count, last_modified = 1, getattr(self.conditional_object, 'updated_at', None)
+        else:
+            queryset = self.filter_queryset(self.get_queryset())
+            if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+                row = queryset.aggregate(count=Count('pk'), last_modified=Max('updated_at'))
+                count, last_modified = row['count'], row['last_modified']
+            else:
+                count, last_modified = queryset.count(), None
+            # Lets the paginator skip its own COUNT.
+            self.known_count = count
+        parts = [
+            self.basename,
+            self.action,
+            repr(sorted(self.kwargs.items())),
+            repr(sorted(request.query_params.lists())),
+            request.accepted_renderer.format,
+            self.cache_scope(request),
+            str(count),
+            last_modified.isoformat() if last_modified else '',
+            *model_versions(self.etag_models),
+        ]
+        etag = quote_etag(hashlib.sha1('|'.join(parts).encode()).hexdigest())
+        return etag, http_date(last_modified.timestamp()) if last_modified else None
+
+    def conditional_response(self, request, render):
+        validators = self.conditional_validators(request)
+        if validators is None:
+            return render()
+        if etag_matches(request, validators[0]):
+            return not_modified(*validators)
+        response = render()
+        if response.status_code == 200:
+            with_validators(response, *validators)
+        return response
+
+    def get_object(self):
+        # retrieve() reuses the object the validators were computed from.
+        if self.conditional_object is not None:
+            return self.conditional_object
+        return super().get_object()
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+
+class CachedResponseMixin(ConditionalGetMixin):
+    """Serve ``list`` and ``retrieve`` from the response cache.
+
+    ``cache_models`` names every model whose rows appear in the response,
+    including nested ones. Roles in ``cache_per_user_roles`` see data that
+    depends on who they are (a narrowed ``get_queryset`` or object-level
+    permissions), so they get per-user entries; other roles share one.
+    """
+    cache_models = ()
+
+    def response_cache_key(self, request):
+        parts = [
+            self.basename,
+            self.action,
+            repr(sorted(self.kwargs.items())),
+            repr(sorted(request.query_params.lists())),
+            # Renderers may be picked by Accept alone, and some change the data (see normalized.py).
+            request.accepted_renderer.format,
+            self.cache_scope(request),
+            *model_versions(self.cache_models),
+        ]
+        return 'response:3:' + hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+    def cached_response(self, request, render):
+        """``render()`` through the response cache; entries keep the validators of the response."""
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return self.conditional_response(request, render)
+        cache = response_cache()
+        key = self.response_cache_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            stats.record(self.basename, hit=True)
+            etag, last_modified, data = entry
+            if etag is not None and etag_matches(request, etag):
+                return not_modified(etag, last_modified)
+            return with_validators(Response(data), etag, last_modified)
+        stats.record(self.basename, hit=False)
+        response = self.conditional_response(request, render)
+        if response.status_code == 200:
+            cache.set(key, (response.get('ETag'), response.get('Last-Modified'), response.data))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
@@ -0,0 +1,180 @@
+"""Precomputed weekly roster grids.
+
+A roster is every shift at one location in one week (Monday to Sunday),
+grouped by employee and day, including the not yet materialized
+occurrences of shift templates. Grids are cached per (location, week) and
+are deleted by the signal handlers in ``signals.py`` whenever a shift,
+PTO request or swap that appears in them changes, so repeat reads never
+touch the database. A template can touch any week, so template changes
+replace a per-location token that is part of every key instead.
+"""
+import uuid
+from datetime import datetime, time, timedelta
+from urllib.parse import quote
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Shift, ShiftTemplate, PTORequest, ShiftSwap
+from .templates import aexpand, expand
+
+ROSTER_TIMEOUT = 60 * 60 * 24
+
+
+def week_of(day):
+    return day - timedelta(days=day.weekday())
+
+
+def week_of_datetime(value):
+    return week_of(timezone.localtime(value).date())
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def template_token_key(location):
+    return f'roster-templates:{quote(location)}'
+
+
+def template_tokens(locations):
+    keys = {location: template_token_key(location) for location in set(locations)}
+    tokens = cache.get_many(keys.values())
+    return {location: tokens.get(key, '') for location, key in keys.items()}
+
+
+def roster_key(location, week, token=''):
+    return f'roster:{quote(location)}:{week.isoformat()}:{token}'
+
+
+def roster_shifts(location, week):
+    start = day_start(week)
+    return Shift.objects.filter(
+        location=location, start_time__gte=start, start_time__lt=start + timedelta(days=7)
+    ).select_related('user').annotate(
+        swap_pending=Exists(ShiftSwap.objects.filter(shift=OuterRef('pk'), status='pending'))
+    ).order_by('start_time', 'id')
+
+
+def roster_templates(location, week):
+    return ShiftTemplate.objects.filter(location=location, starts_on__lte=week + timedelta(days=7)).exclude(
+        ends_on__lt=week - timedelta(days=1)
+    ).select_related('user')
+
+
+def roster_pto(rows, week):
+    return PTORequest.objects.filter(
+        user_id__in=rows, status='approved', start_date__lte=week + timedelta(days=6), end_date__gte=week
+    ).values_list('user_id', 'start_date', 'end_date')
+
+
+def roster_rows(week, shifts):
+    """Group ``shifts`` (rows and occurrences) into ``(rows, open_shifts)`` by employee and day."""
+    rows = {}
+    open_shifts = [[] for _ in range(7)]
+    for shift in sorted(shifts, key=lambda shift: (shift.start_time, shift.id or 0)):
+        cell = {
+            'id': shift.id,
+            'start': shift.start_time.isoformat(),
+            'end': shift.end_time.isoformat(),
+            'role': shift.role,
+            'template': shift.template_id,
+            'swap_pending': getattr(shift, 'swap_pending', False),
+        }
+        day = (timezone.localtime(shift.start_time).date() - week).days
+        if shift.user is None:
+            open_shifts[day].append(cell)
+            continue
+        row = rows.get(shift.user_id)
+        if row is None:
+            row = rows[shift.user_id] = {
+                'id': shift.user_id,
+                'username': shift.user.username,
+                'days': [[] for _ in range(7)],
+                'pto': [],
+            }
+        row['days'][day].append(cell)
+    return rows, open_shifts
+
+
+def roster_grid(location, week, rows, open_shifts, pto):
+    days = [week + timedelta(days=i) for i in range(7)]
+    for user_id, start_date, end_date in pto:
+        for i, day in enumerate(days):
+            if start_date <= day <= end_date and i not in rows[user_id]['pto']:
+                rows[user_id]['pto'].append(i)
+    return {
+        'location': location,
+        'week': week.isoformat(),
+        'days': [day.isoformat() for day in days],
+        'employees': sorted(rows.values(), key=lambda row: row['username']),
+        'open_shifts': open_shifts,
+    }
+
+
+def build_roster(location, week):
+    start = day_start(week)
+    occurrences = expand(roster_templates(location, week), start, start + timedelta(days=7))
+    rows, open_shifts = roster_rows(week, [*roster_shifts(location, week), *occurrences])
+    return roster_grid(location, week, rows, open_shifts, roster_pto(rows, week))
+
+
+async def abuild_roster(location, week):
+    """``build_roster`` on the async ORM."""
+    start = day_start(week)
+    occurrences = await aexpand(roster_templates(location, week), start, start + timedelta(days=7))
+    shifts = [shift async for shift in roster_shifts(location, week)]
+    rows, open_shifts = roster_rows(week, [*shifts, *occurrences])
+    pto = [row async for row in roster_pto(rows, week)]
+    return roster_grid(location, week, rows, open_shifts, pto)
+
+
+def get_roster(location, week):
+    key = roster_key(location, week, template_tokens([location])[location])
+    roster = cache.get(key)
+    if roster is None:
+        roster = build_roster(location, week)
+        cache.set(key, roster, ROSTER_TIMEOUT)
+    return roster
+
+
+async def aget_roster(location, week):
+    key = roster_key(location, week, await cache.aget(template_token_key(location), ''))
+    roster = await cache.aget(key)
+    if roster is None:
+        roster = await abuild_roster(location, week)
+        await cache.aset(key, roster, ROSTER_TIMEOUT)
+    return roster
+
+
+def invalidate_rosters(buckets):
+    """Drop the cached grids for an iterable of ``(location, week)`` pairs.
+
+    Keys are deleted now and again once the surrounding transaction
+    commits, so a read racing the write cannot re-cache the old grid.
+    """
+    buckets = set(buckets)
+    if not buckets:
+        return
+    tokens = template_tokens(location for location, _ in buckets)
+    keys = [roster_key(location, week, tokens[location]) for location, week in buckets]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_template_rosters(locations):
+    """Drop every cached grid of ``locations`` by replacing their template tokens.
+
+    Like ``invalidate_rosters``, tokens are replaced now and again on commit.
+    """
+    keys = [template_token_key(location) for location in set(locations)]
+    if not keys:
+        return
+
+    def replace():
+        cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+    replace()
+    transaction.on_commit(replace)
@@ -0,0 +1,219 @@
+"""Synthetic scheduling data at production scale, for ``manage.py seed``.
+
+Users are created first (one admin, a manager for every ``MANAGER_EVERY``
+users, the rest employees with a home location and a position). Then
+employees are processed in groups. Each one gets a year of daily
+availability, a few PTO requests, a regular weekly pattern of shifts
+(two fixed days off, a usual start hour, full or part time) on the days
+they are available and not on approved PTO, and swap requests for a small
+share of those shifts. Every location also gets a few open shifts per day.
+
+Everything is written with ``bulk_create``. Each group runs in its own
+transaction and then sends the bulk-change signals, so availability
+bitmaps, cached rosters and response-cache versions stay correct. A fixed
+``seed`` always generates the same data.
+"""
+import random
+from datetime import datetime, time, timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .models import User, Shift, Availability, PTORequest, ShiftSwap
+from .response_cache import bump_version
+from .roster import week_of
+from .signals import availability_bulk_changed, shifts_bulk_changed
+
+MANAGER_EVERY = 40
+USERS_PER_GROUP = 200
+PART_TIME_RATE = 0.2
+AWAY_RATE = 0.1
+UNAVAILABLE_RATE = 0.08
+SKIPPED_SHIFT_RATE = 0.05
+SWAP_RATE = 0.01
+OPEN_SWAP_RATE = 0.2
+MAX_OPEN_SHIFTS_PER_DAY = 3
+
+
+class Distribution:
+    """Weighted random choice over ``(value, weight)`` pairs."""
+
+    def __init__(self, *pairs):
+        self.values = [value for value, weight in pairs]
+        self.cum_weights = list(accumulate(weight for value, weight in pairs))
+
+    def pick(self, rng):
+        return rng.choices(self.values, cum_weights=self.cum_weights)[0]
+
+
+POSITIONS = Distribution(('cashier', 40), ('stocker', 25), ('cook', 20), ('supervisor', 10), ('driver', 5))
+START_HOURS = Distribution((6, 20), (7, 15), (9, 25), (12, 15), (14, 15), (16, 7), (22, 3))
+PTO_COUNTS = Distribution((0, 30), (1, 35), (2, 20), (3, 10), (4, 5))
+PTO_TYPES = Distribution(('vacation', 60), ('sick', 30), ('other', 10))
+PTO_LENGTHS = {'vacation': (1, 10), 'sick': (1, 3), 'other': (1, 2)}
+STATUSES = Distribution(('approved', 70), ('pending', 20), ('rejected', 10))
+
+
+class SeedResult:
+    def __init__(self):
+        self.users = self.shifts = self.availability = self.pto_requests = self.swaps = 0
+
+    def as_dict(self):
+        return {
+            'users': self.users,
+            'shifts': self.shifts,
+            'availability': self.availability,
+            'pto_requests': self.pto_requests,
+            'swaps': self.swaps,
+        }
+
+
+def location_names(count):
+    return [f'store-{number:02d}' for number in range(1, count + 1)]
+
+
+def wall_clock(day, hour, hours=0):
+    """Aware datetime ``hours`` after ``hour`` o'clock on ``day``, in local wall-clock time."""
+    return timezone.make_aware(datetime.combine(day, time(hour)) + timedelta(hours=hours))
+
+
+def create_users(count, rng, prefix, password, batch_size):
+    hashed = make_password(password)
+    users = []
+    for number in range(count):
+        role = 'admin' if number == 0 else 'manager' if number % MANAGER_EVERY == 1 else 'employee'
+        users.append(User(
+            username=f'{prefix}{number:05d}',
+            email=f'{prefix}{number:05d}@example.com',
+            password=hashed,
+            role=role,
+            position=POSITIONS.pick(rng) if role == 'employee' else '',
+        ))
+    return User.objects.bulk_create(users, batch_size=batch_size)
+
+
+def pto_requests(user, first, days, rng):
+    requests = []
+    for _ in range(PTO_COUNTS.pick(rng)):
+        kind = PTO_TYPES.pick(rng)
+        start = first + timedelta(days=rng.randrange(days))
+        length = rng.randint(*PTO_LENGTHS[kind])
+        requests.append(PTORequest(
+            user=user,
+            start_date=start,
+            end_date=start + timedelta(days=length - 1),
+            type=kind,
+            status=STATUSES.pick(rng),
+        ))
+    return requests
+
+
+def employee_schedule(user, home, locations, first, days, rng):
+    """The availability, PTO requests and shifts of one employee."""
+    pto = pto_requests(user, first, days, rng)
+    on_pto = {
+        request.start_date + timedelta(days=offset)
+        for request in pto if request.status == 'approved'
+        for offset in range((request.end_date - request.start_date).days + 1)
+    }
+    days_off = set(rng.sample(range(7), 2))
+    start_hour = START_HOURS.pick(rng)
+    hours = rng.choice((4, 6)) if rng.random() < PART_TIME_RATE else 8
+
+    availability, shifts = [], []
+    for offset in range(days):
+        day = first + timedelta(days=offset)
+        available = day not in on_pto and rng.random() >= UNAVAILABLE_RATE
+        availability.append(Availability(user=user, date=day, is_available=available))
+        if not available or day.weekday() in days_off or rng.random() < SKIPPED_SHIFT_RATE:
+            continue
+        shifts.append(Shift(
+            user=user,
+            start_time=wall_clock(day, start_hour),
+            end_time=wall_clock(day, start_hour, hours),
+            role=user.position,
+            location=home if rng.random() >= AWAY_RATE else rng.choice(locations),
+        ))
+    return availability, pto, shifts
+
+
+def swap_requests(shifts, coworkers, rng):
+    swaps = []
+    for shift in shifts:
+        if rng.random() >= SWAP_RATE:
+            continue
+        candidates = [user for user in coworkers[shift.location] if user.id != shift.user_id]
+        to_user = None if not candidates or rng.random() < OPEN_SWAP_RATE else rng.choice(candidates)
+        swaps.append(ShiftSwap(shift=shift, from_user=shift.user, to_user=to_user, status=STATUSES.pick(rng)))
+    return swaps
+
+
+def open_shifts(locations, first, days, rng):
+    shifts = []
+    for location in locations:
+        for offset in range(days):
+            day = first + timedelta(days=offset)
+            for _ in range(rng.randint(0, MAX_OPEN_SHIFTS_PER_DAY)):
+                start_hour = START_HOURS.pick(rng)
+                shifts.append(Shift(
+                    start_time=wall_clock(day, start_hour),
+                    end_time=wall_clock(day, start_hour, 8),
+                    role=POSITIONS.pick(rng),
+                    location=location,
+                ))
+    return shifts
+
+
+def seed(users=10000, days=365, first=None, locations=8, seed=0, prefix='seed', password='password',
+         batch_size=5000, progress=None):
+    """Generate a dataset; ``progress(done, total)`` is called after each group of employees."""
+    rng = random.Random(seed)
+    first = first or week_of(timezone.localdate() - timedelta(days=days // 2))
+    last = first + timedelta(days=days - 1)
+    locations = location_names(locations)
+    result = SeedResult()
+
+    with transaction.atomic():
+        people = create_users(users, rng, prefix, password, batch_size)
+    bump_version(User)
+    result.users = len(people)
+
+    employees = [user for user in people if user.role == 'employee']
+    homes = {user.id: rng.choice(locations) for user in employees}
+    coworkers = {location: [] for location in locations}
+    for user in employees:
+        coworkers[homes[user.id]].append(user)
+
+    for start in range(0, len(employees), USERS_PER_GROUP):
+        group = employees[start:start + USERS_PER_GROUP]
+        availability, pto, shifts = [], [], []
+        for user in group:
+            user_availability, user_pto, user_shifts = employee_schedule(
+                user, homes[user.id], locations, first, days, rng
+            )
+            availability += user_availability
+            pto += user_pto
+            shifts += user_shifts
+        with transaction.atomic():
+            Availability.objects.bulk_create(availability, batch_size=batch_size)
+            PTORequest.objects.bulk_create(pto, batch_size=batch_size)
+            Shift.objects.bulk_create(shifts, batch_size=batch_size)
+            swaps = ShiftSwap.objects.bulk_create(swap_requests(shifts, coworkers, rng), batch_size=batch_size)
+            availability_bulk_changed.send(
+                sender=Availability, user_ids=[user.id for user in group], first_date=first, last_date=last
+            )
+            shifts_bulk_changed.send(sender=Shift, shifts=shifts)
+        result.availability += len(availability)
+        result.pto_requests += len(pto)
+        result.shifts += len(shifts)
+        result.swaps += len(swaps)
+        if progress:
+            progress(start + len(group), len(employees))
+
+    with transaction.atomic():
+        shifts = Shift.objects.bulk_create(open_shifts(locations, first, days, rng), batch_size=batch_size)
+        shifts_bulk_changed.send(sender=Shift, shifts=shifts)
+    result.shifts += len(shifts)
+    return result
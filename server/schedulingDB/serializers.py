@@ -1,12 +1,49 @@
 from rest_framework import serializers
-from .models import User, Shift, Availability, PTORequest, ShiftSwap, PasswordResetToken
+from .models import User, Shift, ShiftTemplate, Availability, PTORequest, ShiftSwap, PasswordResetToken
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 
-class UserSerializer(serializers.ModelSerializer):
+class RelatedIdField(serializers.Field):
+    """A nested object written as its id; noted in ``context['included']`` when its kind is included."""
+
+    def __init__(self, kind, **kwargs):
+        self.kind = kind
+        super().__init__(read_only=True, **kwargs)
+
+    def get_attribute(self, instance):
+        if self.kind not in self.context['included']:
+            return getattr(instance, f'{self.source}_id')
+        related = super().get_attribute(instance)
+        if related is None:
+            return None
+        self.context['included'][self.kind][related.pk] = related
+        return related.pk
+
+    def to_representation(self, value):
+        return value
+
+class ResponseOptionsMixin:
+    """Apply the response options a view puts in the context (see normalized.py).
+
+    With ``normalized``, nested objects become ``RelatedIdField`` ids; with
+    ``fields``, only those fields and ``id`` are returned.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.context.get('normalized'):
+            for name, field in list(self.fields.items()):
+                if isinstance(field, serializers.ModelSerializer):
+                    source = field.source if field.source != name else None
+                    self.fields[name] = RelatedIdField(field.Meta.model._meta.model_name, source=source)
+        if self.context.get('fields'):
+            for name in set(self.fields) - set(self.context['fields']) - {'id'}:
+                self.fields.pop(name)
+
+class UserSerializer(ResponseOptionsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'role']
+        fields = ['id', 'username', 'email', 'role', 'position']
 
 class PasswordResetRequestSerializer(serializers.Serializer):
     email = serializers.EmailField()
@@ -25,7 +62,7 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
             raise serializers.ValidationError({'password': list(e.messages)})
         return data
 
-class ShiftSerializer(serializers.ModelSerializer):
+class ShiftSerializer(ResponseOptionsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     user_id = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all(), source='user', write_only=True
@@ -33,9 +70,46 @@ class ShiftSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Shift
-        fields = ['id', 'user', 'user_id', 'start_time', 'end_time', 'role', 'location']
+        fields = ['id', 'user', 'user_id', 'start_time', 'end_time', 'role', 'location', 'template', 'occurrence_date', 'updated_at']
+        read_only_fields = ['template', 'occurrence_date']
+
+    def validate(self, data):
+        start_time = data.get('start_time', getattr(self.instance, 'start_time', None))
+        end_time = data.get('end_time', getattr(self.instance, 'end_time', None))
+        if start_time and end_time and end_time <= start_time:
+            raise serializers.ValidationError("end_time must be after start_time")
+        return data
+
+class ShiftTemplateSerializer(ResponseOptionsMixin, serializers.ModelSerializer):
+    user = UserSerializer(read_only=True)
+    user_id = serializers.PrimaryKeyRelatedField(
+        queryset=User.objects.all(), source='user', write_only=True, allow_null=True, required=False
+    )
+
+    class Meta:
+        model = ShiftTemplate
+        fields = [
+            'id', 'user', 'user_id', 'role', 'location', 'start_time', 'end_time',
+            'weekdays', 'interval_weeks', 'starts_on', 'ends_on', 'exceptions',
+        ]
+
+    def validate_weekdays(self, value):
+        if not value or any(day > 6 for day in value):
+            raise serializers.ValidationError("weekdays must be a non-empty list of 0 (Monday) to 6 (Sunday)")
+        return sorted(set(value))
+
+    def validate(self, data):
+        starts_on = data.get('starts_on', getattr(self.instance, 'starts_on', None))
+        ends_on = data.get('ends_on', getattr(self.instance, 'ends_on', None))
+        if starts_on and ends_on and ends_on < starts_on:
+            raise serializers.ValidationError("ends_on must not be before starts_on")
+        return data
+
+class MaterializeSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    user_id = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), source='user', required=False)
 
-class AvailabilitySerializer(serializers.ModelSerializer):
+class AvailabilitySerializer(ResponseOptionsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     user_id = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all(), source='user', write_only=True
@@ -43,9 +117,9 @@ class AvailabilitySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Availability
-        fields = ['id', 'user', 'user_id', 'date', 'is_available']
+        fields = ['id', 'user', 'user_id', 'date', 'is_available', 'updated_at']
 
-class PTORequestSerializer(serializers.ModelSerializer):
+class PTORequestSerializer(ResponseOptionsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     user_id = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all(), source='user', write_only=True
@@ -53,9 +127,9 @@ class PTORequestSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = PTORequest
-        fields = ['id', 'user', 'user_id', 'start_date', 'end_date', 'type', 'status', 'reason']
+        fields = ['id', 'user', 'user_id', 'start_date', 'end_date', 'type', 'status', 'reason', 'updated_at']
 
-class ShiftSwapSerializer(serializers.ModelSerializer):
+class ShiftSwapSerializer(ResponseOptionsMixin, serializers.ModelSerializer):
     shift = ShiftSerializer(read_only=True)
     shift_id = serializers.PrimaryKeyRelatedField(
         queryset=Shift.objects.all(), source='shift', write_only=True
@@ -71,4 +145,139 @@ class ShiftSwapSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ShiftSwap
-        fields = ['id', 'shift', 'shift_id', 'from_user', 'from_user_id', 'to_user', 'to_user_id', 'status']
+        fields = ['id', 'shift', 'shift_id', 'from_user', 'from_user_id', 'to_user', 'to_user_id', 'status', 'updated_at']
+
+class ShiftBulkItemSerializer(serializers.Serializer):
+    """One row of a bulk shift write.
+
+    Unlike ShiftSerializer this never touches the database: ``user_id`` and
+    ``id`` are checked for the whole batch at once by the bulk view.
+    """
+    id = serializers.IntegerField(required=False)
+    user_id = serializers.IntegerField(allow_null=True, required=False)
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField()
+    role = serializers.CharField(max_length=100)
+    location = serializers.CharField(max_length=100)
+
+    def validate(self, data):
+        if 'start_time' in data and 'end_time' in data and data['end_time'] <= data['start_time']:
+            raise serializers.ValidationError("end_time must be after start_time")
+        return data
+
+class AutoAssignSerializer(serializers.Serializer):
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    location = serializers.CharField(max_length=100, required=False)
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if data['end_date'] < data['start_date']:
+            raise serializers.ValidationError("end_date must not be before start_date")
+        return data
+
+class RosterQuerySerializer(serializers.Serializer):
+    location = serializers.CharField(max_length=100)
+    week = serializers.DateField(required=False)
+
+class PTODecisionSerializer(serializers.Serializer):
+    # What approval does with the shifts inside the PTO; see pto.py.
+    release = serializers.ChoiceField(choices=['unassign', 'swap'], default='unassign')
+
+class PTOBatchSerializer(PTODecisionSerializer):
+    MAX_IDS = 500
+
+    ids = serializers.ListField(child=serializers.IntegerField(), min_length=1, max_length=MAX_IDS)
+    action = serializers.ChoiceField(choices=['approve', 'reject'])
+
+class SwapDecisionSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=['approve', 'reject'])
+    # Who takes the shift on approval, instead of the swap's own to_user.
+    to_user = serializers.IntegerField(required=False, allow_null=True)
+
+class SwapSettleSerializer(serializers.Serializer):
+    MAX_DECISIONS = 500
+
+    decisions = serializers.ListField(child=SwapDecisionSerializer(), min_length=1, max_length=MAX_DECISIONS)
+
+    def validate_decisions(self, decisions):
+        if len({decision['id'] for decision in decisions}) != len(decisions):
+            raise serializers.ValidationError('Each swap request can only be decided once.')
+        return decisions
+
+class ResponseOptionsQuerySerializer(serializers.Serializer):
+    INCLUDES = ('user', 'shift')
+
+    # Comma-separated, e.g. "user,shift".
+    include = serializers.CharField(required=False, default='')
+
+    # "fields" would shadow Serializer.fields, so it is declared in __init__.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Comma-separated, e.g. "id,start_time,user".
+        self.fields['fields'] = serializers.CharField(required=False, default='')
+
+    def validate_include(self, value):
+        include = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = set(include) - set(self.INCLUDES)
+        if unknown:
+            raise serializers.ValidationError(f"Unknown include(s) {', '.join(sorted(unknown))}; choose from {', '.join(self.INCLUDES)}")
+        return include
+
+    def validate(self, data):
+        data['fields'] = [name.strip() for name in data['fields'].split(',') if name.strip()]
+        return data
+
+class SwapCandidatesQuerySerializer(serializers.Serializer):
+    shift_id = serializers.IntegerField()
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+class AvailabilityRangeQuerySerializer(serializers.Serializer):
+    MAX_DAYS = 366
+
+    user = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    # "from" is a keyword, so the fields are declared in __init__.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['from'] = serializers.DateField()
+        self.fields['to'] = serializers.DateField()
+
+    def validate(self, data):
+        if data['to'] < data['from']:
+            raise serializers.ValidationError("'to' must not be before 'from'")
+        if (data['to'] - data['from']).days >= self.MAX_DAYS:
+            raise serializers.ValidationError(f"At most {self.MAX_DAYS} days per request")
+        return data
+
+class LaborHoursQuerySerializer(serializers.Serializer):
+    MAX_DAYS = 366
+    GROUP_FIELDS = ('user', 'location', 'role')
+
+    # Comma-separated, e.g. "location,role".
+    group_by = serializers.CharField(required=False, default='location')
+    period = serializers.ChoiceField(choices=['day', 'week'], required=False, default='day')
+    location = serializers.CharField(max_length=100, required=False)
+    role = serializers.CharField(max_length=100, required=False)
+    user = serializers.IntegerField(required=False)
+
+    # "from" is a keyword, so the fields are declared in __init__.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['from'] = serializers.DateField()
+        self.fields['to'] = serializers.DateField()
+
+    def validate_group_by(self, value):
+        fields = [field.strip() for field in value.split(',') if field.strip()]
+        unknown = set(fields) - set(self.GROUP_FIELDS)
+        if unknown:
+            raise serializers.ValidationError(f"Unknown field(s) {', '.join(sorted(unknown))}; choose from {', '.join(self.GROUP_FIELDS)}")
+        return list(dict.fromkeys(fields))
+
+    def validate(self, data):
+        if data['to'] < data['from']:
+            raise serializers.ValidationError("'to' must not be before 'from'")
+        if (data['to'] - data['from']).days >= self.MAX_DAYS:
+            raise serializers.ValidationError(f"At most {self.MAX_DAYS} days per request")
+        return data
@@ -0,0 +1,209 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .models import User, Shift, ShiftTemplate, Availability, PTORequest, ShiftSwap
+from .analytics import hours_buckets, refresh_shift_hours
+from .authentication import user_cache_key
+from .availability_bitmap import refresh_months
+from .events import publish_changes
+from .response_cache import bump_version
+from .roster import day_start, invalidate_rosters, invalidate_template_rosters, week_of, week_of_datetime
+from .sync import record_deleted, record_reassigned
+
+# bulk_create(), bulk_update() and QuerySet.update() skip post_save, so code
+# that writes shifts that way sends this instead, with ``shifts`` set to the
+# affected instances.
+shifts_bulk_changed = Signal()
+# Sent by the bulk availability import with ``user_ids``, ``first_date`` and ``last_date``.
+availability_bulk_changed = Signal()
+# Sent by pto.decide with the decided ``pto_requests``.
+pto_bulk_decided = Signal()
+# Sent by code that creates or updates swaps in bulk (pto.decide, swaps.settle)
+# with the affected ``swaps``, their ``shift`` already loaded.
+swaps_bulk_changed = Signal()
+
+
+def shift_buckets(shift):
+    return {
+        (shift.location, week_of_datetime(shift.start_time)),
+        (shift.loaded_value('location'), week_of_datetime(shift.loaded_value('start_time'))),
+    }
+
+
+@receiver(post_save, sender=Shift)
+@receiver(post_delete, sender=Shift)
+def invalidate_shift_rosters(sender, instance, **kwargs):
+    invalidate_rosters(shift_buckets(instance))
+
+
+@receiver(shifts_bulk_changed)
+def invalidate_bulk_shift_rosters(sender, shifts, **kwargs):
+    invalidate_rosters(bucket for shift in shifts for bucket in shift_buckets(shift))
+
+
+@receiver(post_save, sender=Shift)
+@receiver(post_delete, sender=Shift)
+def refresh_shift_hours_rollup(sender, instance, **kwargs):
+    refresh_shift_hours(hours_buckets(instance))
+
+
+@receiver(shifts_bulk_changed)
+def refresh_bulk_shift_hours_rollup(sender, shifts, **kwargs):
+    refresh_shift_hours(bucket for shift in shifts for bucket in hours_buckets(shift))
+
+
+@receiver(post_save, sender=ShiftTemplate)
+@receiver(post_delete, sender=ShiftTemplate)
+def invalidate_shift_template_rosters(sender, instance, **kwargs):
+    invalidate_template_rosters({instance.location, instance.loaded_value('location')})
+
+
+def pto_roster_buckets(pto_requests):
+    """``(location, week)`` of the rosters showing any of ``pto_requests``, with one query."""
+    # Rosters only show approved PTO, and only for employees working there that week.
+    windows = Q()
+    for instance in pto_requests:
+        if 'approved' not in (instance.status, instance.loaded_value('status')):
+            continue
+        first = week_of(min(instance.start_date, instance.loaded_value('start_date')))
+        last = max(instance.end_date, instance.loaded_value('end_date'))
+        windows |= Q(
+            user_id__in={instance.user_id, instance.loaded_value('user_id')},
+            start_time__gte=day_start(first),
+            start_time__lt=day_start(week_of(last) + timedelta(days=7)),
+        )
+    if not windows:
+        return []
+    shifts = Shift.objects.filter(windows).values_list('location', 'start_time')
+    return [(location, week_of_datetime(start_time)) for location, start_time in shifts]
+
+
+@receiver(post_save, sender=PTORequest)
+@receiver(post_delete, sender=PTORequest)
+def invalidate_pto_rosters(sender, instance, **kwargs):
+    invalidate_rosters(pto_roster_buckets([instance]))
+
+
+@receiver(pto_bulk_decided)
+def invalidate_bulk_pto_rosters(sender, pto_requests, **kwargs):
+    invalidate_rosters(pto_roster_buckets(pto_requests))
+
+
+@receiver(post_save, sender=ShiftSwap)
+@receiver(post_delete, sender=ShiftSwap)
+def invalidate_swap_rosters(sender, instance, **kwargs):
+    shifts = Shift.objects.filter(pk=instance.shift_id).values_list('location', 'start_time')
+    invalidate_rosters((location, week_of_datetime(start_time)) for location, start_time in shifts)
+
+
+@receiver(swaps_bulk_changed)
+def invalidate_bulk_swap_rosters(sender, swaps, **kwargs):
+    invalidate_rosters((swap.shift.location, week_of_datetime(swap.shift.start_time)) for swap in swaps)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Shift)
+@receiver(post_save, sender=ShiftTemplate)
+@receiver(post_save, sender=Availability)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Shift)
+@receiver(post_delete, sender=ShiftTemplate)
+@receiver(post_delete, sender=Availability)
+def bump_response_cache_version(sender, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump_version(sender)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    # Again on commit, like bump_version, so a racing read cannot re-cache the old row.
+    key = user_cache_key(instance.pk)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+@receiver(shifts_bulk_changed)
+def bump_bulk_shift_version(sender, **kwargs):
+    bump_version(Shift)
+
+
+@receiver(availability_bulk_changed)
+def bump_bulk_availability_version(sender, **kwargs):
+    bump_version(Availability)
+
+
+@receiver(post_save, sender=Availability)
+@receiver(post_delete, sender=Availability)
+def refresh_availability_bitmaps(sender, instance, **kwargs):
+    for user_id, day in {
+        (instance.user_id, instance.date),
+        (instance.loaded_value('user_id'), instance.loaded_value('date')),
+    }:
+        refresh_months([user_id], day, day)
+
+
+@receiver(availability_bulk_changed)
+def refresh_bulk_availability_bitmaps(sender, user_ids, first_date, last_date, **kwargs):
+    refresh_months(user_ids, first_date, last_date)
+
+
+@receiver(post_delete, sender=Shift)
+@receiver(post_delete, sender=Availability)
+@receiver(post_delete, sender=PTORequest)
+@receiver(post_delete, sender=ShiftSwap)
+def record_sync_tombstone(sender, instance, **kwargs):
+    record_deleted(instance)
+
+
+@receiver(post_save, sender=Shift)
+def record_sync_reassignment(sender, instance, created, **kwargs):
+    if not created:
+        record_reassigned([instance])
+
+
+@receiver(shifts_bulk_changed)
+def record_bulk_sync_reassignments(sender, shifts, **kwargs):
+    record_reassigned(shifts)
+
+
+@receiver(pre_delete, sender=User)
+def touch_orphaned_shifts(sender, instance, **kwargs):
+    # Deleting a user sets user to NULL on their shifts without saving them.
+    Shift.objects.filter(user_id=instance.pk).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Shift)
+@receiver(post_save, sender=ShiftSwap)
+@receiver(post_save, sender=PTORequest)
+def push_change_event(sender, instance, **kwargs):
+    publish_changes(sender, [instance])
+
+
+@receiver(post_delete, sender=Shift)
+@receiver(post_delete, sender=ShiftSwap)
+@receiver(post_delete, sender=PTORequest)
+def push_delete_event(sender, instance, **kwargs):
+    publish_changes(sender, [instance], action='deleted')
+
+
+@receiver(shifts_bulk_changed)
+def push_bulk_shift_events(sender, shifts, **kwargs):
+    publish_changes(Shift, shifts)
+
+
+@receiver(pto_bulk_decided)
+def push_bulk_pto_events(sender, pto_requests, **kwargs):
+    publish_changes(PTORequest, pto_requests)
+
+
+@receiver(swaps_bulk_changed)
+def push_bulk_swap_events(sender, swaps, **kwargs):
+    publish_changes(ShiftSwap, swaps)
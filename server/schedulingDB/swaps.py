@@ -0,0 +1,190 @@
+"""Settling shift swap requests, one or many at a time.
+
+``settle`` takes ``(swap_id, action, to_user_id)`` decisions. It locks the
+swaps and then their shifts (both in id order, so concurrent calls cannot
+deadlock each other) and checks every decision again under those locks:
+the swap must still be pending, and an approved swap's shift must still
+belong to the employee who asked to give it away. A shift reassigned in
+the meantime, e.g. by ``assign_user`` or another accept, fails its
+decision instead of being handed over twice.
+
+An approval also fails when the new assignee has approved PTO, another
+shift or an assigned template occurrence at that time, including a shift
+given to them earlier in the same call. PTO, existing shifts and
+occurrences are each looked up once for the whole batch. The overlap
+constraint still guards against shifts assigned by other transactions
+meanwhile.
+
+Decisions that pass are written with one ``bulk_update`` per model, then
+the bulk signals are sent, so rosters, the hours rollup, sync and change
+events stay correct. The transaction is retried when Postgres aborts it
+as a deadlock or serialization failure.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .conflicts import overlap_as_conflict, retry_on_conflict
+from .models import User, Shift, PTORequest, ShiftSwap
+from .signals import shifts_bulk_changed, swaps_bulk_changed
+from .sync import touch
+from .templates import assigned_occurrences
+
+APPROVE = 'approve'
+REJECT = 'reject'
+ACTIONS = (APPROVE, REJECT)
+
+
+class SettleResult:
+    def __init__(self):
+        self.approved = []
+        self.rejected = []
+        # (swap id, reason)
+        self.errors = []
+
+    def fail(self, swap_id, reason):
+        self.errors.append((swap_id, reason))
+
+    def as_dict(self):
+        return {
+            'approved': [swap.id for swap in self.approved],
+            'rejected': [swap.id for swap in self.rejected],
+            'errors': [{'id': swap_id, 'error': reason} for swap_id, reason in self.errors],
+        }
+
+
+def shift_dates(shift):
+    return timezone.localdate(shift.start_time), timezone.localdate(shift.end_time - timedelta(microseconds=1))
+
+
+def approved_pto(handovers):
+    """Approved PTO of the new assignees around the handed over shifts, by user id."""
+    first = min(shift_dates(shift)[0] for shift, user_id, swap in handovers)
+    last = max(shift_dates(shift)[1] for shift, user_id, swap in handovers)
+    pto = defaultdict(list)
+    rows = PTORequest.objects.filter(
+        user_id__in={user_id for shift, user_id, swap in handovers},
+        status='approved', start_date__lte=last, end_date__gte=first,
+    ).values_list('user_id', 'start_date', 'end_date')
+    for user_id, start_date, end_date in rows:
+        pto[user_id].append((start_date, end_date))
+    return pto
+
+
+def booked_shifts(handovers):
+    """Other shifts and assigned template occurrences of the new assignees around the handed over ones, by user id."""
+    windows = Q()
+    for shift, user_id, swap in handovers:
+        windows |= Q(user_id=user_id, start_time__lt=shift.end_time, end_time__gt=shift.start_time)
+    booked = defaultdict(list)
+    rows = Shift.objects.filter(windows).values_list('user_id', 'start_time', 'end_time')
+    for user_id, start_time, end_time in rows:
+        booked[user_id].append((start_time, end_time))
+    occurrences = assigned_occurrences(
+        {user_id for shift, user_id, swap in handovers},
+        min(shift.start_time for shift, user_id, swap in handovers),
+        max(shift.end_time for shift, user_id, swap in handovers),
+    )
+    for user_id, shifts in occurrences.items():
+        booked[user_id].extend((shift.start_time, shift.end_time) for shift in shifts)
+    return booked
+
+
+def check_handovers(handovers, result):
+    """The ``(shift, user id, swap)`` handovers that break no PTO or overlap rule, in order."""
+    if not handovers:
+        return []
+    pto = approved_pto(handovers)
+    booked = booked_shifts(handovers)
+    accepted = []
+    for shift, user_id, swap in handovers:
+        first, last = shift_dates(shift)
+        if any(start_date <= last and end_date >= first for start_date, end_date in pto[user_id]):
+            result.fail(swap.id, 'The employee has approved PTO during this shift.')
+        elif any(start < shift.end_time and end > shift.start_time for start, end in booked[user_id]):
+            result.fail(swap.id, 'The employee already has a shift overlapping this time.')
+        else:
+            booked[user_id].append((shift.start_time, shift.end_time))
+            accepted.append((shift, user_id, swap))
+    return accepted
+
+
+def _settle(decisions):
+    result = SettleResult()
+    with transaction.atomic():
+        swaps = {
+            swap.id: swap for swap in
+            ShiftSwap.objects.select_for_update(of=('self',)).filter(pk__in=decisions).order_by('id')
+        }
+        shifts = {
+            shift.id: shift for shift in
+            Shift.objects.select_for_update().filter(pk__in={swap.shift_id for swap in swaps.values()}).order_by('id')
+        }
+        named = {to_user_id for action, to_user_id in decisions.values() if to_user_id is not None}
+        active = set(User.objects.filter(pk__in=named, is_active=True).values_list('pk', flat=True)) if named else set()
+
+        handovers, claimed = [], set()
+        for swap_id, (action, to_user_id) in sorted(decisions.items()):
+            swap = swaps.get(swap_id)
+            if swap is None:
+                result.fail(swap_id, 'Swap request not found.')
+                continue
+            if swap.status != 'pending':
+                result.fail(swap_id, f'The swap request is already {swap.status}.')
+                continue
+            # Cached for the signal receivers.
+            swap.shift = shift = shifts[swap.shift_id]
+            if action == REJECT:
+                swap.status = 'rejected'
+                result.rejected.append(swap)
+                continue
+            to_user_id = to_user_id or swap.to_user_id
+            if to_user_id is None:
+                result.fail(swap_id, 'No employee to hand the shift to.')
+            elif to_user_id != swap.to_user_id and to_user_id not in active:
+                result.fail(swap_id, 'Employee not found.')
+            elif to_user_id == swap.from_user_id:
+                result.fail(swap_id, 'The shift cannot be handed to the employee giving it away.')
+            elif shift.user_id != swap.from_user_id:
+                result.fail(swap_id, 'The shift is no longer assigned to the employee giving it away.')
+            elif shift.id in claimed:
+                result.fail(swap_id, 'Another swap of this shift is already approved.')
+            else:
+                claimed.add(shift.id)
+                handovers.append((shift, to_user_id, swap))
+
+        moved = []
+        for shift, to_user_id, swap in check_handovers(handovers, result):
+            swap.status = 'approved'
+            swap.to_user_id = to_user_id
+            shift.user_id = to_user_id
+            result.approved.append(swap)
+            moved.append(shift)
+
+        decided = sorted(result.approved + result.rejected, key=lambda swap: swap.id)
+        if decided:
+            touch(decided)
+            ShiftSwap.objects.bulk_update(decided, ['status', 'to_user', 'updated_at'])
+            swaps_bulk_changed.send(sender=ShiftSwap, swaps=decided)
+        if moved:
+            touch(moved)
+            with overlap_as_conflict():
+                Shift.objects.bulk_update(moved, ['user', 'updated_at'])
+            shifts_bulk_changed.send(sender=Shift, shifts=moved)
+    result.errors.sort()
+    return result
+
+
+def settle(decisions):
+    """Approve or reject swap requests; returns a ``SettleResult``.
+
+    ``decisions`` is an iterable of ``(swap_id, action, to_user_id)``, where
+    ``action`` is ``'approve'`` or ``'reject'`` and ``to_user_id`` may name
+    the employee taking the shift, overriding the swap's own ``to_user``.
+    Failed decisions are reported in ``errors``; the others are applied.
+    """
+    decisions = {swap_id: (action, to_user_id) for swap_id, action, to_user_id in decisions}
+    return retry_on_conflict(lambda: _settle(decisions))
@@ -0,0 +1,207 @@
+"""Incremental sync: ``GET /api/sync/?since=<token>``.
+
+Shifts, availability, PTO requests and swaps carry an indexed
+``updated_at``. ``auto_now`` sets it on ``save()``; bulk writes set it
+themselves with ``touch``. Deletes leave a ``Tombstone``. So does a
+shift moving from one employee to another, because the old assignee can
+no longer see it and must drop it.
+
+A token is a point in time. A sync returns every row the caller can see
+that changed after it and up to a safe point, the ids that were deleted
+in that window, and the safe point as the next token. The safe point is
+the start of the oldest transaction still open on the database (or now),
+less ``OVERLAP`` for clock skew between app servers and the database.
+Every write still to commit stamps ``updated_at`` after its transaction
+started, so it lands after the safe point and is picked up by the next
+sync, however long the transaction runs. A row can therefore arrive
+twice. Clients apply ``deleted`` first, then upsert ``changes``. When
+nothing changed, two queries answer the request.
+
+At most ``PAGE_SIZE`` changed rows are sent at once. When there are more,
+``more`` is true and ``token`` continues the same window; the client
+calls again right away until ``more`` is false. ``deleted`` comes with
+the first page.
+
+Call it without ``since`` to get a starting token, then load the lists.
+Tokens older than ``TOMBSTONE_RETENTION`` can no longer be answered; the
+client must reload instead. ``manage.py purge_tombstones`` removes
+tombstones older than that.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Shift, Availability, PTORequest, ShiftSwap, Tombstone
+from .serializers import ShiftSerializer, AvailabilitySerializer, PTORequestSerializer, ShiftSwapSerializer
+
+OVERLAP = timedelta(seconds=settings.SYNC_OVERLAP_SECONDS)
+PAGE_SIZE = settings.SYNC_PAGE_SIZE
+TOMBSTONE_RETENTION = timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class TokenExpired(Exception):
+    pass
+
+
+# A decoded token: changes after ``since``. Continuation tokens also carry
+# the window's end, ``until``, and ``after``: ``(sync name, updated_at, pk)``
+# of the last row sent, with updated_at and pk None to start that model over.
+Position = namedtuple('Position', ['since', 'until', 'after'])
+
+
+def owner_filter(model, user_id):
+    if model is ShiftSwap:
+        return Q(from_user_id=user_id) | Q(to_user_id=user_id)
+    return Q(user_id=user_id)
+
+
+def owner_ids(instance):
+    if isinstance(instance, ShiftSwap):
+        return [user_id for user_id in (instance.from_user_id, instance.to_user_id) if user_id is not None]
+    return [instance.user_id] if instance.user_id is not None else []
+
+
+# Sync name -> (queryset, serializer).
+SYNCED = {
+    'shifts': (Shift.objects.select_related('user'), ShiftSerializer),
+    'availabilities': (Availability.objects.select_related('user'), AvailabilitySerializer),
+    'pto_requests': (PTORequest.objects.select_related('user'), PTORequestSerializer),
+    'shift_swaps': (ShiftSwap.objects.select_related('shift__user', 'from_user', 'to_user'), ShiftSwapSerializer),
+}
+SYNC_NAMES = {queryset.model: name for name, (queryset, serializer) in SYNCED.items()}
+
+
+def microseconds(moment):
+    return str((moment - EPOCH) // timedelta(microseconds=1))
+
+
+def moment(value):
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def encode_token(since, until=None, after=None):
+    if until is None:
+        return microseconds(since)
+    name, updated_at, pk = after
+    resume = [microseconds(updated_at), str(pk)] if updated_at is not None else ['', '']
+    return '.'.join([microseconds(since), microseconds(until), name, *resume])
+
+
+def decode_token(token):
+    """The ``Position`` a token stands for; raises ValueError when malformed and TokenExpired when too old."""
+    parts = token.split('.')
+    if len(parts) == 1:
+        position = Position(moment(parts[0]), None, None)
+    elif len(parts) == 5 and parts[2] in SYNCED:
+        since, until, name, updated_at, pk = parts
+        resume = (moment(updated_at), int(pk)) if updated_at else (None, None)
+        position = Position(moment(since), moment(until), (name, *resume))
+    else:
+        raise ValueError(token)
+    if position.since < timezone.now() - TOMBSTONE_RETENTION:
+        raise TokenExpired
+    return position
+
+
+def safe_point():
+    """The latest moment every write stamped at or before it has committed by.
+
+    Needs the app's own sessions to be visible in pg_stat_activity, which
+    they are to the role that opened them.
+    """
+    with connection.cursor() as cursor:
+        # clock_timestamp(), not now(): the caller may be inside a transaction.
+        cursor.execute(
+            "SELECT least(clock_timestamp(), min(xact_start) - interval '1 microsecond') FROM pg_stat_activity "
+            "WHERE datname = current_database() AND backend_type = 'client backend' AND pid <> pg_backend_pid()"
+        )
+        return cursor.fetchone()[0] - OVERLAP
+
+
+def touch(instances):
+    """Set ``updated_at`` on instances about to be written with ``bulk_update``."""
+    now = timezone.now()
+    for instance in instances:
+        instance.updated_at = now
+
+
+def record_deleted(instance):
+    Tombstone.objects.create(model=SYNC_NAMES[type(instance)], object_id=instance.pk, user_ids=owner_ids(instance))
+
+
+def record_reassigned(shifts):
+    """Tell the previous assignee of each reassigned shift to drop it."""
+    Tombstone.objects.bulk_create([
+        Tombstone(model='shifts', object_id=shift.pk, user_ids=[shift.loaded_value('user_id')], deleted=False)
+        for shift in shifts
+        if shift.pk is not None and shift.loaded_value('user_id') not in (None, shift.user_id)
+    ])
+
+
+def scoped(queryset, user):
+    if user.role == 'employee':
+        return queryset.filter(owner_filter(queryset.model, user.id))
+    return queryset
+
+
+def scoped_tombstones(user):
+    if user.role == 'employee':
+        return Tombstone.objects.filter(user_ids__contains=[user.id])
+    return Tombstone.objects.filter(deleted=True)
+
+
+def changes_since(user, position):
+    """The sync response for ``user`` from the ``Position`` ``position`` (None for just a token)."""
+    if position is None:
+        return {'token': encode_token(safe_point()), 'changes': {}, 'deleted': {}, 'more': False}
+    since, until, after = position
+    first_page = until is None
+    if first_page:
+        until = safe_point()
+    response = {'token': encode_token(until), 'changes': {}, 'deleted': {}, 'more': False}
+
+    changed = {
+        name: scoped(queryset, user).filter(updated_at__gt=since, updated_at__lte=until)
+        for name, (queryset, serializer) in SYNCED.items()
+    }
+    if first_page:
+        tombstones = scoped_tombstones(user).filter(created_at__gt=since, created_at__lte=until)
+        # One query to find out whether there is anything to send at all.
+        probes = [queryset.values_list('pk')[:1] for queryset in changed.values()]
+        if not probes[0].union(*probes[1:], tombstones.values_list('pk')[:1], all=True):
+            return response
+        deleted = {name: set() for name in SYNCED}
+        for model, object_id in tombstones.values_list('model', 'object_id'):
+            deleted[model].add(object_id)
+        response['deleted'] = {name: sorted(ids) for name, ids in deleted.items()}
+
+    names = list(SYNCED)
+    resume_at = names.index(after[0]) if after else 0
+    remaining = PAGE_SIZE
+    for index, name in enumerate(names):
+        response['changes'][name] = []
+        if index < resume_at or response['more']:
+            continue
+        queryset = changed[name]
+        if after and index == resume_at and after[1] is not None:
+            queryset = queryset.filter(Q(updated_at__gt=after[1]) | Q(updated_at=after[1], pk__gt=after[2]))
+        rows = list(queryset.order_by('updated_at', 'pk')[:remaining + 1])
+        if len(rows) > remaining:
+            rows = rows[:remaining]
+            last = (rows[-1].updated_at, rows[-1].pk) if rows else (None, None)
+            response['more'] = True
+            response['token'] = encode_token(since, until, (name, *last))
+        response['changes'][name] = SYNCED[name][1](rows, many=True).data
+        remaining -= len(rows)
+    return response
+
+
+def purge_tombstones():
+    """Delete tombstones no token can still ask for; returns how many."""
+    deleted, _ = Tombstone.objects.filter(created_at__lt=timezone.now() - TOMBSTONE_RETENTION).delete()
+    return deleted
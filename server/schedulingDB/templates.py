@@ -0,0 +1,194 @@
+"""Lazy expansion of recurring shift templates.
+
+A ``ShiftTemplate`` stands for every occurrence of a repeating shift, so
+scheduling a quarter is one row instead of dozens. Reads expand the
+occurrences of a window into unsaved ``Shift`` instances and merge them
+with the real rows. An occurrence is materialized as a ``Shift`` (linked
+back by ``template`` and ``occurrence_date``) once someone edits or
+assigns it; from then on the row replaces the expanded copy.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Shift, ShiftTemplate
+
+# Longest start_time window whose occurrences are expanded for one request.
+MAX_EXPANDED_DAYS = 366
+
+
+def occurrence_dates(template, first, last):
+    """Dates in ``first``..``last`` (inclusive) on which ``template`` occurs."""
+    first = max(first, template.starts_on)
+    if template.ends_on is not None:
+        last = min(last, template.ends_on)
+    # Monday of the first week; weeks are counted from it.
+    anchor = template.starts_on - timedelta(days=template.starts_on.weekday())
+    weekdays, exceptions = set(template.weekdays), set(template.exceptions)
+    day = first
+    while day <= last:
+        if (
+            day.weekday() in weekdays
+            and (day - anchor).days // 7 % template.interval_weeks == 0
+            and day not in exceptions
+        ):
+            yield day
+        day += timedelta(days=1)
+
+
+def occurs_on(template, day):
+    return any(occurrence_dates(template, day, day))
+
+
+def occurrence(template, day):
+    """The unsaved Shift for ``template`` on ``day``."""
+    start = timezone.make_aware(datetime.combine(day, template.start_time))
+    end_day = day if template.end_time > template.start_time else day + timedelta(days=1)
+    end = timezone.make_aware(datetime.combine(end_day, template.end_time))
+    shift = Shift(
+        template=template, occurrence_date=day, start_time=start, end_time=end,
+        role=template.role, location=template.location, user_id=template.user_id,
+    )
+    if template.user_id is not None and 'user' in template._state.fields_cache:
+        shift.user = template.user
+    return shift
+
+
+def expansion_dates(start, end):
+    # A day's occurrence can start on the previous local date in another
+    # offset, so pad the date range by a day each side.
+    return timezone.localtime(start).date() - timedelta(days=1), timezone.localtime(end).date() + timedelta(days=1)
+
+
+def materialized_occurrences(templates, start, end):
+    """Query for the ``(template_id, occurrence_date)`` pairs that already have a Shift row."""
+    first, last = expansion_dates(start, end)
+    return Shift.objects.filter(
+        template__in=templates, occurrence_date__gte=first, occurrence_date__lte=last
+    ).values_list('template_id', 'occurrence_date')
+
+
+def unmaterialized_occurrences(templates, start, end, materialized):
+    first, last = expansion_dates(start, end)
+    shifts = [
+        occurrence(template, day)
+        for template in templates
+        for day in occurrence_dates(template, first, last)
+        if (template.id, day) not in materialized
+    ]
+    return sorted(
+        (shift for shift in shifts if start <= shift.start_time < end),
+        key=lambda shift: (shift.start_time, shift.template_id),
+    )
+
+
+def filtered_templates(params, only_user_id=None):
+    """Templates whose occurrences can pass the cleaned ShiftFilter ``params``."""
+    templates = ShiftTemplate.objects.select_related('user')
+    if only_user_id is not None:
+        templates = templates.filter(user_id=only_user_id)
+    for field in ('user', 'role', 'location'):
+        if params.get(field):
+            templates = templates.filter(**{field: params[field]})
+    return templates
+
+
+def filter_occurrences(shifts, params):
+    """Apply the ShiftFilter ``end_time`` lookups, which templates cannot answer in SQL."""
+    return [
+        shift for shift in shifts
+        if (params.get('end_time__gt') is None or shift.end_time > params['end_time__gt'])
+        and (params.get('end_time__lte') is None or shift.end_time <= params['end_time__lte'])
+    ]
+
+
+def merge_occurrences(shifts, occurrences):
+    return sorted([*shifts, *occurrences], key=lambda shift: (shift.start_time, shift.id or 0, shift.template_id or 0))
+
+
+class MergedShifts:
+    """``shifts`` (ordered by start_time, id) and sorted ``occurrences`` as one sequence for a Paginator.
+
+    A slice ``[offset:offset + n]`` reads only the first ``offset + n``
+    shift rows, since no later row can land before them in the merge.
+    """
+    ordered = True
+
+    def __init__(self, shifts, occurrences):
+        self.shifts = shifts
+        self.occurrences = occurrences
+
+    def count(self):
+        return self.shifts.count() + len(self.occurrences)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        if index.stop is None or index.stop < 0 or (index.start or 0) < 0:
+            raise ValueError('MergedShifts only takes slices with a non-negative stop')
+        return merge_occurrences(self.shifts[:index.stop], self.occurrences[:index.stop])[index]
+
+
+def expand(templates, start, end):
+    """Occurrences of ``templates`` starting in ``[start, end)``, sorted by start.
+
+    Occurrences that already have a Shift row are left out; that row is
+    returned by the usual Shift query instead.
+    """
+    templates = list(templates)
+    if not templates:
+        return []
+    materialized = set(materialized_occurrences(templates, start, end))
+    return unmaterialized_occurrences(templates, start, end, materialized)
+
+
+def assigned_occurrences(user_ids, start, end):
+    """Occurrences assigned to ``user_ids`` that overlap ``[start, end)``, by user id.
+
+    Like ``expand`` these leave out materialized occurrences, whose rows
+    the overlap constraint already covers.
+    """
+    busy = defaultdict(list)
+    if not user_ids:
+        return busy
+    templates = ShiftTemplate.objects.filter(user_id__in=user_ids)
+    # An occurrence lasts less than a day, so one starting the day before can still reach into the window.
+    for shift in expand(templates, start - timedelta(days=1), end):
+        if shift.end_time > start:
+            busy[shift.user_id].append(shift)
+    return busy
+
+
+async def aexpand(templates, start, end):
+    """``expand`` on the async ORM."""
+    templates = [template async for template in templates]
+    if not templates:
+        return []
+    materialized = {pair async for pair in materialized_occurrences(templates, start, end)}
+    return unmaterialized_occurrences(templates, start, end, materialized)
+
+
+def materialize(template, day, **changes):
+    """Return ``(shift, created)`` for the occurrence of ``template`` on ``day``.
+
+    Raises ``ValueError`` when the template has no occurrence that day.
+    ``changes`` are applied to a newly created row.
+    """
+    with transaction.atomic():
+        # Serializes concurrent materializations of the same template.
+        template = type(template).objects.select_for_update().get(pk=template.pk)
+        shift = Shift.objects.filter(template=template, occurrence_date=day).first()
+        if shift is not None:
+            return shift, False
+        if not occurs_on(template, day):
+            raise ValueError(f'{template} does not occur on {day.isoformat()}')
+        shift = occurrence(template, day)
+        for field, value in changes.items():
+            setattr(shift, field, value)
+        shift.save()
+        return shift, True
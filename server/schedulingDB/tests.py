@@ -1,9 +1,1595 @@
-from django.test import TestCase
-from rest_framework.test import APITestCase
+import asyncio
+import io
+import json
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta
+from time import sleep
+from unittest import mock
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core import mail
+from django.core.cache import caches
+from django.core.mail import get_connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from django.urls import reverse
+from .models import (
+    User, Shift, ShiftTemplate, ShiftHours, Availability, AvailabilityMonth, PTORequest, ShiftSwap, Job, Tombstone,
+)
+from .authentication import ClaimsUser
+from .availability_bitmap import AvailabilityIndex
+from .checks import check_shared_state
+from .events import broker, format_event, subscription_channels
+from .jobs import LEASE, claim, enqueue_email, purge_finished, run_batch, send_emails
+from . import metrics
+from .pagination import KeysetPagination
+from .signals import shifts_bulk_changed
+from .templates import occurrence_dates
 
-class ShiftTests(APITestCase):
+
+class QueryBudgetMixin:
+    """Fail the test when a request runs more SQL queries than its budget.
+
+    Authenticate with ``force_authenticate`` so the budget only covers the
+    view itself, not the auth backend.
+    """
+
+    def assertQueryBudget(self, budget, url, method='get', **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, **kwargs)
+        if len(ctx) > budget:
+            queries = '\n'.join(q['sql'] for q in ctx.captured_queries)
+            self.fail(f"{method.upper()} {url} ran {len(ctx)} queries (budget {budget}):\n{queries}")
+        return response
+
+
+class ScheduleAPITestCase(APITestCase):
+    # Cache entries would outlive the per-test rollback of the rows they describe.
+    def tearDown(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+
+
+def make_schedule(users=3, shifts_per_user=3):
+    """Create a small but non-trivial dataset touching every model."""
+    start = timezone.make_aware(datetime(2025, 6, 2, 9))
+    employees = [
+        User.objects.create_user(username=f'employee{i}', email=f'employee{i}@example.com', password='x')
+        for i in range(users)
+    ]
+    shifts = []
+    for i, employee in enumerate(employees):
+        for day in range(shifts_per_user):
+            shift_start = start + timedelta(days=day)
+            shifts.append(Shift.objects.create(
+                user=employee,
+                start_time=shift_start,
+                end_time=shift_start + timedelta(hours=8),
+                role='cashier',
+                location='downtown',
+            ))
+            Availability.objects.create(user=employee, date=shift_start.date())
+        PTORequest.objects.create(
+            user=employee, start_date=date(2025, 7, 1), end_date=date(2025, 7, 5), type='vacation'
+        )
+    for i, shift in enumerate(shifts):
+        ShiftSwap.objects.create(shift=shift, from_user=shift.user, to_user=employees[(i + 1) % users])
+    return employees, shifts
+
+
+class EndpointQueryBudgetTests(QueryBudgetMixin, ScheduleAPITestCase):
+    # (router basename, list budget, detail budget)
+    ENDPOINTS = [
+        ('user', 2, 1),
+        ('shift', 2, 1),
+        ('availability', 2, 1),
+        ('ptorequest', 2, 1),
+        ('shiftswap', 2, 1),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        cls.employees, cls.shifts = make_schedule()
+
+    def check_endpoints(self, user):
+        self.client.force_authenticate(user)
+        for basename, list_budget, detail_budget in self.ENDPOINTS:
+            with self.subTest(endpoint=basename, role=user.role):
+                response = self.assertQueryBudget(list_budget, reverse(f'{basename}-list'))
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.data['results'])
+                pk = response.data['results'][0]['id']
+                response = self.assertQueryBudget(detail_budget, reverse(f'{basename}-detail', args=[pk]))
+                self.assertEqual(response.status_code, 200)
+
+    def test_admin_endpoints_within_budget(self):
+        self.check_endpoints(self.admin)
+
+    def test_employee_endpoints_within_budget(self):
+        self.check_endpoints(self.employees[0])
+
+
+class ShiftTests(ScheduleAPITestCase):
     def test_get_shifts(self):
-        url = reverse('shifts-list')  # Or hardcode the URL: '/api/shifts/'
+        self.client.force_authenticate(User.objects.create_user(username='viewer', password='x'))
+        url = reverse('shift-list')  # Or hardcode the URL: '/api/shifts/'
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
+
+
+class DateRangeFilterTests(ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        cls.employees, cls.shifts = make_schedule(users=2, shifts_per_user=3)
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+
+    def test_shift_time_window(self):
+        response = self.client.get(reverse('shift-list'), {
+            'location': 'downtown',
+            'start_time__gte': '2025-06-03T00:00:00Z',
+            'start_time__lt': '2025-06-04T00:00:00Z',
+        })
+        self.assertEqual(response.data['count'], 2)
+
+    def test_availability_date_range(self):
+        response = self.client.get(reverse('availability-list'), {'date__gte': '2025-06-03', 'date__lte': '2025-06-04'})
+        self.assertEqual(response.data['count'], 4)
+
+    def test_pto_overlap(self):
+        overlapping = self.client.get(reverse('ptorequest-list'), {'start_date__lte': '2025-07-02', 'end_date__gte': '2025-06-28'})
+        self.assertEqual(overlapping.data['count'], 2)
+        disjoint = self.client.get(reverse('ptorequest-list'), {'start_date__lte': '2025-06-30', 'end_date__gte': '2025-06-28'})
+        self.assertEqual(disjoint.data['count'], 0)
+
+
+class CursorPaginationTests(QueryBudgetMixin, ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        cls.employees, cls.shifts = make_schedule(users=3, shifts_per_user=3)
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+
+    def test_walks_every_shift_in_key_order_without_count(self):
+        seen = []
+        url = reverse('shift-list') + '?pagination=cursor&page_size=4'
+        while url:
+            response = self.assertQueryBudget(1, url)
+            self.assertNotIn('count', response.data)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        expected = Shift.objects.order_by('start_time', 'id').values_list('id', flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_page_size_is_client_selectable_up_to_cap(self):
+        response = self.client.get(reverse('shift-list'), {'pagination': 'cursor', 'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        with mock.patch.object(KeysetPagination, 'max_page_size', 5):
+            response = self.client.get(reverse('shiftswap-list'), {'pagination': 'cursor', 'page_size': 100000})
+        self.assertEqual(len(response.data['results']), 5)
+
+
+class BulkShiftTests(QueryBudgetMixin, ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='x', role='manager')
+        cls.employees, cls.shifts = make_schedule(users=5, shifts_per_user=1)
+
+    def setUp(self):
+        self.client.force_authenticate(self.manager)
+
+    def rows(self, count):
+        start = timezone.make_aware(datetime(2025, 8, 1, 9))
+        return [{
+            'user_id': self.employees[i % len(self.employees)].id,
+            'start_time': (start + timedelta(days=i)).isoformat(),
+            'end_time': (start + timedelta(days=i, hours=8)).isoformat(),
+            'role': 'cashier',
+            'location': 'uptown',
+        } for i in range(count)]
+
+    def test_creates_and_updates_in_constant_queries(self):
+        rows = self.rows(50) + [{'id': self.shifts[0].id, 'location': 'airport', 'user_id': None}]
+        # 7 for the write itself, 1 for the assignees' template occurrences,
+        # 3 to refresh the ShiftHours rollup and 1 for the sync tombstone of
+        # the unassigned shift.
+        response = self.assertQueryBudget(12, reverse('shift-bulk'), method='post', data=rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 50)
+        self.assertEqual(Shift.objects.filter(location='uptown').count(), 50)
+        self.shifts[0].refresh_from_db()
+        self.assertEqual((self.shifts[0].location, self.shifts[0].user), ('airport', None))
+
+    def test_reports_row_errors_and_writes_nothing(self):
+        rows = self.rows(3)
+        rows[1]['user_id'] = 999999
+        rows[2]['end_time'] = rows[2]['start_time']
+        response = self.client.post(reverse('shift-bulk'), rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertFalse(Shift.objects.filter(location='uptown').exists())
+
+    def test_rejects_repeated_ids(self):
+        shift = self.shifts[0]
+        rows = [{'id': shift.id, 'location': 'airport'}, {'id': shift.id, 'location': 'uptown'}]
+        response = self.client.post(reverse('shift-bulk'), rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'], [
+            {'index': 1, 'errors': {'id': ['Each shift can only be updated once per request']}},
+        ])
+        self.assertEqual(Shift.objects.get(pk=shift.id).location, shift.location)
+
+    def test_unchanged_rows_send_no_change_signal(self):
+        shift = self.shifts[0]
+        rows = [{'id': shift.id}, {'id': self.shifts[1].id, 'location': self.shifts[1].location}]
+        receiver = mock.Mock()
+        shifts_bulk_changed.connect(receiver, weak=False)
+        self.addCleanup(shifts_bulk_changed.disconnect, receiver)
+        response = self.client.post(reverse('shift-bulk'), rows, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], [shift.id, self.shifts[1].id])
+        receiver.assert_not_called()
+        self.assertEqual(Shift.objects.get(pk=shift.id).updated_at, shift.updated_at)
+
+        rows.append({'id': self.shifts[2].id, 'location': 'airport'})
+        self.client.post(reverse('shift-bulk'), rows, format='json')
+        self.assertEqual([shift.id for shift in receiver.call_args.kwargs['shifts']], [self.shifts[2].id])
+
+    def test_employees_cannot_bulk_write(self):
+        self.client.force_authenticate(self.employees[0])
+        response = self.client.post(reverse('shift-bulk'), self.rows(1), format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class AutoAssignTests(ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='x', role='manager')
+        cls.cook = User.objects.create_user(username='cook', password='x', position='cook')
+        cls.cashier = User.objects.create_user(username='cashier', password='x', position='cashier')
+        cls.floater = User.objects.create_user(username='floater', password='x')
+
+    def setUp(self):
+        self.client.force_authenticate(self.manager)
+
+    def open_shift(self, day, hour, role, hours=8):
+        start = timezone.make_aware(datetime(2025, 9, day, hour))
+        return Shift.objects.create(start_time=start, end_time=start + timedelta(hours=hours), role=role, location='downtown')
+
+    def auto_assign(self, **extra):
+        data = {'start_date': '2025-09-01', 'end_date': '2025-09-07', **extra}
+        return self.client.post(reverse('shift-auto-assign'), data, format='json')
+
+    def test_respects_role_availability_pto_and_overlaps(self):
+        Availability.objects.create(user=self.cook, date=date(2025, 9, 1), is_available=False)
+        PTORequest.objects.create(user=self.cashier, start_date=date(2025, 9, 2), end_date=date(2025, 9, 2),
+                                  type='vacation', status='approved')
+        cook_monday = self.open_shift(1, 9, 'cook')
+        cashier_tuesday = self.open_shift(2, 9, 'cashier')
+        cook_wednesday = self.open_shift(3, 9, 'cook')
+        cook_wednesday_overlap = self.open_shift(3, 12, 'cook')
+        cook_wednesday_unstaffed = self.open_shift(3, 12, 'cook')
+
+        response = self.auto_assign()
+        self.assertEqual(response.status_code, 200)
+        assigned = {row['shift_id']: row['user_id'] for row in response.data['assigned']}
+        self.assertEqual(assigned[cook_monday.id], self.floater.id)
+        self.assertEqual(assigned[cashier_tuesday.id], self.floater.id)
+        self.assertEqual(assigned[cook_wednesday.id], self.cook.id)
+        self.assertEqual(assigned[cook_wednesday_overlap.id], self.floater.id)
+        self.assertEqual(response.data['unfilled'], [cook_wednesday_unstaffed.id])
+        cook_wednesday.refresh_from_db()
+        self.assertEqual(cook_wednesday.user, self.cook)
+
+    def test_balances_hours_and_dry_run_writes_nothing(self):
+        shifts = [self.open_shift(day, 9, 'cashier') for day in range(1, 7)]
+        response = self.auto_assign(dry_run=True)
+        counts = {}
+        for row in response.data['assigned']:
+            counts[row['user_id']] = counts.get(row['user_id'], 0) + 1
+        self.assertEqual(counts, {self.cashier.id: 3, self.floater.id: 3})
+        self.assertFalse(Shift.objects.filter(id__in=[shift.id for shift in shifts], user__isnull=False).exists())
+
+
+class ConflictTests(ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='x', role='manager')
+        cls.employee = User.objects.create_user(username='employee', password='x')
+        start = timezone.make_aware(datetime(2025, 10, 6, 9))
+        cls.morning = Shift.objects.create(user=cls.employee, start_time=start, end_time=start + timedelta(hours=8),
+                                           role='cook', location='downtown')
+        cls.open_overlap = Shift.objects.create(start_time=start + timedelta(hours=4), end_time=start + timedelta(hours=12),
+                                                role='cook', location='downtown')
+
+    def setUp(self):
+        self.client.force_authenticate(self.manager)
+
+    def assign(self, shift, user):
+        return self.client.post(reverse('shift-assign-user', args=[shift.id]), {'user_id': user.id}, format='json')
+
+    def test_overlapping_assignment_is_rejected(self):
+        response = self.assign(self.open_overlap, self.employee)
+        self.assertEqual(response.status_code, 409)
+        self.open_overlap.refresh_from_db()
+        self.assertIsNone(self.open_overlap.user)
+
+    def test_assignment_during_approved_pto_is_rejected(self):
+        other = User.objects.create_user(username='other', password='x')
+        PTORequest.objects.create(user=other, start_date=date(2025, 10, 6), end_date=date(2025, 10, 6),
+                                  type='sick', status='approved')
+        self.assertEqual(self.assign(self.open_overlap, other).status_code, 409)
+
+    def test_conflict_report_lists_shifts_inside_pto(self):
+        pto = PTORequest.objects.create(user=self.employee, start_date=date(2025, 10, 6), end_date=date(2025, 10, 7),
+                                        type='vacation', status='approved')
+        response = self.client.get(reverse('shift-conflicts'), {
+            'start_time__gte': '2025-10-06T00:00:00Z', 'start_time__lt': '2025-10-13T00:00:00Z',
+        })
+        self.assertEqual(response.data['overlaps'], [])
+        self.assertEqual(response.data['pto'], [
+            {'shift_id': self.morning.id, 'pto_request_id': pto.id, 'user_id': self.employee.id},
+        ])
+
+    def test_conflict_report_lists_shifts_overlapping_assigned_occurrences(self):
+        # Written directly, as rows from before the template checks could be.
+        template = ShiftTemplate.objects.create(
+            user=self.employee, role='cook', location='uptown', start_time=time(12), end_time=time(14),
+            weekdays=[0], starts_on=date(2025, 9, 1),
+        )
+        params = {'start_time__gte': '2025-10-06T00:00:00Z', 'start_time__lt': '2025-10-13T00:00:00Z'}
+        response = self.client.get(reverse('shift-conflicts'), params)
+        self.assertEqual(response.data['overlaps'], [{
+            'shift_id': self.morning.id, 'template_id': template.id,
+            'occurrence_date': date(2025, 10, 6), 'user_id': self.employee.id,
+        }])
+        response = self.client.get(reverse('shift-conflicts'))
+        self.assertEqual(len(response.data['overlaps']), 1)
+
+
+class SwapCandidateTests(QueryBudgetMixin, ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='x', role='manager')
+        people = {
+            name: User.objects.create_user(username=name, password='x', position=position)
+            for name, position in [
+                ('owner', 'cashier'), ('free', 'cashier'), ('any', ''), ('busy_week', 'cashier'),
+                ('unavailable', 'cashier'), ('on_pto', 'cashier'), ('overlap', 'cashier'),
+                ('template', 'cashier'), ('cook', 'cook'),
+            ]
+        }
+        cls.people = people
+        monday = timezone.make_aware(datetime(2025, 6, 2, 9))
+
+        def shift(user, start, hours=8):
+            return Shift.objects.create(
+                user=user, start_time=start, end_time=start + timedelta(hours=hours), role='cashier', location='downtown'
+            )
+
+        cls.shift = shift(people['owner'], monday)
+        shift(people['busy_week'], monday + timedelta(days=2))
+        shift(people['overlap'], monday + timedelta(hours=7))
+        Availability.objects.create(user=people['free'], date=date(2025, 6, 2), is_available=True)
+        Availability.objects.create(user=people['unavailable'], date=date(2025, 6, 2), is_available=False)
+        PTORequest.objects.create(
+            user=people['on_pto'], start_date=date(2025, 6, 1), end_date=date(2025, 6, 3), type='sick', status='approved'
+        )
+        ShiftTemplate.objects.create(
+            user=people['template'], role='cashier', location='uptown', start_time=time(6), end_time=time(10),
+            weekdays=[0], starts_on=date(2025, 5, 5),
+        )
+
+    def candidates(self, user, budget=5, **params):
+        self.client.force_authenticate(user)
+        return self.assertQueryBudget(budget, reverse('shiftswap-candidates'), data=params)
+
+    def test_ranked_eligible_employees(self):
+        response = self.candidates(self.manager, shift_id=self.shift.id)
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['candidates']
+        self.assertEqual([row['username'] for row in rows], ['free', 'busy_week', 'any'])
+        self.assertEqual([row['available'] for row in rows], [True, False, False])
+        self.assertEqual(rows[1]['week_hours'], 8)
+        self.assertEqual(len(self.candidates(self.manager, shift_id=self.shift.id, limit=1).data['candidates']), 1)
+
+    def test_employees_ask_only_for_their_own_shifts(self):
+        self.assertEqual(self.candidates(self.people['owner'], shift_id=self.shift.id).status_code, 200)
+        self.assertEqual(self.candidates(self.people['free'], shift_id=self.shift.id).status_code, 403)
+        self.assertEqual(self.candidates(self.manager).status_code, 400)
+        self.assertEqual(self.candidates(self.manager, shift_id=0).status_code, 404)
+
+
+class PTODecisionTests(QueryBudgetMixin, ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='x', role='manager')
+        cls.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        cls.employees, cls.shifts = make_schedule(users=2, shifts_per_user=3)
+        # Covers the second and third day of each employee's shifts.
+        cls.requests = [
+            PTORequest.objects.create(user=employee, start_date=date(2025, 6, 3), end_date=date(2025, 6, 10), type='sick')
+            for employee in cls.employees
+        ]
+
+    def test_approval_unassigns_overlapping_shifts(self):
+        self.client.force_authenticate(self.admin)
+        pto = self.requests[0]
+        # Constant in the number of shifts released: one template lookup, one range query and one
+        # bulk update, plus signals.
+        response = self.assertQueryBudget(14, reverse('ptorequest-approve', args=[pto.id]), method='post')
+        self.assertEqual(response.data['status'], 'approved')
+        released = [row['shift_id'] for row in response.data['released_shifts']]
+        self.assertEqual(released, [shift.id for shift in self.shifts[1:3]])
+        self.assertEqual(
+            list(Shift.objects.filter(user=self.employees[0]).values_list('id', flat=True)), [self.shifts[0].id]
+        )
+        self.assertFalse(ShiftSwap.objects.filter(shift_id__in=released, status='pending', to_user=None).exists())
+
+    def test_approval_releases_template_occurrences(self):
+        employee = self.employees[0]
+        template = ShiftTemplate.objects.create(
+            user=employee, role='cashier', location='downtown', start_time=time(9), end_time=time(17),
+            weekdays=[0], starts_on=date(2025, 6, 9),
+        )
+        self.client.force_authenticate(self.admin)
+        response = self.client.post(reverse('ptorequest-approve', args=[self.requests[0].id]))
+        occurrence = Shift.objects.get(template=template)
+        self.assertEqual((occurrence.occurrence_date, occurrence.user_id), (date(2025, 6, 9), None))
+        self.assertEqual(
+            [row['shift_id'] for row in response.data['released_shifts']],
+            [shift.id for shift in self.shifts[1:3]] + [occurrence.id],
+        )
+        listed = self.client.get(reverse('shift-list'), {
+            'start_time__gte': '2025-06-09T00:00:00Z', 'start_time__lt': '2025-06-17T00:00:00Z',
+        }).data['results']
+        self.assertEqual([(row['id'], row['user']) for row in listed][0], (occurrence.id, None))
+        self.assertEqual(listed[1]['user']['id'], employee.id)
+        body = Job.objects.filter(payload__to=[employee.email]).latest('id').payload['body']
+        self.assertIn('unassigned from you', body)
+        self.assertIn('2025-06-09 09:00', body)
+
+    def test_approval_can_open_swap_requests_instead(self):
+        ShiftSwap.objects.all().delete()
+        self.client.force_authenticate(self.admin)
+        response = self.client.post(reverse('ptorequest-approve', args=[self.requests[0].id]), {'release': 'swap'})
+        swaps = ShiftSwap.objects.filter(status='pending', to_user=None).order_by('shift__start_time')
+        self.assertEqual([swap.shift_id for swap in swaps], [shift.id for shift in self.shifts[1:3]])
+        self.assertEqual([row['swap_id'] for row in response.data['released_shifts']], [swap.id for swap in swaps])
+        self.assertEqual(Shift.objects.filter(user=self.employees[0]).count(), 3)
+
+    def test_batch_decisions(self):
+        url = reverse('ptorequest-batch')
+        self.client.force_authenticate(self.employees[0])
+        self.assertEqual(self.client.post(url, {'ids': [self.requests[0].id], 'action': 'approve'}).status_code, 403)
+
+        self.client.force_authenticate(self.manager)
+        ids = [pto.id for pto in self.requests]
+        response = self.assertQueryBudget(21, url, method='post', data={'ids': ids + [0], 'action': 'approve'}, format='json')
+        self.assertEqual(response.data['pto_requests'], ids)
+        self.assertEqual(response.data['not_found'], [0])
+        self.assertEqual(len(response.data['released_shifts']), 4)
+        self.assertFalse(Shift.objects.filter(start_time__date__gte=date(2025, 6, 3), user__isnull=False).exists())
+        self.assertEqual(set(PTORequest.objects.filter(pk__in=ids).values_list('status', flat=True)), {'approved'})
+
+        response = self.client.post(url, {'ids': ids, 'action': 'reject'}, format='json')
+        self.assertEqual(response.data['released_shifts'], [])
+        self.assertEqual(set(PTORequest.objects.filter(pk__in=ids).values_list('status', flat=True)), {'rejected'})
+        self.assertEqual(self.client.post(url, {'ids': [], 'action': 'reject'}, format='json').status_code, 400)
+
+
+class SwapSettleTests(QueryBudgetMixin, ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='x', role='manager')
+        cls.people = {name: User.objects.create_user(username=name, password='x') for name in ['ann', 'bob', 'cat']}
+        start = timezone.make_aware(datetime(2025, 6, 2, 9))
+
+        def shift(name, day):
+            return Shift.objects.create(
+                user=cls.people[name], start_time=start + timedelta(days=day),
+                end_time=start + timedelta(days=day, hours=8), role='cashier', location='downtown',
+            )
+
+        cls.shifts = [shift('ann', 0), shift('ann', 1), shift('bob', 0), shift('cat', 1)]
+        cls.swaps = [
+            ShiftSwap.objects.create(shift=cls.shifts[0], from_user=cls.people['ann'], to_user=cls.people['cat']),
+            ShiftSwap.objects.create(shift=cls.shifts[1], from_user=cls.people['ann'], to_user=cls.people['bob']),
+            ShiftSwap.objects.create(shift=cls.shifts[3], from_user=cls.people['cat']),
+        ]
+
+    def accept(self, name, swap):
+        self.client.force_authenticate(self.people[name])
+        return self.client.post(reverse('shiftswap-accept', args=[swap.id]))
+
+    def test_accept_rechecks_the_swap_and_shift(self):
+        response = self.accept('cat', self.swaps[0])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'approved')
+        self.assertEqual(response.data['shift']['user']['username'], 'cat')
+        self.assertEqual(self.accept('cat', self.swaps[0]).status_code, 409)
+
+        # Reassigned by a manager after the swap was requested: bob must not take it over.
+        self.client.force_authenticate(self.manager)
+        self.client.post(reverse('shift-assign-user', args=[self.shifts[1].id]), {'user_id': self.manager.id})
+        response = self.accept('bob', self.swaps[1])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Shift.objects.get(pk=self.shifts[1].id).user, self.manager)
+        self.assertEqual(ShiftSwap.objects.get(pk=self.swaps[1].id).status, 'pending')
+
+    def test_settle_many_in_one_request(self):
+        url = reverse('shiftswap-settle')
+        decisions = [
+            {'id': self.swaps[0].id, 'action': 'approve'},
+            {'id': self.swaps[1].id, 'action': 'reject'},
+            # ann works day 1 already.
+            {'id': self.swaps[2].id, 'action': 'approve', 'to_user': self.people['ann'].id},
+            {'id': 0, 'action': 'reject'},
+        ]
+        self.client.force_authenticate(self.people['ann'])
+        self.assertEqual(self.client.post(url, {'decisions': decisions}, format='json').status_code, 403)
+
+        self.client.force_authenticate(self.manager)
+        PTORequest.objects.create(
+            user=self.people['cat'], start_date=date(2025, 6, 2), end_date=date(2025, 6, 2), type='sick', status='approved',
+        )
+        response = self.client.post(url, {'decisions': decisions}, format='json')
+        self.assertEqual(response.data['approved'], [])
+        self.assertEqual(response.data['rejected'], [self.swaps[1].id])
+        self.assertEqual([error['id'] for error in response.data['errors']], [0, self.swaps[0].id, self.swaps[2].id])
+        self.assertIn('PTO', response.data['errors'][1]['error'])
+        self.assertIn('overlapping', response.data['errors'][2]['error'])
+
+        PTORequest.objects.filter(user=self.people['cat']).delete()
+        decisions = [
+            {'id': self.swaps[0].id, 'action': 'approve'},
+            {'id': self.swaps[2].id, 'action': 'approve', 'to_user': self.people['bob'].id},
+        ]
+        # Constant in the number of decisions: locks, checks and one bulk update per model, plus signals.
+        response = self.assertQueryBudget(20, url, method='post', data={'decisions': decisions}, format='json')
+        self.assertEqual(response.data, {'approved': [self.swaps[0].id, self.swaps[2].id], 'rejected': [], 'errors': []})
+        self.assertEqual(
+            dict(Shift.objects.filter(pk__in=[self.shifts[0].id, self.shifts[3].id]).values_list('id', 'user__username')),
+            {self.shifts[0].id: 'cat', self.shifts[3].id: 'bob'},
+        )
+        duplicate = [{'id': self.swaps[0].id, 'action': 'reject'}] * 2
+        self.assertEqual(self.client.post(url, {'decisions': duplicate}, format='json').status_code, 400)
+
+
+class RosterTests(QueryBudgetMixin, ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='x', role='manager')
+        cls.employees, cls.shifts = make_schedule(users=2, shifts_per_user=3)
+
+    def setUp(self):
+        self.client.force_authenticate(self.manager)
+
+    def roster(self, budget):
+        return self.assertQueryBudget(budget, reverse('roster'), data={'location': 'downtown', 'week': '2025-06-04'})
+
+    def test_grid_is_cached_until_a_shift_changes(self):
+        roster = self.roster(3).data
+        self.assertEqual(roster['week'], '2025-06-02')
+        self.assertEqual([len(day) for day in roster['employees'][0]['days']], [1, 1, 1, 0, 0, 0, 0])
+        self.roster(0)
+
+        shift = Shift.objects.get(pk=self.shifts[0].pk)
+        shift.user = None
+        with self.captureOnCommitCallbacks(execute=True):
+            shift.save()
+        roster = self.roster(3).data
+        self.assertEqual(len(roster['open_shifts'][0]), 1)
+
+    def test_approved_pto_and_pending_swaps_invalidate(self):
+        ShiftSwap.objects.update(status='rejected')
+        self.assertFalse(self.roster(3).data['employees'][0]['days'][1][0]['swap_pending'])
+        PTORequest.objects.create(user=self.employees[0], start_date=date(2025, 6, 6), end_date=date(2025, 6, 6),
+                                  type='sick', status='approved')
+        self.assertEqual(self.roster(3).data['employees'][0]['pto'], [4])
+        ShiftSwap.objects.create(shift=self.shifts[1], from_user=self.employees[0])
+        self.assertTrue(self.roster(3).data['employees'][0]['days'][1][0]['swap_pending'])
+
+    def test_employees_only_see_their_own_row(self):
+        self.client.force_authenticate(self.employees[1])
+        rows = self.roster(3).data['employees']
+        self.assertEqual([row['id'] for row in rows], [self.employees[1].id])
+
+
+class ResponseCacheTests(QueryBudgetMixin, ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        cls.employees, cls.shifts = make_schedule(users=2, shifts_per_user=2)
+
+    def test_repeat_reads_are_served_from_cache_until_a_write(self):
+        self.client.force_authenticate(self.admin)
+        url = reverse('shift-list')
+        first = self.assertQueryBudget(2, url)
+        self.assertEqual(self.assertQueryBudget(0, url).data, first.data)
+
+        User.objects.filter(pk=self.employees[0].pk).get().save()
+        self.assertQueryBudget(2, url)
+        Shift.objects.filter(pk=self.shifts[0].pk).get().delete()
+        self.assertEqual(self.assertQueryBudget(2, url).data['count'], len(self.shifts) - 1)
+
+    def test_entries_cached_before_the_write_commits_are_dropped(self):
+        self.client.force_authenticate(self.admin)
+        url = reverse('shift-list')
+        with self.captureOnCommitCallbacks(execute=True):
+            Shift.objects.filter(pk=self.shifts[0].pk).get().save()
+            # A read racing the write takes the new version before the commit.
+            self.client.get(url)
+            self.assertQueryBudget(0, url)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertTrue(ctx.captured_queries)
+
+    def test_employees_do_not_share_entries(self):
+        url = reverse('shift-list')
+        for employee in self.employees:
+            self.client.force_authenticate(employee)
+            users = {row['user']['id'] for row in self.client.get(url).data['results']}
+            self.assertEqual(users, {employee.id})
+
+    def test_stats_are_admin_only(self):
+        self.client.force_authenticate(self.employees[0])
+        self.assertEqual(self.client.get(reverse('response_cache_stats')).status_code, 403)
+        self.client.force_authenticate(self.admin)
+        self.client.get(reverse('user-list'))
+        self.client.get(reverse('user-list'))
+        self.assertGreaterEqual(self.client.get(reverse('response_cache_stats')).data['views']['user']['hits'], 1)
+
+
+class NormalizedResponseTests(QueryBudgetMixin, ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        cls.employees, cls.shifts = make_schedule(users=2, shifts_per_user=3)
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+
+    def test_related_objects_are_ids_and_included_once(self):
+        url = reverse('shift-list')
+        response = self.assertQueryBudget(2, url, data={'format': 'normalized', 'include': 'user', 'page_size': 100})
+        self.assertEqual(response['Content-Type'], 'application/vnd.schedule.normalized+json')
+        self.assertEqual({row['user'] for row in response.data['results']}, {employee.id for employee in self.employees})
+        self.assertEqual(
+            json.loads(response.content)['included']['users'][str(self.employees[0].id)]['username'], 'employee0'
+        )
+        self.assertEqual(len(response.data['included']['users']), 2)
+
+        response = self.client.get(url, {'format': 'normalized'})
+        self.assertNotIn('included', response.data)
+        self.assertIsInstance(response.data['results'][0]['user'], int)
+
+        swap = ShiftSwap.objects.first()
+        response = self.client.get(
+            reverse('shiftswap-detail', args=[swap.id]), {'format': 'normalized', 'include': 'user,shift'}
+        )
+        self.assertEqual(response.data['shift'], swap.shift_id)
+        self.assertEqual(response.data['included']['shifts'][swap.shift_id]['user'], swap.from_user_id)
+        self.assertEqual(set(response.data['included']['users']), {swap.from_user_id, swap.to_user_id})
+
+    def test_sparse_fields(self):
+        url = reverse('shift-list')
+        response = self.client.get(url, {'fields': 'start_time,user'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'start_time', 'user'})
+        self.assertEqual(response.data['results'][0]['user']['username'], 'employee0')
+        self.assertEqual(self.client.get(url, {'fields': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'format': 'normalized', 'include': 'template'}).status_code, 400)
+
+    def test_cached_per_renderer(self):
+        url = reverse('shift-list')
+        self.assertIsInstance(self.client.get(url).data['results'][0]['user'], dict)
+        response = self.client.get(url, HTTP_ACCEPT='application/vnd.schedule.normalized+json')
+        self.assertIsInstance(response.data['results'][0]['user'], int)
+
+
+class ConditionalGetTests(QueryBudgetMixin, ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        cls.employees, cls.shifts = make_schedule(users=2, shifts_per_user=2)
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+
+    def revalidate(self, budget, url, etag, **params):
+        return self.assertQueryBudget(budget, url, data=params, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_list_is_not_modified_until_a_write(self):
+        url = reverse('ptorequest-list')
+        first = self.assertQueryBudget(2, url)
+        self.assertIn('Last-Modified', first)
+        response = self.revalidate(1, url, first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], first['ETag'])
+
+        pto = PTORequest.objects.first()
+        pto.reason = 'family'
+        pto.save()
+        updated = self.revalidate(2, url, first['ETag'])
+        self.assertEqual(updated.status_code, 200)
+        self.assertNotEqual(updated['ETag'], first['ETag'])
+        pto.delete()
+        self.assertEqual(self.revalidate(2, url, updated['ETag']).status_code, 200)
+
+    def test_cached_and_filtered_lists(self):
+        url = reverse('shift-list')
+        first = self.client.get(url, {'location': 'downtown'})
+        self.assertEqual(self.revalidate(0, url, first['ETag'], location='downtown').status_code, 304)
+
+        # A write elsewhere empties the response cache but leaves the filtered list as it was.
+        Shift.objects.create(
+            start_time=self.shifts[0].start_time, end_time=self.shifts[0].end_time, role='cook', location='uptown'
+        )
+        self.assertEqual(self.revalidate(1, url, first['ETag'], location='downtown').status_code, 304)
+        self.assertEqual(self.revalidate(2, url, first['ETag']).status_code, 200)
+
+    def test_detail_and_keyset_pages(self):
+        url = reverse('shiftswap-detail', args=[ShiftSwap.objects.first().pk])
+        first = self.assertQueryBudget(1, url)
+        self.assertEqual(self.revalidate(1, url, first['ETag']).status_code, 304)
+        self.assertEqual(self.revalidate(1, url, '"other"').status_code, 200)
+        self.client.force_authenticate(self.employees[0])
+        self.assertNotEqual(self.client.get(url)['ETag'], first['ETag'])
+
+        response = self.client.get(reverse('shift-list'), {'pagination': 'cursor'})
+        self.assertNotIn('ETag', response)
+
+
+class ExportTests(ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        cls.employees, cls.shifts = make_schedule(users=2, shifts_per_user=2)
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_shift_csv_honours_filters(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('shift-export'), {'user': self.employees[1].id})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = self.content(response).splitlines()
+        self.assertEqual(
+            lines[0], 'id,user_id,user__username,start_time,end_time,role,location,template_id,occurrence_date'
+        )
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(all(',employee1,' in line for line in lines[1:]))
+
+    def test_pto_ndjson_is_scoped_to_the_employee(self):
+        self.client.force_authenticate(self.employees[0])
+        response = self.client.get(reverse('ptorequest-export'), {'format': 'ndjson', 'status': 'pending'})
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([row['user_id'] for row in rows], [self.employees[0].id])
+
+    def test_asgi_export_streams_asynchronously(self):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.admin)}'}
+        self.assertFalse(self.client.get(reverse('shift-export'), headers=headers).is_async)
+
+        async def scenario():
+            response = await self.async_client.get(reverse('shift-export'), headers=headers)
+            # A sync iterator would be buffered in full before the first byte.
+            self.assertTrue(response.is_async)
+            return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        with mock.patch('schedulingDB.export.EXPORT_CHUNK_SIZE', 2):
+            lines = async_to_sync(scenario)().splitlines()
+        self.assertEqual(len(lines), 1 + len(self.shifts))
+
+
+class AvailabilityImportTests(ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='x', role='manager')
+        cls.employee = User.objects.create_user(username='employee', password='x')
+        Availability.objects.create(user=cls.employee, date=date(2025, 11, 3), is_available=True)
+
+    def upload(self, text, **data):
+        upload = SimpleUploadedFile('availability.csv', text.encode(), content_type='text/csv')
+        return self.client.post(reverse('availability-import-csv'), {'file': upload, **data})
+
+    def test_upserts_valid_rows_and_reports_rejects(self):
+        self.client.force_authenticate(self.manager)
+        response = self.upload(
+            'username,user_id,date,is_available\n'
+            'employee,,2025-11-03,no\n'
+            ',%d,2025-11-04,yes\n'
+            'nobody,,2025-11-05,yes\n'
+            'employee,,2025-13-01,yes\n'
+            'employee,,2025-11-04,0\n' % self.employee.id
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 1))
+        self.assertEqual([reject['line'] for reject in response.data['rejected']], [4, 5])
+        self.assertEqual(
+            dict(Availability.objects.filter(user=self.employee).values_list('date', 'is_available')),
+            {date(2025, 11, 3): False, date(2025, 11, 4): False},
+        )
+
+    def test_employees_only_import_their_own_rows(self):
+        self.client.force_authenticate(self.employee)
+        response = self.upload('username,date,is_available\nmanager,2025-11-03,yes\nemployee,2025-11-06,yes\n')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['rejected'][0]['line'], 2)
+
+    def test_rejects_user_ids_postgres_cannot_store(self):
+        self.client.force_authenticate(self.manager)
+        response = self.upload(
+            'user_id,date,is_available\n'
+            '١٢,2025-11-03,yes\n'
+            '%d,2025-11-03,yes\n'
+            '-1,2025-11-03,yes\n'
+            '%d,2025-11-04,yes\n' % (2 ** 63, self.employee.id)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([reject['line'] for reject in response.data['rejected']], [2, 3, 4])
+        self.assertEqual(response.data['rejected'][1]['error'], "invalid user_id '%d'" % 2 ** 63)
+
+    def test_rejects_files_that_are_not_utf8(self):
+        self.client.force_authenticate(self.manager)
+        upload = SimpleUploadedFile(
+            'availability.csv',
+            ('username,date,is_available\nemployee,2025-11-04,yes\nJosé,2025-11-05,yes\n').encode('latin-1'),
+            content_type='text/csv',
+        )
+        response = self.client.post(reverse('availability-import-csv'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 0)
+        self.assertIn('not valid UTF-8', response.data['rejected'][0]['error'])
+        self.assertFalse(Availability.objects.filter(date=date(2025, 11, 4)).exists())
+
+    def test_management_command_dry_run(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as csv_file:
+            csv_file.write('user_id,date,is_available\n%d,2025-11-07,yes\n' % self.employee.id)
+            csv_file.flush()
+            out = io.StringIO()
+            call_command('import_availability', csv_file.name, '--dry-run', stdout=out)
+        self.assertIn('Would import 1 new', out.getvalue())
+        self.assertFalse(Availability.objects.filter(date=date(2025, 11, 7)).exists())
+
+
+class AvailabilityBitmapTests(ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='x', role='manager')
+        cls.employee = User.objects.create_user(username='employee', password='x')
+        cls.other = User.objects.create_user(username='other', password='x')
+
+    def test_month_bitmaps_follow_row_writes(self):
+        row = Availability.objects.create(user=self.employee, date=date(2025, 11, 30), is_available=False)
+        Availability.objects.create(user=self.employee, date=date(2025, 12, 1), is_available=True)
+        self.assertEqual(
+            AvailabilityMonth.objects.get(user=self.employee, month=date(2025, 11, 1)).known, 1 << 29
+        )
+        row = Availability.objects.get(pk=row.pk)
+        row.date = date(2025, 12, 2)
+        row.save()
+        self.assertFalse(AvailabilityMonth.objects.filter(month=date(2025, 11, 1)).exists())
+        month = AvailabilityMonth.objects.get(user=self.employee, month=date(2025, 12, 1))
+        self.assertEqual((month.known, month.available), (0b11, 0b01))
+
+    def test_range_encodes_days_and_scopes_employees(self):
+        Availability.objects.create(user=self.employee, date=date(2025, 11, 30), is_available=False)
+        Availability.objects.create(user=self.other, date=date(2025, 12, 2), is_available=True)
+        url = reverse('availability-date-range')
+        query = {'from': '2025-11-29', 'to': '2025-12-03'}
+
+        self.client.force_authenticate(self.manager)
+        response = self.client.get(url, query)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['users'], [
+            {'user': self.employee.id, 'days': '-N---'},
+            {'user': self.other.id, 'days': '---Y-'},
+        ])
+
+        self.client.force_authenticate(self.employee)
+        response = self.client.get(url, dict(query, user=self.other.id))
+        self.assertEqual(response.data['users'], [{'user': self.employee.id, 'days': '-N---'}])
+
+    def test_index_answers_free_on(self):
+        Availability.objects.create(user=self.employee, date=date(2025, 12, 2), is_available=False)
+        index = AvailabilityIndex.load(date(2025, 12, 1), date(2025, 12, 14))
+        days = [date(2025, 12, 1), date(2025, 12, 2)]
+        self.assertEqual(index.free_on([self.employee.id, self.other.id], days), [self.other.id])
+
+
+@mock.patch('schedulingDB.sync.OVERLAP', timedelta(0))
+class LateCommitSyncTests(APITransactionTestCase):
+    def test_rows_committed_after_the_token_are_not_missed(self):
+        manager = User.objects.create_user(username='manager', password='x', role='manager')
+        self.client.force_authenticate(manager)
+        written, token_taken = threading.Event(), threading.Event()
+
+        def slow_write():
+            try:
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        cursor.execute('SELECT now()')
+                        started = cursor.fetchone()[0]
+                    # Stamped with the transaction start, like the availability import.
+                    Shift.objects.create(
+                        start_time=started, end_time=started + timedelta(hours=8), role='cook', location='downtown',
+                    )
+                    Shift.objects.update(updated_at=started)
+                    written.set()
+                    token_taken.wait(5)
+            finally:
+                written.set()
+                connection.close()
+
+        token = self.client.get(reverse('sync')).data['token']
+        writer = threading.Thread(target=slow_write)
+        writer.start()
+        written.wait(5)
+        sleep(0.05)
+        # Taken while the write is open, well after its updated_at.
+        during = self.client.get(reverse('sync'), {'since': token}).data['token']
+        token_taken.set()
+        writer.join()
+        self.assertEqual(len(self.client.get(reverse('sync'), {'since': during}).data['changes']['shifts']), 1)
+
+
+class ConcurrentAvailabilityBitmapTests(TransactionTestCase):
+    def test_concurrent_writes_to_one_month(self):
+        employee = User.objects.create_user(username='employee', password='x')
+        first_written = threading.Event()
+        errors = []
+
+        def write(day, hold):
+            try:
+                with transaction.atomic():
+                    Availability.objects.create(user=employee, date=date(2025, 11, day))
+                    if hold:
+                        first_written.set()
+                        # The other write refreshes the same month meanwhile.
+                        sleep(0.5)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                first_written.set()
+                connection.close()
+
+        holder = threading.Thread(target=write, args=(1, True))
+        holder.start()
+        first_written.wait()
+        other = threading.Thread(target=write, args=(2, False))
+        other.start()
+        holder.join()
+        other.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(AvailabilityMonth.objects.get(user=employee, month=date(2025, 11, 1)).known, 0b11)
+
+
+class ShiftTemplateTests(ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='x', role='manager')
+        cls.cook = User.objects.create_user(username='cook', password='x', position='cook')
+        cls.template = ShiftTemplate.objects.create(
+            role='cook', location='downtown', start_time=time(9), end_time=time(17),
+            weekdays=[0], starts_on=date(2025, 9, 1),
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.manager)
+
+    def list_shifts(self):
+        return self.client.get(reverse('shift-list'), {
+            'start_time__gte': '2025-09-01T00:00:00Z', 'start_time__lt': '2025-09-15T00:00:00Z',
+        }).data
+
+    def test_export_merges_occurrences_in_the_window(self):
+        start = timezone.make_aware(datetime(2025, 9, 2, 9))
+        shift = Shift.objects.create(start_time=start, end_time=start + timedelta(hours=8), role='cook', location='downtown')
+        response = self.client.get(reverse('shift-export'), {
+            'format': 'ndjson', 'start_time__gte': '2025-09-01T00:00:00Z', 'start_time__lt': '2025-09-15T00:00:00Z',
+        })
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(row['id'], row['template_id'], row['occurrence_date']) for row in rows], [
+            (None, self.template.id, '2025-09-01'), (shift.id, None, None), (None, self.template.id, '2025-09-08'),
+        ])
+
+        response = self.client.get(reverse('shift-export'), {
+            'start_time__gte': '2025-01-01T00:00:00Z', 'start_time__lt': '2026-09-01T00:00:00Z',
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_occurrence_dates_follow_interval_and_exceptions(self):
+        template = ShiftTemplate(
+            weekdays=[0, 2], interval_weeks=2, starts_on=date(2025, 9, 2), exceptions=[date(2025, 9, 3)]
+        )
+        self.assertEqual(
+            list(occurrence_dates(template, date(2025, 8, 1), date(2025, 9, 30))),
+            [date(2025, 9, 15), date(2025, 9, 17), date(2025, 9, 29)],
+        )
+
+    def test_list_and_roster_merge_occurrences_until_materialized(self):
+        start = timezone.make_aware(datetime(2025, 9, 2, 9))
+        Shift.objects.create(start_time=start, end_time=start + timedelta(hours=8), role='cook', location='downtown')
+        data = self.list_shifts()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual([(row['id'] is None, row['template']) for row in data['results']],
+                         [(True, self.template.id), (False, None), (True, self.template.id)])
+        roster = self.client.get(reverse('roster'), {'location': 'downtown', 'week': '2025-09-08'}).data
+        self.assertEqual(roster['open_shifts'][0][0]['template'], self.template.id)
+
+        url = reverse('shifttemplate-materialize', args=[self.template.id])
+        response = self.client.post(url, {'date': '2025-09-08', 'user_id': self.cook.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.post(url, {'date': '2025-09-08'}, format='json').status_code, 200)
+        self.assertEqual(self.client.post(url, {'date': '2025-09-09'}, format='json').status_code, 400)
+        data = self.list_shifts()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['results'][2]['id'], response.data['id'])
+        roster = self.client.get(reverse('roster'), {'location': 'downtown', 'week': '2025-09-08'}).data
+        self.assertEqual(roster['employees'][0]['days'][0][0]['id'], response.data['id'])
+
+        self.client.delete(reverse('shift-detail', args=[response.data['id']]))
+        self.template.refresh_from_db()
+        self.assertEqual(self.template.exceptions, [date(2025, 9, 8)])
+        self.assertEqual(self.list_shifts()['count'], 2)
+
+    def test_assigned_occurrences_count_as_booked(self):
+        start = timezone.make_aware(datetime(2025, 9, 8, 10))
+        shift = Shift.objects.create(start_time=start, end_time=start + timedelta(hours=4), role='cook', location='uptown')
+        tuesday = Shift.objects.create(
+            user=self.cook, start_time=start + timedelta(days=1), end_time=start + timedelta(days=1, hours=4),
+            role='cook', location='uptown',
+        )
+        url = reverse('shifttemplate-detail', args=[self.template.id])
+        self.assertEqual(self.client.patch(url, {'user_id': self.cook.id}, format='json').status_code, 200)
+
+        response = self.client.post(reverse('shift-assign-user', args=[shift.id]), {'user_id': self.cook.id})
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post(reverse('shift-bulk'), [{'id': shift.id, 'user_id': self.cook.id}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(Shift.objects.get(pk=shift.id).user_id)
+
+        response = self.client.patch(url, {'weekdays': [0, 1]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        tuesday.delete()
+        PTORequest.objects.create(
+            user=self.cook, start_date=date(2025, 9, 16), end_date=date(2025, 9, 16), type='vacation', status='approved',
+        )
+        response = self.client.patch(url, {'weekdays': [0, 1]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('PTO', response.data['detail'])
+        self.template.refresh_from_db()
+        self.assertEqual(self.template.weekdays, [0])
+
+    def test_pages_only_read_the_shifts_before_their_end(self):
+        for day in range(2, 9):
+            start = timezone.make_aware(datetime(2025, 9, day, 10))
+            Shift.objects.create(start_time=start, end_time=start + timedelta(hours=1), role='cook', location='uptown')
+        params = {'start_time__gte': '2025-09-01T00:00:00Z', 'start_time__lt': '2025-09-15T00:00:00Z'}
+        everything = self.client.get(reverse('shift-list'), dict(params, page_size=100)).json()['results']
+        self.assertEqual(len(everything), 9)
+
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(reverse('shift-list'), dict(params, page=2, page_size=3)).json()
+        self.assertEqual(data['count'], 9)
+        self.assertEqual(data['results'], everything[3:6])
+        shift_reads = [query['sql'] for query in ctx.captured_queries if 'ORDER BY' in query['sql']
+                       and 'FROM "schedulingDB_shift"' in query['sql']]
+        self.assertTrue(shift_reads)
+        self.assertTrue(all('LIMIT 6' in sql for sql in shift_reads), shift_reads)
+
+        token = AccessToken.for_user(self.manager)
+        data = self.client.get(reverse('async_shift_list'), dict(params, page=2, page_size=3),
+                               HTTP_AUTHORIZATION=f'Bearer {token}').json()
+        self.assertEqual((data['count'], data['results']), (9, everything[3:6]))
+
+        params['start_time__lt'] = '2026-10-01T00:00:00Z'
+        self.assertEqual(self.client.get(reverse('shift-list'), params).status_code, 400)
+        response = self.client.get(reverse('async_shift_list'), params, HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 400)
+
+    def test_auto_assign_materializes_filled_occurrences(self):
+        url = reverse('shift-auto-assign')
+        data = {'start_date': '2025-09-01', 'end_date': '2025-09-07'}
+        response = self.client.post(url, dict(data, dry_run=True), format='json')
+        self.assertEqual(response.data['assigned'], [{'shift_id': f'template:{self.template.id}:2025-09-01', 'user_id': self.cook.id}])
+        self.assertFalse(Shift.objects.exists())
+
+        response = self.client.post(url, data, format='json')
+        shift = Shift.objects.get(template=self.template, occurrence_date=date(2025, 9, 1))
+        self.assertEqual(response.data['assigned'], [{'shift_id': shift.id, 'user_id': self.cook.id}])
+        self.assertEqual(shift.user, self.cook)
+
+
+class LaborHoursTests(ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.employees, cls.shifts = make_schedule(users=2, shifts_per_user=3)
+        cls.manager = User.objects.create_user(username='manager', password='x', role='manager')
+
+    def setUp(self):
+        self.client.force_authenticate(self.manager)
+
+    def hours(self, **params):
+        params = {'from': '2025-06-02', 'to': '2025-06-08', **params}
+        response = self.client.get(reverse('labor_hours'), params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [{key: row[key] for key in row if key != 'period'} | {'period': str(row['period'])}
+                for row in response.data['results']]
+
+    def test_hours_by_period_and_group(self):
+        self.assertEqual(self.hours(period='week'), [
+            {'location': 'downtown', 'shifts': 6, 'hours': 48.0, 'period': '2025-06-02'},
+        ])
+        by_user = self.hours(group_by='user,role', to='2025-06-02')
+        self.assertEqual([(row['user'], row['role'], row['hours']) for row in by_user],
+                         [(self.employees[0].id, 'cashier', 8.0), (self.employees[1].id, 'cashier', 8.0)])
+        week = {'from': '2025-06-02', 'to': '2025-06-08'}
+        self.assertEqual(self.client.get(reverse('labor_hours'), dict(week, group_by='day')).status_code, 400)
+        self.client.force_authenticate(self.employees[0])
+        self.assertEqual(self.client.get(reverse('labor_hours'), week).status_code, 403)
+
+    def test_rollup_follows_shift_writes_and_includes_template_occurrences(self):
+        shift = Shift.objects.get(pk=self.shifts[0].pk)
+        shift.location = 'uptown'
+        shift.end_time -= timedelta(hours=2)
+        shift.save()
+        Shift.objects.get(pk=self.shifts[1].pk).delete()
+        ShiftTemplate.objects.create(
+            role='cook', location='uptown', start_time=time(22), end_time=time(6),
+            weekdays=[6], starts_on=date(2025, 6, 1),
+        )
+        self.assertEqual(self.hours(group_by='location', period='week'), [
+            {'location': 'downtown', 'shifts': 4, 'hours': 32.0, 'period': '2025-06-02'},
+            {'location': 'uptown', 'shifts': 2, 'hours': 14.0, 'period': '2025-06-02'},
+        ])
+        # Matches a full recomputation from the shifts.
+        rollup = {(row.day, row.location, row.user_id): row.duration for row in ShiftHours.objects.all()}
+        self.assertEqual(rollup, {
+            (shift.start_time.date(), shift.location, shift.user_id): shift.end_time - shift.start_time
+            for shift in Shift.objects.all()
+        })
+
+
+class AsyncReadTests(ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='x', role='manager')
+        cls.employees, cls.shifts = make_schedule(users=2, shifts_per_user=3)
+
+    def get(self, name, as_user, *args, **params):
+        token = AccessToken.for_user(as_user)
+        return self.client.get(reverse(name, args=args), params, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_matches_the_drf_endpoints(self):
+        self.client.force_authenticate(self.manager)
+        for name, args, params in [
+            ('shift-list', (), {'user': self.employees[0].id, 'page_size': 2}),
+            ('shift-detail', (self.shifts[0].id,), {}),
+            ('availability-list', (), {'date__gte': '2025-06-03'}),
+        ]:
+            expected = self.client.get(reverse(name, args=args), params).json()
+            actual = self.get(f'async_{name.replace("-", "_")}', self.manager, *args, **params).json()
+            if 'next' in expected:
+                self.assertEqual(actual.pop('next') is None, expected.pop('next') is None)
+            self.assertEqual(actual, expected)
+        expected = self.client.get(reverse('roster'), {'location': 'downtown', 'week': '2025-06-02'}).json()
+        self.assertEqual(self.get('async_roster', self.manager, location='downtown', week='2025-06-02').json(), expected)
+
+    def test_scoping_auth_and_errors(self):
+        response = self.get('async_shift_list', self.employees[1])
+        self.assertEqual({row['user']['id'] for row in response.json()['results']}, {self.employees[1].id})
+        self.assertEqual(self.get('async_shift_detail', self.employees[1], self.shifts[0].id).status_code, 404)
+        availability = Availability.objects.filter(user=self.employees[0]).first()
+        self.assertEqual(self.get('async_availability_detail', self.manager, availability.id).status_code, 403)
+        self.assertEqual(self.get('async_shift_list', self.manager, start_time__gte='soon').status_code, 400)
+        self.assertEqual(self.client.get(reverse('async_shift_list')).status_code, 401)
+
+
+class WorkerCheckTests(TestCase):
+    def test_several_processes_need_shared_caches_and_broker(self):
+        with mock.patch.dict('os.environ', {'WEB_CONCURRENCY': '1'}):
+            self.assertEqual(check_shared_state(None), [])
+        with mock.patch.dict('os.environ', {'WEB_CONCURRENCY': '4'}):
+            self.assertEqual([error.id for error in check_shared_state(None)],
+                             ['schedulingDB.E001', 'schedulingDB.E001', 'schedulingDB.E002'])
+            shared = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://redis:6379/0'}
+            with override_settings(CACHES={'default': shared, 'responses': shared}, EVENTS_BROKER='example.Broker'):
+                self.assertEqual(check_shared_state(None), [])
+
+
+class ChangeEventTests(ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(username='manager', password='x', role='manager')
+        cls.employees, cls.shifts = make_schedule(users=2, shifts_per_user=1)
+        start = timezone.make_aware(datetime(2025, 6, 10, 9))
+        cls.open_shift = Shift.objects.create(
+            start_time=start, end_time=start + timedelta(hours=8), role='cook', location='downtown'
+        )
+
+    def write(self, user, url, data=None):
+        self.client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, data)
+
+    def test_writes_reach_affected_users_and_locations(self):
+        employee = self.employees[1]
+
+        async def scenario():
+            mine = broker().subscribe(subscription_channels(employee, []))
+            downtown = broker().subscribe(subscription_channels(self.manager, ['downtown']))
+            uptown = broker().subscribe(subscription_channels(self.manager, ['uptown']))
+            try:
+                url = reverse('shift-assign-user', args=[self.open_shift.id])
+                await sync_to_async(self.write)(self.manager, url, {'user_id': employee.id})
+                shift_event = {'type': 'shift', 'action': 'changed', 'ids': [self.open_shift.id]}
+                self.assertEqual(await asyncio.wait_for(mine.get(), 1), shift_event)
+                self.assertEqual(await asyncio.wait_for(downtown.get(), 1), shift_event)
+
+                pto = PTORequest.objects.filter(user=self.employees[0])
+                url = reverse('ptorequest-approve', args=[await pto.values_list('id', flat=True).aget()])
+                await sync_to_async(self.write)(self.manager, url)
+                self.assertTrue(mine.queue.empty())
+                self.assertTrue(uptown.queue.empty())
+            finally:
+                for subscription in (mine, downtown, uptown):
+                    subscription.close()
+
+        async_to_sync(scenario)()
+
+    @override_settings(EVENTS_QUEUE_SIZE=2)
+    def test_slow_subscribers_are_told_to_resync(self):
+        async def scenario():
+            subscription = broker().subscribe({'all'})
+            try:
+                for number in range(3):
+                    broker().publish({'all'}, {'type': 'shift', 'action': 'changed', 'ids': [number]})
+                await asyncio.sleep(0)
+                self.assertEqual(await subscription.get(), {'type': 'resync'})
+                self.assertTrue(subscription.queue.empty())
+            finally:
+                subscription.close()
+
+        async_to_sync(scenario)()
+
+    def test_event_stream(self):
+        employee = self.employees[0]
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(employee)}'}
+        self.assertEqual(self.client.get(reverse('events'), headers=headers).status_code, 501)
+
+        async def scenario():
+            response = await self.async_client.get(reverse('events'), {'location': 'downtown'}, headers=headers)
+            self.assertEqual(response.status_code, 403)
+            response = await self.async_client.get(reverse('events'), headers=headers)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            chunks = response.streaming_content
+            try:
+                self.assertTrue((await chunks.__anext__()).startswith(b'retry: '))
+                event = {'type': 'pto_request', 'action': 'changed', 'ids': [1]}
+                broker().publish({f'user:{employee.id}'}, event)
+                self.assertEqual(await chunks.__anext__(), f'event: pto_request\ndata: {json.dumps(event)}\n\n'.encode())
+            finally:
+                await chunks.aclose()
+
+        async_to_sync(scenario)()
+
+    def test_event_stream_opens_with_a_ticket_instead_of_a_header(self):
+        employee = self.employees[0]
+        access = AccessToken.for_user(employee)
+        self.assertEqual(self.client.post(reverse('events_ticket')).status_code, 401)
+        response = self.client.post(reverse('events_ticket'), headers={'Authorization': f'Bearer {access}'})
+        ticket = response.data['ticket']
+        # Tickets only open streams, and access tokens are not tickets.
+        response = self.client.get(reverse('shift-list'), headers={'Authorization': f'Bearer {ticket}'})
+        self.assertEqual(response.status_code, 401)
+
+        async def scenario():
+            response = await self.async_client.get(reverse('events'), {'ticket': str(access)})
+            self.assertEqual(response.status_code, 401)
+            response = await self.async_client.get(reverse('events'), {'ticket': ticket})
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            chunks = response.streaming_content
+            try:
+                self.assertTrue((await chunks.__anext__()).startswith(b'retry: '))
+                event = {'type': 'shift', 'action': 'changed', 'ids': [1]}
+                broker().publish({f'user:{employee.id}'}, event)
+                self.assertEqual(await chunks.__anext__(), format_event(event).encode())
+            finally:
+                await chunks.aclose()
+
+        async_to_sync(scenario)()
+        with mock.patch('rest_framework_simplejwt.tokens.aware_utcnow',
+                        return_value=timezone.now() + timedelta(seconds=settings.EVENTS_TICKET_SECONDS + 1)):
+            response = async_to_sync(self.async_client.get)(reverse('events'), {'ticket': ticket})
+        self.assertEqual(response.status_code, 401)
+
+
+class JobQueueTests(ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        cls.employee = User.objects.create_user(username='employee', email='employee@example.com', password='x')
+
+    def test_password_reset_is_queued_not_sent(self):
+        response = self.client.post(reverse('password_reset_request'), {'email': 'employee@example.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        job = Job.objects.get()
+        self.assertEqual((job.kind, job.payload['to']), ('email', ['employee@example.com']))
+
+    def test_batch_is_sent_over_one_connection(self):
+        for i in range(3):
+            enqueue_email(f'Subject {i}', 'Body', [f'user{i}@example.com'])
+        with mock.patch('schedulingDB.jobs.get_connection', wraps=get_connection) as connect:
+            self.assertEqual(run_batch(), 3)
+        connect.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(Job.objects.exclude(status='done').exists())
+
+    def test_failures_back_off_then_give_up(self):
+        job = enqueue_email('Subject', 'Body', ['user@example.com'])
+        Job.objects.filter(pk=job.pk).update(max_attempts=2)
+        with mock.patch('schedulingDB.jobs.get_connection', side_effect=OSError('relay down')):
+            run_batch()
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('pending', 1))
+            self.assertIn('relay down', job.last_error)
+            self.assertGreater(job.run_at, timezone.now())
+            self.assertEqual(run_batch(), 0)
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            run_batch()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_pto_decisions_notify_the_requester(self):
+        pto = PTORequest.objects.create(user=self.employee, start_date=date(2025, 7, 1), end_date=date(2025, 7, 2),
+                                        type='vacation')
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.post(reverse('ptorequest-approve', args=[pto.id])).status_code, 200)
+        # The test transaction must survive the per-iteration connection check.
+        with mock.patch('schedulingDB.management.commands.run_jobs.close_old_connections') as close:
+            call_command('run_jobs', '--once', stdout=io.StringIO())
+        close.assert_called()
+        self.assertEqual(mail.outbox[0].subject, 'PTO request approved')
+
+    def test_slow_batches_renew_their_lease(self):
+        for i in range(2):
+            enqueue_email(f'Subject {i}', 'Body', [f'user{i}@example.com'])
+        jobs = claim(2)
+        # Most of the lease went by before the batch got going.
+        expiring = timezone.now() + LEASE / 4
+        Job.objects.update(run_at=expiring)
+        for job in jobs:
+            job.run_at = expiring
+        send_emails(jobs)
+        self.assertTrue(all(job.run_at > expiring + LEASE / 2 for job in Job.objects.all()))
+
+    def test_finished_jobs_are_purged_after_the_retention(self):
+        old = enqueue_email('Reset', 'https://example.com/reset?token=secret', ['user@example.com'])
+        recent = enqueue_email('Subject', 'Body', ['user@example.com'])
+        pending = enqueue_email('Subject', 'Body', ['user@example.com'])
+        Job.objects.filter(pk=old.pk).update(status='done', finished_at=timezone.now() - timedelta(days=8))
+        Job.objects.filter(pk=recent.pk).update(status='failed', finished_at=timezone.now() - timedelta(days=6))
+        self.assertEqual(purge_finished(), 1)
+        self.assertEqual(set(Job.objects.values_list('pk', flat=True)), {recent.pk, pending.pk})
+
+
+class ClaimsAuthenticationTests(QueryBudgetMixin, ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.employees, cls.shifts = make_schedule(users=2, shifts_per_user=1)
+
+    def login(self, user):
+        response = self.client.post(reverse('token_obtain_pair'), {'username': user.username, 'password': 'x'})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        return AccessToken(response.data['access'])
+
+    def test_role_claim_replaces_the_user_lookup(self):
+        self.assertEqual(self.login(self.employees[0])['role'], 'employee')
+        url = reverse('shift-detail', args=[self.shifts[0].id])
+        self.assertEqual(self.assertQueryBudget(1, url).status_code, 200)
+        # Employees are still scoped to their own shifts.
+        self.assertEqual(self.client.get(reverse('shift-detail', args=[self.shifts[1].id])).status_code, 404)
+
+    def test_refresh_stamps_the_current_role(self):
+        manager = User.objects.create_user(username='manager', password='x', role='manager')
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'manager', 'password': 'x'})
+        refresh = response.data['refresh']
+        self.assertNotIn('role', RefreshToken(refresh))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        url = reverse('labor_hours')
+        params = {'from': '2025-06-02', 'to': '2025-06-08'}
+        self.assertEqual(self.client.get(url, params).status_code, 200)
+
+        manager.role = 'employee'
+        manager.save()
+        access = self.client.post(reverse('token_refresh'), {'refresh': refresh}).data['access']
+        self.assertEqual(AccessToken(access)['role'], 'employee')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get(url, params).status_code, 403)
+
+        manager.is_active = False
+        manager.save()
+        self.assertEqual(self.client.post(reverse('token_refresh'), {'refresh': refresh}).status_code, 401)
+
+    def test_full_user_is_cached_until_saved(self):
+        token = self.login(self.employees[0])
+        with self.assertNumQueries(1):
+            self.assertEqual(ClaimsUser(token).email, 'employee0@example.com')
+            self.assertEqual(ClaimsUser(token).username, 'employee0')
+        self.employees[0].email = 'new@example.com'
+        self.employees[0].save()
+        self.assertEqual(ClaimsUser(token).email, 'new@example.com')
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_SLOW_MS=1000000)
+class MetricsTests(ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.employees, cls.shifts = make_schedule(users=2, shifts_per_user=2)
+        cls.admin = User.objects.create_user(username='admin', password='x', role='admin')
+
+    def setUp(self):
+        metrics.stats.reset()
+        self.client.force_authenticate(self.admin)
+
+    def test_server_timing_and_rolling_stats(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('shift-list'))
+        queries = len(ctx)
+        self.assertIn(f'desc="{queries} queries"', response['Server-Timing'])
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;.*, ser;dur=[\d.]+$')
+        # Served from the response cache.
+        self.client.get(reverse('shift-list'))
+
+        report = self.client.get(reverse('metrics')).data
+        self.assertTrue(report['enabled'])
+        endpoint = report['endpoints']['GET shift-list']
+        self.assertEqual(endpoint['requests'], 2)
+        self.assertEqual(endpoint['queries']['p99'], queries)
+        self.assertEqual(self.client.delete(reverse('metrics')).status_code, 204)
+        self.assertEqual(list(metrics.stats.snapshot()), ['DELETE metrics'])
+
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with override_settings(METRICS_SLOW_MS=0), self.assertLogs('schedulingDB.metrics', 'WARNING') as logs:
+            self.client.get(reverse('shift-list'))
+        self.assertIn('Slow request GET shift-list', logs.output[0])
+        self.assertIn('schedulingDB_shift', logs.output[0])
+
+    def test_metrics_are_admin_only(self):
+        self.client.force_authenticate(self.employees[0])
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+
+class SeedAndBenchmarkTests(ScheduleAPITestCase):
+    def seed(self):
+        call_command('seed', '--users=6', '--days=14', '--locations=2', '--start=2025-06-02', stdout=io.StringIO())
+
+    def test_seed_generates_consistent_data(self):
+        self.seed()
+        employees = User.objects.filter(role='employee')
+        self.assertEqual(User.objects.count(), 6)
+        self.assertEqual(User.objects.filter(role='admin').count(), 1)
+        self.assertEqual(Availability.objects.count(), employees.count() * 14)
+        self.assertTrue(AvailabilityMonth.objects.exists())
+        self.assertTrue(Shift.objects.filter(user__isnull=False).exists())
+        unavailable = Availability.objects.filter(is_available=False).values_list('user_id', 'date')
+        for user_id, day in unavailable:
+            self.assertFalse(Shift.objects.filter(user_id=user_id, start_time__date=day).exists())
+        with self.assertRaises(CommandError):
+            self.seed()
+
+    def test_bench_covers_every_get_endpoint_and_flags_regressions(self):
+        self.seed()
+        with tempfile.TemporaryDirectory() as directory:
+            output = f'{directory}/bench.json'
+            call_command('bench', '--requests=1', '--warmup=0', '--week=2025-06-04', f'--output={output}', stdout=io.StringIO())
+            with open(output) as file:
+                results = json.load(file)
+            for name in ['shift-list', 'shift-detail', 'shift-conflicts', 'availability-date-range',
+                         'ptorequest-export', 'shifttemplate-list', 'roster', 'labor_hours', 'async_shift_list']:
+                self.assertEqual(results[name]['statuses'], {'200': 1}, name)
+
+            results['shift-list']['queries'] -= 1
+            with open(output, 'w') as file:
+                json.dump(results, file)
+            with self.assertRaisesMessage(CommandError, 'shift-list'):
+                call_command('bench', '--requests=1', '--warmup=0', '--cold', f'--baseline={output}', stdout=io.StringIO())
+
+
+@mock.patch('schedulingDB.sync.OVERLAP', timedelta(0))
+class SyncTests(QueryBudgetMixin, ScheduleAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.employees, cls.shifts = make_schedule(users=2, shifts_per_user=2)
+        cls.manager = User.objects.create_user(username='manager', password='x', role='manager')
+
+    def sync(self, token=None):
+        response = self.client.get(reverse('sync'), {'since': token} if token else {})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_changes_and_deletes_since_token(self):
+        self.client.force_authenticate(self.manager)
+        token = self.sync()['token']
+        self.assertEqual(self.sync(token)['changes'], {})
+
+        shift = Shift.objects.get(pk=self.shifts[0].pk)
+        shift.location = 'uptown'
+        shift.save()
+        self.client.post(reverse('shift-bulk'), [{'id': self.shifts[1].id, 'role': 'cook'}], format='json')
+        Availability.objects.filter(user=self.employees[1]).first().delete()
+        data = self.sync(token)
+        self.assertEqual([row['id'] for row in data['changes']['shifts']], [self.shifts[0].id, self.shifts[1].id])
+        self.assertEqual(data['changes']['pto_requests'], [])
+        self.assertEqual(len(data['deleted']['availabilities']), 1)
+
+        # Nothing changed since: the safe point, one probe and an empty answer.
+        response = self.assertQueryBudget(2, f"{reverse('sync')}?since={data['token']}")
+        self.assertEqual(response.data['changes'], {})
+        self.assertEqual(response.data['deleted'], {})
+
+    def test_employees_only_see_their_rows_and_drop_reassigned_shifts(self):
+        self.client.force_authenticate(self.employees[0])
+        token = self.sync()['token']
+        mine = Shift.objects.get(pk=self.shifts[0].pk)
+        mine.user = None
+        mine.save()
+        theirs = Shift.objects.get(pk=self.shifts[2].pk)
+        theirs.role = 'cook'
+        theirs.save()
+        data = self.sync(token)
+        self.assertEqual(data['changes']['shifts'], [])
+        self.assertEqual(data['deleted']['shifts'], [mine.id])
+
+        # Managers are not told to drop a shift that still exists.
+        self.client.force_authenticate(self.manager)
+        data = self.sync(token)
+        self.assertEqual({row['id'] for row in data['changes']['shifts']}, {mine.id, theirs.id})
+        self.assertEqual(data['deleted']['shifts'], [])
+
+    def test_large_changes_come_in_pages(self):
+        self.client.force_authenticate(self.manager)
+        token = self.sync()['token']
+        Shift.objects.update(updated_at=timezone.now())
+        ShiftSwap.objects.filter(pk=ShiftSwap.objects.first().pk).update(updated_at=timezone.now())
+        rows = {'shifts': [], 'shift_swaps': []}
+        pages = 0
+        with mock.patch('schedulingDB.sync.PAGE_SIZE', 3):
+            while True:
+                data = self.sync(token)
+                pages += 1
+                for name in rows:
+                    rows[name] += [row['id'] for row in data['changes'][name]]
+                token = data['token']
+                if not data['more']:
+                    break
+        self.assertEqual(pages, 2)
+        self.assertEqual(sorted(rows['shifts']), sorted(shift.id for shift in self.shifts))
+        self.assertEqual(len(rows['shift_swaps']), 1)
+        self.assertEqual(self.sync(token)['changes'], {})
+        self.assertEqual(self.client.get(reverse('sync'), {'since': f'{token}.1.nope..'}).status_code, 400)
+
+    def test_invalid_and_expired_tokens(self):
+        self.client.force_authenticate(self.manager)
+        self.assertEqual(self.client.get(reverse('sync'), {'since': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('sync'), {'since': '1000'}).status_code, 410)
+        Tombstone.objects.create(model='shifts', object_id=1)
+        Tombstone.objects.update(created_at=timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_DAYS + 1))
+        call_command('purge_tombstones', stdout=io.StringIO())
+        self.assertFalse(Tombstone.objects.exists())
@@ -5,25 +5,47 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
     TokenVerifyView,
 )
+from . import async_views
 from .views import (
     UserViewSet, 
     ShiftViewSet, 
+    ShiftTemplateViewSet,
     AvailabilityViewSet, 
     PTORequestViewSet, 
     ShiftSwapViewSet,
     PasswordResetRequestView,
-    PasswordResetConfirmView
+    PasswordResetConfirmView,
+    RosterView,
+    LaborHoursView,
+    SyncView,
+    EventTicketView,
+    ResponseCacheStatsView,
+    MetricsView,
 )
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
 router.register(r'shifts', ShiftViewSet)
+router.register(r'shift-templates', ShiftTemplateViewSet)
 router.register(r'availabilities', AvailabilityViewSet)
 router.register(r'pto-requests', PTORequestViewSet)
 router.register(r'shift-swaps', ShiftSwapViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('roster/', RosterView.as_view(), name='roster'),
+    path('analytics/hours/', LaborHoursView.as_view(), name='labor_hours'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('_cache/', ResponseCacheStatsView.as_view(), name='response_cache_stats'),
+    path('_metrics/', MetricsView.as_view(), name='metrics'),
+    # Async read-only twins of the busiest endpoints; see async_views.
+    path('async/shifts/', async_views.shift_list, name='async_shift_list'),
+    path('async/shifts/<int:pk>/', async_views.shift_detail, name='async_shift_detail'),
+    path('async/availabilities/', async_views.availability_list, name='async_availability_list'),
+    path('async/availabilities/<int:pk>/', async_views.availability_detail, name='async_availability_detail'),
+    path('async/roster/', async_views.roster, name='async_roster'),
+    path('events/', async_views.events, name='events'),
+    path('events/ticket/', EventTicketView.as_view(), name='events_ticket'),
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('token/verify/', TokenVerifyView.as_view(), name='token_verify'),
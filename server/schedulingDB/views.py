@@ -2,18 +2,48 @@ from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.core.mail import send_mail
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.parsers import MultiPartParser
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
 from django.utils import timezone
+from django.db import transaction
+from django.db.models import Q
+from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
+from collections import defaultdict
+import io
 from datetime import datetime, timedelta
 import secrets
-from .models import User, Shift, Availability, PTORequest, ShiftSwap, PasswordResetToken
+from .models import User, Shift, ShiftTemplate, Availability, PTORequest, ShiftSwap, PasswordResetToken
 from .serializers import (
     UserSerializer, ShiftSerializer, AvailabilitySerializer, 
-    PTORequestSerializer, ShiftSwapSerializer,
+    PTORequestSerializer, ShiftSwapSerializer, ShiftBulkItemSerializer, AutoAssignSerializer,
+    RosterQuerySerializer, PTODecisionSerializer, PTOBatchSerializer, SwapSettleSerializer, SwapCandidatesQuerySerializer, AvailabilityRangeQuerySerializer, LaborHoursQuerySerializer, ShiftTemplateSerializer, MaterializeSerializer,
     PasswordResetRequestSerializer, PasswordResetConfirmSerializer
 )
+from .filters import ShiftFilter, AvailabilityFilter, PTORequestFilter
+from .pagination import SchedulePagination
+from .analytics import labor_hours
+from .assignment import auto_assign
+from .candidates import swap_candidates
+from .pto import decide
+from .swaps import settle as settle_swaps
+from .conflicts import check_occurrences, check_pto, check_template, find_conflicts, overlap_as_conflict
+from .roster import get_roster, week_of
+from .templates import (
+    MAX_EXPANDED_DAYS, MergedShifts, assigned_occurrences, expand, filter_occurrences, filtered_templates, materialize,
+    merge_occurrences, occurrence,
+)
+from .signals import shifts_bulk_changed
+from .sync import TokenExpired, changes_since, decode_token, touch
+from . import metrics, notifications
+from .authentication import stream_ticket_for
+from .availability_import import import_availability
+from .availability_bitmap import AvailabilityIndex
+from .export import CSVRenderer, NDJSONRenderer, stream_export
+from .normalized import NormalizedResponseMixin
+from .response_cache import CachedResponseMixin, ConditionalGetMixin, stats as response_cache_stats
 
 class IsAdminOrReadOnly(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -25,33 +55,242 @@ class IsOwnerOrAdmin(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.user.role == 'admin':
             return True
-        return obj.user == request.user
+        return obj.user_id == request.user.id
+
+class IsAdmin(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.user.role == 'admin'
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(CachedResponseMixin, NormalizedResponseMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    cache_models = (User,)
+    etag_models = (User,)
     permission_classes = [permissions.IsAuthenticated, IsAdminOrReadOnly]
     filter_backends = [filters.SearchFilter]
+    pagination_class = SchedulePagination
+    cursor_ordering = ('id',)
     search_fields = ['username', 'email']
 
-class ShiftViewSet(viewsets.ModelViewSet):
-    queryset = Shift.objects.all()
+class ShiftViewSet(CachedResponseMixin, NormalizedResponseMixin, viewsets.ModelViewSet):
+    queryset = Shift.objects.select_related('user')
     serializer_class = ShiftSerializer
+    cache_models = (Shift, ShiftTemplate, User)
+    etag_models = (ShiftTemplate, User)
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    filterset_fields = ['user', 'role', 'location']
+    filterset_class = ShiftFilter
+    pagination_class = SchedulePagination
+    cursor_ordering = ('start_time', 'id')
     search_fields = ['role', 'location']
+    bulk_max_rows = 5000
+    bulk_batch_size = 500
 
     def get_queryset(self):
-        queryset = Shift.objects.all()
+        queryset = super().get_queryset()
         if self.request.user.role == 'employee':
-            return queryset.filter(user=self.request.user)
+            return queryset.filter(user_id=self.request.user.id)
         return queryset
 
     def perform_create(self, serializer):
         if self.request.user.role not in ['admin', 'manager']:
-            raise permissions.PermissionDenied("Only admins and managers can create shifts")
-        serializer.save()
+            raise PermissionDenied("Only admins and managers can create shifts")
+        self.save_without_conflicts(serializer)
+
+    def perform_update(self, serializer):
+        self.save_without_conflicts(serializer)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            if instance.template_id is not None:
+                # Keep the deleted occurrence from being expanded again.
+                template = ShiftTemplate.objects.select_for_update().get(pk=instance.template_id)
+                template.exceptions.append(instance.occurrence_date)
+                template.save(update_fields=['exceptions'])
+            instance.delete()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: self.list_with_occurrences(request))
+
+    def list_with_occurrences(self, request):
+        """List shifts, merging in template occurrences when the query has a time window.
+
+        Occurrences are expanded for ``start_time__gte``..``start_time__lt``
+        (at most ``MAX_EXPANDED_DAYS`` long) and filtered like shifts; they
+        have no ``id``. A page only reads the shift rows up to its end.
+        Keyset pages (``?pagination=cursor``) only contain real shifts.
+        """
+        if request.query_params.get(SchedulePagination.mode_query_param) == 'cursor':
+            return super(ConditionalGetMixin, self).list(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        occurrences = self.requested_occurrences(request, queryset)
+        if not occurrences:
+            return super(ConditionalGetMixin, self).list(request)
+
+        shifts = MergedShifts(queryset.order_by(*self.cursor_ordering), occurrences)
+        page = self.paginate_queryset(shifts)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(merge_occurrences(shifts.shifts, occurrences), many=True).data)
+
+    def requested_occurrences(self, request, queryset):
+        """Template occurrences in the query's ``start_time__gte``..``start_time__lt`` window, filtered like shifts.
+
+        Empty when the query has no such window; a window longer than
+        ``MAX_EXPANDED_DAYS`` is a 400.
+        """
+        filterset = self.filterset_class(request.query_params, queryset=queryset, request=request)
+        filterset.is_valid()
+        params = filterset.form.cleaned_data
+        start, end = params.get('start_time__gte'), params.get('start_time__lt')
+        if start is None or end is None:
+            return []
+        if end - start > timedelta(days=MAX_EXPANDED_DAYS):
+            raise ValidationError({'start_time__lt': [f'At most {MAX_EXPANDED_DAYS} days after start_time__gte']})
+        templates = filtered_templates(params, request.user.id if request.user.role == 'employee' else None)
+        templates = filters.SearchFilter().filter_queryset(request, templates, self)
+        return filter_occurrences(expand(templates, start, end), params)
+
+    def save_without_conflicts(self, serializer):
+        data, instance = serializer.validated_data, serializer.instance
+        user = data.get('user', getattr(instance, 'user', None))
+        start_time = data.get('start_time', getattr(instance, 'start_time', None))
+        end_time = data.get('end_time', getattr(instance, 'end_time', None))
+        check_pto(user and user.id, start_time, end_time)
+        check_occurrences(user and user.id, start_time, end_time)
+        with overlap_as_conflict(), transaction.atomic():
+            serializer.save()
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Create and update many shifts in one transaction.
+
+        Takes a list of shift rows; rows with an ``id`` update that shift,
+        the rest are created. Each ``id`` may appear once. Nothing is
+        written unless every row is valid, and rows that change nothing
+        are not written at all.
+        """
+        if request.user.role not in ['admin', 'manager']:
+            return Response({'error': 'Only admins and managers can create shifts'},
+                          status=status.HTTP_403_FORBIDDEN)
+        rows = request.data
+        if not isinstance(rows, list) or not rows:
+            return Response({'error': 'Expected a non-empty list of shifts'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > self.bulk_max_rows:
+            return Response({'error': f'At most {self.bulk_max_rows} shifts per request'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        errors = {}
+        items = []
+        seen_ids = set()
+        for index, row in enumerate(rows):
+            partial = isinstance(row, dict) and 'id' in row
+            serializer = ShiftBulkItemSerializer(data=row, partial=partial)
+            if not serializer.is_valid():
+                errors[index] = serializer.errors
+            elif serializer.validated_data.get('id') in seen_ids:
+                # bulk_update would apply only one of the rows.
+                errors[index] = {'id': ['Each shift can only be updated once per request']}
+            else:
+                if 'id' in serializer.validated_data:
+                    seen_ids.add(serializer.validated_data['id'])
+                items.append((index, serializer.validated_data))
+
+        user_ids = {data['user_id'] for _, data in items if data.get('user_id') is not None}
+        shift_ids = [data['id'] for _, data in items if 'id' in data]
+        with overlap_as_conflict(), transaction.atomic():
+            users = User.objects.in_bulk(user_ids)
+            existing = Shift.objects.select_for_update().in_bulk(shift_ids)
+            pto = defaultdict(list)
+            for user_id, start_date, end_date in PTORequest.objects.filter(
+                status='approved', user_id__in=user_ids | {shift.user_id for shift in existing.values()}
+            ).values_list('user_id', 'start_date', 'end_date'):
+                pto[user_id].append((start_date, end_date))
+
+            to_create, to_update, changed, update_fields, assigned = [], [], [], set(), []
+            for index, data in items:
+                data = dict(data)
+                if data.get('user_id') is not None and data['user_id'] not in users:
+                    errors[index] = {'user_id': ['User not found']}
+                    continue
+                shift_id = data.pop('id', None)
+                if shift_id is None:
+                    shift = Shift(**data)
+                else:
+                    shift = existing.get(shift_id)
+                    if shift is None:
+                        errors[index] = {'id': ['Shift not found']}
+                        continue
+                    data = {field: value for field, value in data.items() if getattr(shift, field) != value}
+                    for field, value in data.items():
+                        setattr(shift, field, value)
+                    if shift.end_time <= shift.start_time:
+                        errors[index] = {'non_field_errors': ['end_time must be after start_time']}
+                        continue
+                first_day = timezone.localdate(shift.start_time)
+                last_day = timezone.localdate(shift.end_time - timedelta(microseconds=1))
+                if any(start <= last_day and end >= first_day for start, end in pto.get(shift.user_id, ())):
+                    errors[index] = {'user_id': ['The employee has approved PTO during this shift']}
+                    continue
+                if shift.user_id is not None:
+                    assigned.append((index, shift))
+                if shift_id is None:
+                    to_create.append(shift)
+                else:
+                    to_update.append(shift)
+                    if data:
+                        update_fields.update(data)
+                        changed.append(shift)
+
+            if assigned:
+                busy = assigned_occurrences(
+                    {shift.user_id for _, shift in assigned},
+                    min(shift.start_time for _, shift in assigned), max(shift.end_time for _, shift in assigned),
+                )
+                for index, shift in assigned:
+                    if any(other.start_time < shift.end_time and other.end_time > shift.start_time
+                           for other in busy[shift.user_id]):
+                        errors[index] = {'user_id': ['The employee has a recurring shift overlapping this one']}
+
+            if errors:
+                transaction.set_rollback(True)
+                return Response(
+                    {'errors': [{'index': index, 'errors': errors[index]} for index in sorted(errors)]},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            created = Shift.objects.bulk_create(to_create, batch_size=self.bulk_batch_size)
+            if changed:
+                touch(changed)
+                Shift.objects.bulk_update(
+                    changed, sorted(update_fields) + ['updated_at'], batch_size=self.bulk_batch_size
+                )
+            if created or changed:
+                shifts_bulk_changed.send(sender=Shift, shifts=created + changed)
+
+        return Response({
+            'created': [shift.id for shift in created],
+            'updated': [shift.id for shift in to_update],
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'])
+    def auto_assign(self, request):
+        """Fill the open shifts in a date range, balancing hours across employees."""
+        if request.user.role not in ['admin', 'manager']:
+            return Response({'error': 'Only admins and managers can assign shifts'},
+                          status=status.HTTP_403_FORBIDDEN)
+        serializer = AutoAssignSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        with overlap_as_conflict():
+            assignments, unfilled = auto_assign(
+                params['start_date'], params['end_date'],
+                location=params.get('location'), commit=not params['dry_run'],
+            )
+        return Response({
+            'assigned': [{'shift_id': shift_id, 'user_id': user_id} for shift_id, user_id in assignments.items()],
+            'unfilled': unfilled,
+            'dry_run': params['dry_run'],
+        })
 
     @action(detail=True, methods=['post'])
     def assign_user(self, request, pk=None):
@@ -63,48 +302,208 @@ class ShiftViewSet(viewsets.ModelViewSet):
         
         try:
             user = User.objects.get(id=user_id)
-            shift.user = user
-            shift.save()
+            check_pto(user.id, shift.start_time, shift.end_time)
+            check_occurrences(user.id, shift.start_time, shift.end_time)
+            with overlap_as_conflict(), transaction.atomic():
+                # Locked, so a swap being settled meanwhile sees the new assignee.
+                shift = Shift.objects.select_for_update().get(pk=shift.pk)
+                shift.user = user
+                shift.save()
             return Response(ShiftSerializer(shift).data)
         except User.DoesNotExist:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
-class AvailabilityViewSet(viewsets.ModelViewSet):
-    queryset = Availability.objects.all()
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        """Stream every matching shift as CSV (default) or NDJSON (``?format=ndjson``).
+
+        With a ``start_time__gte``..``start_time__lt`` window the template
+        occurrences in it are merged in by start time, as in the list, with
+        an empty ``id``.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        occurrences = [
+            {
+                'id': None, 'user_id': shift.user_id, 'user__username': shift.user.username if shift.user_id else None,
+                'start_time': shift.start_time, 'end_time': shift.end_time, 'role': shift.role,
+                'location': shift.location, 'template_id': shift.template_id, 'occurrence_date': shift.occurrence_date,
+            }
+            for shift in self.requested_occurrences(request, queryset)
+        ]
+        fields = [
+            'id', 'user_id', 'user__username', 'start_time', 'end_time', 'role', 'location',
+            'template_id', 'occurrence_date',
+        ]
+        return stream_export(
+            request, queryset.order_by(*self.cursor_ordering), fields, request.accepted_renderer, 'shifts',
+            extra=occurrences, key=lambda row: (row['start_time'], row['id'] or 0),
+        )
+
+    @action(detail=False, methods=['get'])
+    def conflicts(self, request):
+        """List double-booked employees among the (filtered) shifts.
+
+        Narrow the window with the usual filters, e.g.
+        ``?start_time__gte=...&start_time__lt=...&location=...``.
+        """
+        overlaps, pto = find_conflicts(self.filter_queryset(self.get_queryset()))
+        return Response({'overlaps': overlaps, 'pto': pto})
+
+class ShiftTemplateViewSet(CachedResponseMixin, NormalizedResponseMixin, viewsets.ModelViewSet):
+    queryset = ShiftTemplate.objects.select_related('user')
+    serializer_class = ShiftTemplateSerializer
+    cache_models = (ShiftTemplate, User)
+    etag_models = (ShiftTemplate, User)
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['user', 'role', 'location']
+    pagination_class = SchedulePagination
+    cursor_ordering = ('id',)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.user.role == 'employee':
+            return queryset.filter(user_id=self.request.user.id)
+        return queryset
+
+    def check_manager(self):
+        if self.request.user.role not in ['admin', 'manager']:
+            raise PermissionDenied("Only admins and managers can manage shift templates")
+
+    def perform_create(self, serializer):
+        self.check_manager()
+        self.save_without_conflicts(serializer)
+
+    def perform_update(self, serializer):
+        self.check_manager()
+        self.save_without_conflicts(serializer)
+
+    def save_without_conflicts(self, serializer):
+        # Checked after saving, so the occurrences come from the new values; a conflict rolls the save back.
+        with transaction.atomic():
+            check_template(serializer.save())
+
+    def perform_destroy(self, instance):
+        self.check_manager()
+        instance.delete()
+
+    @action(detail=True, methods=['post'])
+    def materialize(self, request, pk=None):
+        """Turn the occurrence on ``date`` into a real shift, assigned to ``user_id`` if given.
+
+        An occurrence that already has a shift returns it unchanged; assign
+        that one through the shift endpoints instead.
+        """
+        self.check_manager()
+        template = self.get_object()
+        serializer = MaterializeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        day, changes = serializer.validated_data['date'], {}
+        if 'user' in serializer.validated_data:
+            user = changes['user'] = serializer.validated_data['user']
+            shift = occurrence(template, day)
+            check_pto(user.id, shift.start_time, shift.end_time)
+            check_occurrences(user.id, shift.start_time, shift.end_time, exclude=(template.id, day))
+        try:
+            with overlap_as_conflict():
+                shift, created = materialize(template, day, **changes)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ShiftSerializer(shift).data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+class AvailabilityViewSet(CachedResponseMixin, NormalizedResponseMixin, viewsets.ModelViewSet):
+    queryset = Availability.objects.select_related('user')
     serializer_class = AvailabilitySerializer
+    cache_models = (Availability, User)
+    etag_models = (User,)
+    cache_per_user_roles = ('employee', 'manager')
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrAdmin]
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['user', 'date', 'is_available']
+    filterset_class = AvailabilityFilter
+    pagination_class = SchedulePagination
+    cursor_ordering = ('date', 'id')
 
     def get_queryset(self):
-        queryset = Availability.objects.all()
+        queryset = super().get_queryset()
         if self.request.user.role == 'employee':
-            return queryset.filter(user=self.request.user)
+            return queryset.filter(user_id=self.request.user.id)
         return queryset
 
-class PTORequestViewSet(viewsets.ModelViewSet):
-    queryset = PTORequest.objects.all()
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_csv(self, request):
+        """Upsert availability from an uploaded CSV ``file``; see availability_import."""
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+        only_user_id = request.user.id if request.user.role == 'employee' else None
+        dry_run = request.data.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        result = import_availability(
+            io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''),
+            only_user_id=only_user_id, dry_run=dry_run,
+        )
+        return Response(dict(result.as_dict(), dry_run=dry_run))
+
+    @action(detail=False, methods=['get'], url_path='range')
+    def date_range(self, request):
+        """Availability per user over ``from``..``to`` as one character per day.
+
+        'Y' is available, 'N' unavailable and '-' no entry. Read from the
+        month bitmaps rather than the daily rows.
+        """
+        query = AvailabilityRangeQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        first, last = query.validated_data['from'], query.validated_data['to']
+        user_ids = query.validated_data.get('user') or None
+        if request.user.role == 'employee':
+            user_ids = [request.user.id]
+        index = AvailabilityIndex.load(first, last, user_ids=user_ids)
+        return Response({
+            'from': first,
+            'to': last,
+            'users': [
+                {'user': user_id, 'days': index.encode(user_id)}
+                for user_id in (user_ids or index.user_ids())
+            ],
+        })
+
+
+class PTORequestViewSet(ConditionalGetMixin, NormalizedResponseMixin, viewsets.ModelViewSet):
+    queryset = PTORequest.objects.select_related('user')
     serializer_class = PTORequestSerializer
+    etag_models = (User,)
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrAdmin]
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['user', 'status', 'type']
+    filterset_class = PTORequestFilter
+    pagination_class = SchedulePagination
+    cursor_ordering = ('start_date', 'id')
 
     def get_queryset(self):
-        queryset = PTORequest.objects.all()
+        queryset = super().get_queryset()
         if self.request.user.role == 'employee':
-            return queryset.filter(user=self.request.user)
+            return queryset.filter(user_id=self.request.user.id)
         return queryset
 
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        """Stream every matching PTO request as CSV (default) or NDJSON (``?format=ndjson``)."""
+        queryset = self.filter_queryset(self.get_queryset()).order_by(*self.cursor_ordering)
+        fields = ['id', 'user_id', 'user__username', 'start_date', 'end_date', 'type', 'status', 'reason']
+        return stream_export(request, queryset, fields, request.accepted_renderer, 'pto-requests')
+
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
+        """Approve the request, releasing the employee's shifts inside it (``release``: unassign or swap)."""
         if request.user.role not in ['admin', 'manager']:
             return Response({'error': 'Only admins and managers can approve PTO requests'}, 
                           status=status.HTTP_403_FORBIDDEN)
         
         pto_request = self.get_object()
-        pto_request.status = 'approved'
-        pto_request.save()
-        return Response(PTORequestSerializer(pto_request).data)
+        options = PTODecisionSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
+        result = decide(PTORequest.objects.filter(pk=pto_request.pk), 'approved', options.validated_data['release'])
+        return Response(dict(
+            PTORequestSerializer(result.pto_requests[0]).data, released_shifts=result.released_shifts()
+        ))
 
     @action(detail=True, methods=['post'])
     def reject(self, request, pk=None):
@@ -113,51 +512,185 @@ class PTORequestViewSet(viewsets.ModelViewSet):
                           status=status.HTTP_403_FORBIDDEN)
         
         pto_request = self.get_object()
-        pto_request.status = 'rejected'
-        pto_request.save()
-        return Response(PTORequestSerializer(pto_request).data)
+        result = decide(PTORequest.objects.filter(pk=pto_request.pk), 'rejected')
+        return Response(PTORequestSerializer(result.pto_requests[0]).data)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Approve or reject many requests at once: ``{"ids": [...], "action": "approve", "release": "unassign"}``."""
+        if request.user.role not in ['admin', 'manager']:
+            return Response({'error': 'Only admins and managers can decide PTO requests'},
+                          status=status.HTTP_403_FORBIDDEN)
+        serializer = PTOBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        ids = set(params['ids'])
+        status_value = 'approved' if params['action'] == 'approve' else 'rejected'
+        result = decide(PTORequest.objects.filter(pk__in=ids), status_value, params['release'])
+        return Response(dict(
+            result.as_dict(),
+            not_found=sorted(ids - {pto_request.id for pto_request in result.pto_requests}),
+        ))
 
-class ShiftSwapViewSet(viewsets.ModelViewSet):
-    queryset = ShiftSwap.objects.all()
+class ShiftSwapViewSet(ConditionalGetMixin, NormalizedResponseMixin, viewsets.ModelViewSet):
+    queryset = ShiftSwap.objects.select_related('shift__user', 'from_user', 'to_user')
     serializer_class = ShiftSwapSerializer
+    etag_models = (Shift, User)
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['from_user', 'to_user', 'status']
+    pagination_class = SchedulePagination
+    cursor_ordering = ('id',)
 
     def get_queryset(self):
-        queryset = ShiftSwap.objects.all()
+        queryset = super().get_queryset()
         if self.request.user.role == 'employee':
-            return queryset.filter(from_user=self.request.user) | queryset.filter(to_user=self.request.user)
+            return queryset.filter(Q(from_user_id=self.request.user.id) | Q(to_user_id=self.request.user.id))
         return queryset
 
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            swap = serializer.save()
+            notifications.swap_requested(swap)
+
+    @action(detail=False, methods=['get'])
+    def candidates(self, request):
+        """Employees who could take ``shift_id``, best first; see candidates.py."""
+        query = SwapCandidatesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        shift = get_object_or_404(Shift, pk=query.validated_data['shift_id'])
+        if request.user.role == 'employee' and shift.user_id != request.user.id:
+            return Response({'error': 'You can only look for candidates for your own shifts'},
+                          status=status.HTTP_403_FORBIDDEN)
+        return Response({
+            'shift_id': shift.id,
+            'candidates': swap_candidates(shift, limit=query.validated_data['limit']),
+        })
+
+    def settle_one(self, swap_request, swap_action):
+        """Settle one swap under row locks (see swaps.py); a decision that no longer holds is a 409."""
+        result = settle_swaps([(swap_request.id, swap_action, None)])
+        if result.errors:
+            return Response({'error': result.errors[0][1]}, status=status.HTTP_409_CONFLICT)
+        return Response(ShiftSwapSerializer(self.get_object()).data)
+
     @action(detail=True, methods=['post'])
     def accept(self, request, pk=None):
         swap_request = self.get_object()
-        if swap_request.to_user != request.user:
+        if swap_request.to_user_id != request.user.id:
             return Response({'error': 'You can only accept swap requests assigned to you'}, 
                           status=status.HTTP_403_FORBIDDEN)
-        
-        swap_request.status = 'approved'
-        swap_request.save()
-        
-        # Update the shift assignment
-        shift = swap_request.shift
-        shift.user = swap_request.to_user
-        shift.save()
-        
-        return Response(ShiftSwapSerializer(swap_request).data)
+        return self.settle_one(swap_request, 'approve')
 
     @action(detail=True, methods=['post'])
     def reject(self, request, pk=None):
         swap_request = self.get_object()
-        if swap_request.to_user != request.user:
+        if swap_request.to_user_id != request.user.id:
             return Response({'error': 'You can only reject swap requests assigned to you'}, 
                           status=status.HTTP_403_FORBIDDEN)
-        
-        swap_request.status = 'rejected'
-        swap_request.save()
-        return Response(ShiftSwapSerializer(swap_request).data)
+        return self.settle_one(swap_request, 'reject')
+
+    @action(detail=False, methods=['post'])
+    def settle(self, request):
+        """Approve or reject many pending swaps at once.
+
+        ``{"decisions": [{"id": 1, "action": "approve", "to_user": 7}, {"id": 2, "action": "reject"}]}``;
+        ``to_user`` is optional. Decisions that no longer hold are listed in
+        ``errors`` and the rest are applied.
+        """
+        if request.user.role not in ['admin', 'manager']:
+            return Response({'error': 'Only admins and managers can settle swap requests'},
+                          status=status.HTTP_403_FORBIDDEN)
+        serializer = SwapSettleSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = settle_swaps(
+            (decision['id'], decision['action'], decision.get('to_user'))
+            for decision in serializer.validated_data['decisions']
+        )
+        return Response(result.as_dict())
     
+class RosterView(APIView):
+    """Weekly roster grid for one location: ``?location=<name>&week=<any date in the week>``."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        serializer = RosterQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        roster = get_roster(params['location'], week_of(params.get('week') or timezone.localdate()))
+        if request.user.role == 'employee':
+            roster = dict(roster, employees=[row for row in roster['employees'] if row['id'] == request.user.id])
+        return Response(roster)
+
+class LaborHoursView(APIView):
+    """Scheduled shifts and hours over ``from``..``to``, by day or week.
+
+    ``?group_by=`` takes any of user, location and role, comma-separated;
+    ``location``, ``role`` and ``user`` narrow the shifts counted.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        if request.user.role not in ['admin', 'manager']:
+            return Response({'error': 'Only admins and managers can view labor analytics'},
+                          status=status.HTTP_403_FORBIDDEN)
+        query = LaborHoursQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        results = labor_hours(
+            params['from'], params['to'], group_by=params['group_by'], period=params['period'],
+            location=params.get('location'), role=params.get('role'), user_id=params.get('user'),
+        )
+        return Response({
+            'from': params['from'],
+            'to': params['to'],
+            'period': params['period'],
+            'group_by': params['group_by'],
+            'results': results,
+        })
+
+class EventTicketView(APIView):
+    """A stream ticket for ``GET /api/events/?ticket=``, which a browser EventSource can open without headers."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        return Response({
+            'ticket': stream_ticket_for(request.user),
+            'expires_in': settings.EVENTS_TICKET_SECONDS,
+        })
+
+class SyncView(APIView):
+    """Rows changed and deleted since ``?since=<token>``, plus the next token; see sync.py."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        token = request.query_params.get('since')
+        try:
+            since = decode_token(token) if token else None
+        except (ValueError, OverflowError):
+            return Response({'error': 'Invalid sync token'}, status=status.HTTP_400_BAD_REQUEST)
+        except TokenExpired:
+            return Response({'error': 'Sync token expired; reload the lists and sync from a new token'},
+                          status=status.HTTP_410_GONE)
+        return Response(changes_since(request.user, since))
+
+class ResponseCacheStatsView(APIView):
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        return Response(response_cache_stats.snapshot())
+
+class MetricsView(APIView):
+    """Rolling per-endpoint latency and SQL percentiles of this process; DELETE resets them."""
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        return Response({'enabled': settings.METRICS_ENABLED, 'endpoints': metrics.stats.snapshot()})
+
+    def delete(self, request):
+        metrics.stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 class PasswordResetRequestView(APIView):
     permission_classes = [permissions.AllowAny]
     
@@ -182,17 +715,9 @@ class PasswordResetRequestView(APIView):
                 expires_at=expires_at
             )
             
-            # Send email with reset link
+            # Queue the email with the reset link; run_jobs sends it
             reset_url = f"http://localhost:3000/reset-password?token={token}"
-            send_mail(
-                'Password Reset Request',
-                f'Click the following link to reset your password: {reset_url}\n\n'
-                f'This link will expire in 24 hours.\n\n'
-                f'If you did not request this password reset, please ignore this email.',
-                'noreply@yourdomain.com',
-                [email],
-                fail_silently=False,
-            )
+            notifications.password_reset(user, reset_url)
             
             return Response(
                 {"message": "Password reset instructions have been sent to your email."},